@@ -0,0 +1,200 @@
+import gzip
+import mimetypes
+import os
+import re
+import threading
+from collections import namedtuple
+from hashlib import blake2b
+
+from fastapi.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # optional: without it assets are precompressed with gzip only
+    brotli = None
+
+# Seconds between scans of the frontend directory for changed, new or
+# removed files; 0 only loads them once
+ASSET_CHECK_INTERVAL = float(os.environ.get("LINKFLOW_ASSET_CHECK_INTERVAL", 2))
+# max-age for assets without a fingerprint in their name; 0 makes browsers
+# revalidate every time, which costs a 304 thanks to the ETag
+ASSET_MAX_AGE = int(os.environ.get("LINKFLOW_ASSET_MAX_AGE", 0))
+# Larger files are not kept in memory and are streamed from disk instead
+ASSET_MAX_SIZE = int(os.environ.get("LINKFLOW_ASSET_MAX_SIZE", 5 * 1024 * 1024))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# app.3f9a1c2e.js, app-3f9a1c2e.css: the name changes whenever the content does
+FINGERPRINT_PATTERN = re.compile(r"[.-][0-9a-fA-F]{8,}\.[^/]+$")
+
+_COMPRESSIBLE_TYPES = {
+    "application/javascript", "application/json", "application/manifest+json",
+    "application/xml", "image/svg+xml", "application/wasm",
+}
+_MIN_COMPRESS_SIZE = 256
+
+# variants: {content-coding: (body, etag)}, None for files served from disk
+Asset = namedtuple("Asset", ["path", "media_type", "cache_control", "variants", "mtime_ns", "size"])
+
+
+def _compressible(media_type):
+    return media_type.startswith("text/") or media_type in _COMPRESSIBLE_TYPES
+
+
+def _variants(body, media_type):
+    digest = blake2b(body, digest_size=12).hexdigest()
+    variants = {"identity": (body, f'"{digest}"')}
+    if len(body) >= _MIN_COMPRESS_SIZE and _compressible(media_type):
+        # Every encoding of the same content gets its own strong ETag
+        compressed = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed["br"] = brotli.compress(body, quality=11)
+        for coding, data in compressed.items():
+            if len(data) < len(body):
+                variants[coding] = (data, f'"{digest}-{coding}"')
+    return variants
+
+
+def _cache_control(name):
+    if FINGERPRINT_PATTERN.search(name):
+        return IMMUTABLE_CACHE_CONTROL
+    return f"public, max-age={ASSET_MAX_AGE}" if ASSET_MAX_AGE > 0 else "no-cache"
+
+
+def build_asset(name, body, path=None, mtime_ns=0):
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return Asset(path, media_type, _cache_control(name), _variants(body, media_type), mtime_ns, len(body))
+
+
+class AssetStore:
+    """Files under `directory`, precompressed and held in memory.
+
+    refresh() rescans the directory and reloads only the files whose mtime or
+    size changed; lookups never touch the disk. Nothing is served before the
+    first refresh(), which also builds the `fallbacks`: a name -> HTML map
+    served by page() while that file doesn't exist.
+    """
+
+    def __init__(self, directory, fallbacks=None, max_size=ASSET_MAX_SIZE):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        self._assets = {}
+        self._fallback_pages = fallbacks or {}
+        self._fallbacks = {}
+        self._lock = threading.Lock()
+        self.scans = 0
+        self.loads = 0
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+
+    def _load(self, name, path, st):
+        if st.st_size > self.max_size:
+            media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            return Asset(path, media_type, _cache_control(name), None, st.st_mtime_ns, st.st_size)
+        with open(path, "rb") as f:
+            body = f.read()
+        return build_asset(name, body, path, st.st_mtime_ns)
+
+    def refresh(self):
+        with self._lock:
+            if not self.scans:
+                self._fallbacks = {
+                    name: build_asset(name, html.encode()) for name, html in self._fallback_pages.items()
+                }
+            current = self._assets
+            found = {}
+            reloaded = 0
+            for root, dirs, files in os.walk(self.directory):
+                dirs[:] = [d for d in dirs if not d.startswith(".")]
+                for filename in files:
+                    if filename.startswith("."):
+                        continue
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                    try:
+                        st = os.stat(path)
+                        asset = current.get(name)
+                        if asset is None or (asset.mtime_ns, asset.size) != (st.st_mtime_ns, st.st_size):
+                            asset = self._load(name, path, st)
+                            reloaded += 1
+                    except OSError:
+                        continue  # removed or unreadable mid-scan; the next scan sees it
+                    found[name] = asset
+            removed = len(current.keys() - found.keys())
+            # Readers only ever see a complete mapping
+            self._assets = found
+            self.loads += reloaded
+            self.scans += 1
+        if self.scans > 1 and (reloaded or removed):
+            print(f"🔄 Reloaded {reloaded} and dropped {removed} frontend files")
+        return {"assets": len(found), "reloaded": reloaded, "removed": removed}
+
+    def get(self, name):
+        return self._assets.get(name)
+
+    def page(self, name):
+        # The file if it exists, else its fallback page
+        asset = self.get(name)
+        return asset if asset is not None else self._fallbacks.get(name)
+
+    def response(self, asset, request):
+        if asset is None:
+            self.misses += 1
+            return None
+        if asset.variants is None:
+            self.hits += 1
+            return FileResponse(asset.path, media_type=asset.media_type,
+                                headers={"Cache-Control": asset.cache_control})
+
+        coding = _negotiate(asset.variants, request.headers.get("accept-encoding", ""))
+        body, etag = asset.variants[coding]
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        self.hits += 1
+        return Response(body, media_type=asset.media_type, headers=headers)
+
+    def stats(self):
+        assets = self._assets
+        return {
+            "directory": self.directory,
+            "assets": len(assets),
+            "bytes": sum(asset.size for asset in assets.values()),
+            "brotli": brotli is not None,
+            "loads": self.loads,
+            "hits": self.hits,
+            "not_modified": self.not_modified,
+            "misses": self.misses,
+        }
+
+
+def _negotiate(variants, accept_encoding):
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+    for coding in ("br", "gzip"):
+        if coding in variants and (coding in accepted or "*" in accepted):
+            return coding
+    return "identity"
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
@@ -0,0 +1,133 @@
+import os
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import takewhile
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .cache import stats_cache
+from .chunking import chunks
+from .database import SessionLocal
+
+# Last-click attribution: a revenue event goes to the most recent click on
+# the same link at or before it, if that click is at most this many days older
+ATTRIBUTION_WINDOW_DAYS = float(os.environ.get("LINKFLOW_ATTRIBUTION_WINDOW_DAYS", 30))
+# Revenue younger than this waits for the next run, so clicks still in the
+# ingest queue when the postback arrived are in click_events by then
+ATTRIBUTION_DELAY = float(os.environ.get("LINKFLOW_ATTRIBUTION_DELAY", 60))
+ATTRIBUTION_INTERVAL = float(os.environ.get("LINKFLOW_ATTRIBUTION_INTERVAL", 30))
+ATTRIBUTION_BATCH_SIZE = int(os.environ.get("LINKFLOW_ATTRIBUTION_BATCH_SIZE", 5000))
+
+ATTRIBUTION_CURSOR = "attribution_revenue"
+
+
+def _last_clicks(db: Session, events, window):
+    # events: (id, link_id, timestamp, user_id) sorted by (link_id, timestamp).
+    # One ordered range scan per chunk of links, merged against the events,
+    # instead of a "latest click before" query per event.
+    # -> {event id: (click id, seconds from click to event)}
+    attributed = {}
+    link_ids = sorted({event[1] for event in events})
+    for chunk in chunks(link_ids):
+        chunk_events = [event for event in events if chunk[0] <= event[1] <= chunk[-1]]
+        clicks = db.query(
+            models.ClickEvent.link_id, models.ClickEvent.timestamp, models.ClickEvent.id
+        ).filter(
+            models.ClickEvent.link_id.in_(chunk),
+            models.ClickEvent.timestamp >= min(event[2] for event in chunk_events) - window,
+            models.ClickEvent.timestamp <= max(event[2] for event in chunk_events)
+        ).order_by(models.ClickEvent.link_id, models.ClickEvent.timestamp, models.ClickEvent.id)
+
+        clicks = iter(clicks.yield_per(5000))
+        click = next(clicks, None)
+        last = None  # latest (link_id, timestamp, id) at or before the current event
+        for event_id, link_id, timestamp, _ in chunk_events:
+            while click is not None and (click[0], click[1]) <= (link_id, timestamp):
+                last = click
+                click = next(clicks, None)
+            if last is not None and last[0] == link_id and timestamp - last[1] <= window:
+                attributed[event_id] = (last[2], (timestamp - last[1]).total_seconds())
+    return attributed
+
+
+def _record_latency(db: Session, events, attributed):
+    totals = {}
+    for event_id, link_id, _, user_id in events:
+        if event_id not in attributed or user_id is None:
+            continue
+        seconds = attributed[event_id][1]
+        key = (link_id, bisect_left(crud.CONVERSION_LATENCY_BOUNDS, seconds))
+        current = totals.setdefault(key, [user_id, 0, 0.0])
+        current[1] += 1
+        current[2] += seconds
+    if not totals:
+        return
+    table = models.LinkConversionLatency.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.link_id, table.c.bucket],
+        set_={
+            "conversions": table.c.conversions + stmt.excluded.conversions,
+            "seconds": table.c.seconds + stmt.excluded.seconds,
+        }
+    )
+    db.connection().execute(stmt, [
+        {"link_id": link_id, "bucket": bucket, "user_id": user_id, "conversions": count, "seconds": seconds}
+        for (link_id, bucket), (user_id, count, seconds) in totals.items()
+    ])
+
+
+def attribute_revenue(db: Session, now: datetime = None, window_days: float = ATTRIBUTION_WINDOW_DAYS,
+                      delay: float = ATTRIBUTION_DELAY, batch_size: int = ATTRIBUTION_BATCH_SIZE):
+    window = timedelta(days=window_days)
+    settled = (now or datetime.utcnow()) - timedelta(seconds=delay)
+    revenue = models.RevenueEvent
+    processed = 0
+    attributed_total = 0
+    while True:
+        after_id = crud.get_job_cursor(db, ATTRIBUTION_CURSOR)
+        rows = db.query(
+            revenue.id, revenue.link_id, revenue.timestamp, models.AffiliateLink.user_id
+        ).outerjoin(
+            models.AffiliateLink, models.AffiliateLink.id == revenue.link_id
+        ).filter(revenue.id > after_id).order_by(revenue.id).limit(batch_size).all()
+        # Ids follow arrival order, so stop at the first event that's too recent
+        events = [tuple(row) for row in takewhile(lambda row: row[2] <= settled, rows)]
+        if not events:
+            db.rollback()
+            break
+
+        attributed = _last_clicks(db, sorted(events, key=lambda event: (event[1], event[2], event[0])), window)
+        if attributed:
+            table = revenue.__table__
+            db.connection().execute(
+                update(table)
+                .where(table.c.id == bindparam("b_id"))
+                .values(attributed_click_id=bindparam("b_click_id"), time_to_convert=bindparam("b_seconds")),
+                [{"b_id": event_id, "b_click_id": click_id, "b_seconds": seconds}
+                 for event_id, (click_id, seconds) in attributed.items()]
+            )
+            _record_latency(db, events, attributed)
+        crud.set_job_cursor(db, ATTRIBUTION_CURSOR, events[-1][0])
+        # Attributions, histogram and high-water mark commit together
+        db.commit()
+
+        for link_id, user_id in {(event[1], event[3]) for event in events if event[0] in attributed}:
+            stats_cache.invalidate(("link", user_id, link_id))
+            stats_cache.invalidate(("dashboard", user_id))
+        processed += len(events)
+        attributed_total += len(attributed)
+        if len(events) < len(rows) or len(rows) < batch_size:
+            break
+    return {"revenue_events": processed, "attributed": attributed_total}
+
+
+def run_attribution():
+    db = SessionLocal()
+    try:
+        return attribute_revenue(db)
+    finally:
+        db.close()
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Sentinel returned by LRUCache.get when a key is absent or expired. A cached
+# value of None is a valid (negative) entry and must not be confused with it.
+MISS = object()
+
+# What the redirect path needs to know about a short code
+ResolvedLink = namedtuple("ResolvedLink", ["link_id", "destination_url", "status", "user_id"])
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU cache with per-entry TTL and negative caching."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0, negative_ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every write to an entry. A loader notes it before reading
+        # the row, and set() drops the value if that key was written since.
+        self.generation = 0
+        self._written = OrderedDict()  # key -> generation of its last write, oldest first
+        self._forgotten = 0  # generations up to here may have been dropped from _written
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISS
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISS
+            self._data.move_to_end(key)
+            if value is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value, generation=None):
+        ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation is not None and (
+                generation < self._forgotten or self._written.get(key, 0) > generation
+            ):
+                return
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def update(self, key, func):
+        # Replace a live entry with func(value), keeping its expiry. Absent
+        # and negative entries are left alone; the next read reloads them.
+        with self._lock:
+            # A concurrent loader may have read the row before this write
+            self._mark_written(key)
+            entry = self._data.get(key)
+            if entry is None or entry[0] is None:
+                return False
+            value, expires_at = entry
+            self._data[key] = (func(value), expires_at)
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._mark_written(key)
+            self.invalidations += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._forgotten = self.generation
+            self._written.clear()
+            self._data.clear()
+
+    def _mark_written(self, key):
+        # Only loads of this key are affected. The oldest marks are dropped
+        # past 4 * maxsize; a load older than those is then refused, which is
+        # safe, just uncached.
+        self.generation += 1
+        self._written[key] = self.generation
+        self._written.move_to_end(key)
+        while len(self._written) > max(4 * self.maxsize, 1024):
+            _, self._forgotten = self._written.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "negative_ttl_seconds": self.negative_ttl,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_ratio": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+# short_code -> ResolvedLink (or None for codes known not to exist)
+link_cache = LRUCache(
+    maxsize=int(os.environ.get("LINKFLOW_LINK_CACHE_SIZE", 50000)),
+    ttl=float(os.environ.get("LINKFLOW_LINK_CACHE_TTL", 300)),
+    negative_ttl=float(os.environ.get("LINKFLOW_LINK_CACHE_NEGATIVE_TTL", 30)),
+)
+
+# ("dashboard", user_id) / ("link", user_id, link_id) -> stats snapshot dict.
+# Ingestion applies its deltas in place; the TTL bounds drift from writes
+# made elsewhere (other processes, manual SQL).
+stats_cache = LRUCache(
+    maxsize=int(os.environ.get("LINKFLOW_STATS_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("LINKFLOW_STATS_CACHE_TTL", 30)),
+    negative_ttl=0,
+)
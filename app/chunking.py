@@ -0,0 +1,14 @@
+from itertools import islice
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+IN_CLAUSE_CHUNK = 500
+
+
+def chunks(items, size=IN_CLAUSE_CHUNK):
+    # Lists of up to `size` items, consuming `items` lazily
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
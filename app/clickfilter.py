@@ -0,0 +1,152 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from hashlib import blake2b
+
+# Repeat (ip_address, link_id) hits within this many seconds are not counted
+# again; 0 disables deduplication.
+CLICK_DEDUP_WINDOW = float(os.environ.get("LINKFLOW_CLICK_DEDUP_WINDOW", 60))
+# Distinct (ip_address, link_id) pairs per window the filter is sized for.
+# Beyond that it keeps its memory and drops more genuine clicks instead.
+CLICK_DEDUP_CAPACITY = int(os.environ.get("LINKFLOW_CLICK_DEDUP_CAPACITY", 500000))
+CLICK_DEDUP_ERROR_RATE = float(os.environ.get("LINKFLOW_CLICK_DEDUP_ERROR_RATE", 0.001))
+CLICK_DEDUP_BUCKETS = int(os.environ.get("LINKFLOW_CLICK_DEDUP_BUCKETS", 6))
+BOT_FILTER_ENABLED = os.environ.get("LINKFLOW_BOT_FILTER", "1") == "1"
+
+# Crawlers, link unfurlers, monitors and HTTP libraries. Matched
+# case-insensitively anywhere in the User-Agent header.
+BOT_PATTERN = os.environ.get("LINKFLOW_BOT_PATTERN", "|".join((
+    r"bot\b", r"bot/", "crawl", "spider", "slurp", "archiver", "preview",
+    "facebookexternalhit", "facebot", "whatsapp", "skypeuripreview", "embedly", "pinterest",
+    "bingpreview", "mediapartners", "headlesschrome", "phantomjs", "lighthouse",
+    "pingdom", "uptimerobot", "statuscake", "monitor",
+    "curl/", "wget/", "python-", "go-http-client", "okhttp", "java/", "libwww", "httpclient",
+    "axios/", "node-fetch", "scrapy",
+)))
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # Kirsch-Mitzenmacher: k positions from two halves of one digest
+        digest = blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def contains(self, positions):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def add(self, positions):
+        bits = self.bits
+        for p in positions:
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def clear(self):
+        self.bits[:] = bytes(len(self.bits))
+        self.count = 0
+
+
+class SlidingWindowDeduplicator:
+    """Remembers keys for roughly `window` seconds in fixed memory.
+
+    The window is split into `buckets` time slices, each with its own Bloom
+    filter; a slice is wiped and reused once it falls out of the window. A key
+    is a repeat if any live slice has seen it, so keys are remembered for
+    between (buckets - 1) / buckets of the window and the full window.
+    False positives (a first click taken for a repeat) stay under error_rate
+    as long as traffic stays under `capacity` distinct keys per window.
+    """
+
+    def __init__(self, window, capacity, error_rate=0.001, buckets=6):
+        self.window = window
+        self.span = window / buckets
+        per_bucket = max(1, capacity // buckets)
+        # Lookups consult every slice, so split the error budget between them
+        self._filters = [BloomFilter(per_bucket, error_rate / buckets) for _ in range(buckets)]
+        self._epochs = [None] * buckets
+        self.capacity_per_bucket = per_bucket
+        self.saturated = 0
+
+    def seen(self, key, now):
+        epoch = int(now // self.span)
+        oldest = epoch - len(self._filters) + 1
+        current = self._filters[epoch % len(self._filters)]
+        if self._epochs[epoch % len(self._filters)] != epoch:
+            current.clear()
+            self._epochs[epoch % len(self._filters)] = epoch
+
+        positions = current.positions(key)
+        for bloom, bloom_epoch in zip(self._filters, self._epochs):
+            if bloom_epoch is not None and bloom_epoch >= oldest and bloom.contains(positions):
+                return True
+        if current.count == self.capacity_per_bucket:
+            self.saturated += 1
+        current.add(positions)
+        return False
+
+    def memory_bytes(self):
+        return sum(len(bloom.bits) for bloom in self._filters)
+
+
+class ClickFilter:
+    """Decides whether a redirect counts as a click.
+
+    check() returns None for a click to record, otherwise the reason it was
+    rejected. Rejections are only counted, never stored.
+    """
+
+    def __init__(self, window=60.0, capacity=500000, error_rate=0.001, buckets=6,
+                 bot_pattern=BOT_PATTERN, filter_bots=True):
+        self.deduplicator = SlidingWindowDeduplicator(window, capacity, error_rate, buckets) if window > 0 else None
+        self.bot_matcher = re.compile(bot_pattern, re.IGNORECASE) if filter_bots and bot_pattern else None
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = Counter()
+
+    def check(self, link_id, ip_address, user_agent, now=None):
+        if self.bot_matcher is not None and (not user_agent or self.bot_matcher.search(user_agent)):
+            reason = "bot"
+        elif self.deduplicator is not None and ip_address is not None:
+            key = f"{ip_address}\x00{link_id}".encode()
+            with self._lock:
+                duplicate = self.deduplicator.seen(key, time.monotonic() if now is None else now)
+            reason = "duplicate" if duplicate else None
+        else:
+            reason = None
+
+        if reason is None:
+            self.accepted += 1
+        else:
+            self.rejected[reason] += 1
+        return reason
+
+    def stats(self):
+        dedup = self.deduplicator
+        return {
+            "accepted": self.accepted,
+            "rejected": dict(self.rejected),
+            "bot_filter": self.bot_matcher is not None,
+            "dedup_window_seconds": dedup.window if dedup else 0,
+            "dedup_memory_bytes": dedup.memory_bytes() if dedup else 0,
+            "dedup_saturated": dedup.saturated if dedup else 0,
+        }
+
+
+click_filter = ClickFilter(
+    window=CLICK_DEDUP_WINDOW,
+    capacity=CLICK_DEDUP_CAPACITY,
+    error_rate=CLICK_DEDUP_ERROR_RATE,
+    buckets=CLICK_DEDUP_BUCKETS,
+    filter_bots=BOT_FILTER_ENABLED,
+)
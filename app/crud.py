@@ -1,8 +1,19 @@
+from sqlalchemy import String, bindparam, case, func, insert, literal, tuple_, type_coerce, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from . import models, schemas
+from pydantic import ValidationError
+from . import hll, interning, models, schemas
+from .cache import MISS, ResolvedLink, link_cache, stats_cache
+from .chunking import chunks
+from .leaderboard import leaderboards
+import base64
+import csv
+import json
 import secrets
 import string
-from datetime import datetime, timedelta
+from collections import Counter
+from datetime import date, datetime, timedelta
 
 # User CRUD Operations
 def get_user_by_email(db: Session, email: str):
@@ -25,116 +36,739 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 # Affiliate Link CRUD Operations
+SHORT_CODE_ALPHABET = string.ascii_letters + string.digits
+SHORT_CODE_ATTEMPTS = 5
+BULK_LINK_CHUNK = 1000
+BULK_MAX_ERRORS = 1000
+
+# Maps a random byte to a code character. Bytes >= 248 are dropped rather than
+# wrapped so every character stays equally likely (248 = 4 * 62).
+_SHORT_CODE_TABLE = bytes(ord(SHORT_CODE_ALPHABET[b % 62]) for b in range(256))
+_SHORT_CODE_REJECT = bytes(range(248, 256))
+
+def generate_short_codes(count: int, length: int = 8):
+    needed = count * length
+    symbols = ""
+    while len(symbols) < needed:
+        raw = secrets.token_bytes(needed - len(symbols) + 16)
+        symbols += raw.translate(_SHORT_CODE_TABLE, _SHORT_CODE_REJECT).decode("ascii")
+    return [symbols[start:start + length] for start in range(0, needed, length)]
+
 def generate_short_code(length=8):
-    alphabet = string.ascii_letters + string.digits
-    return ''.join(secrets.choice(alphabet) for _ in range(length))
+    return generate_short_codes(1, length)[0]
+
+def allocate_short_codes(db: Session, count: int, length: int = 8):
+    # Draw codes in bulk and redraw only the ones already taken, either within
+    # the batch or in the unique short_code index.
+    codes = []
+    taken = set()
+    for _ in range(SHORT_CODE_ATTEMPTS):
+        candidates = [code for code in generate_short_codes(count - len(codes), length) if code not in taken]
+        taken.update(candidates)
+        for chunk in chunks(candidates):
+            existing = {row[0] for row in db.query(models.AffiliateLink.short_code).filter(
+                models.AffiliateLink.short_code.in_(chunk)
+            )}
+            codes.extend(code for code in chunk if code not in existing)
+        if len(codes) >= count:
+            return codes[:count]
+    raise RuntimeError("Could not allocate unique short codes")
+
+def _short_url(short_code: str):
+    return f"http://localhost:8000/r/{short_code}"
 
 def create_affiliate_link(db: Session, link: schemas.AffiliateLinkCreate, user_id: int):
-    short_code = generate_short_code()
-    short_url = f"http://localhost:8000/r/{short_code}"
-    
-    db_link = models.AffiliateLink(
-        title=link.title,
-        destination_url=link.destination_url,
-        category=link.category,
-        user_id=user_id,
-        short_code=short_code,
-        short_url=short_url,
-        status="active",
-        clicks=0,
-        revenue=0.0
-    )
-    db.add(db_link)
-    db.commit()
+    for attempt in range(SHORT_CODE_ATTEMPTS):
+        short_code = allocate_short_codes(db, 1)[0]
+        db_link = models.AffiliateLink(
+            title=link.title,
+            destination_url=link.destination_url,
+            category=link.category,
+            user_id=user_id,
+            short_code=short_code,
+            short_url=_short_url(short_code),
+            status="active",
+            clicks=0,
+            revenue=0.0
+        )
+        db.add(db_link)
+        try:
+            db.commit()
+            break
+        except IntegrityError:
+            # Another writer claimed the code after we checked it
+            db.rollback()
+            if attempt == SHORT_CODE_ATTEMPTS - 1:
+                raise
     db.refresh(db_link)
+    # Drop any negative entry left behind by an earlier probe for this code
+    link_cache.invalidate(short_code)
+    stats_cache.invalidate(("dashboard", user_id))
     return db_link
 
-def get_user_links(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.AffiliateLink).filter(
-        models.AffiliateLink.user_id == user_id
-    ).offset(skip).limit(limit).all()
+def parse_link_row(data):
+    # Returns (AffiliateLinkCreate, None) or (None, error message)
+    if isinstance(data, csv.Error):
+        return None, f"Malformed CSV row: {data}"
+    if not isinstance(data, dict):
+        return None, "Expected an object with title and destination_url"
+    # csv.DictReader puts the cells past the header under a None key
+    data = {key: value for key, value in data.items() if isinstance(key, str) and value not in (None, "")}
+    for value in data.values():
+        if isinstance(value, str):
+            try:
+                value.encode("utf-8")
+            except UnicodeEncodeError:
+                # Undecodable bytes, kept as surrogates by iter_csv_rows' caller
+                return None, "Row is not valid UTF-8"
+    try:
+        link = schemas.AffiliateLinkCreate(**data)
+    except ValidationError as e:
+        return None, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+    except TypeError as e:
+        return None, str(e)
+    return link, None
+
+def iter_csv_rows(reader):
+    # Rows of a csv.DictReader; a line the csv module rejects is yielded as
+    # its csv.Error, so parse_link_row reports it and the rest still imports
+    while True:
+        try:
+            yield next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield e
+
+def _insert_link_chunk(db: Session, chunk, user_id: int, result, return_links: bool):
+    # chunk: [(row_number, AffiliateLinkCreate)]
+    links_table = models.AffiliateLink.__table__
+    stmt = insert(links_table)
+    if return_links:
+        # Rows come back in arbitrary order; that's fine as short codes identify them
+        stmt = stmt.returning(*links_table.c)
+
+    for attempt in range(SHORT_CODE_ATTEMPTS):
+        codes = allocate_short_codes(db, len(chunk))
+        params = [
+            {
+                "title": link.title,
+                "destination_url": link.destination_url,
+                "category": link.category,
+                "user_id": user_id,
+                "short_code": code,
+                "short_url": _short_url(code),
+                "status": "active",
+                "clicks": 0,
+                "revenue": 0.0
+            }
+            for (_, link), code in zip(chunk, codes)
+        ]
+        try:
+            result_rows = db.connection().execute(stmt, params)
+            rows = result_rows.mappings().all() if return_links else params
+            db.commit()
+            break
+        except IntegrityError:
+            db.rollback()
+    else:
+        # Still failing after fresh codes: insert row by row so only the bad
+        # rows are reported instead of the whole chunk.
+        rows = []
+        for row_number, link in chunk:
+            try:
+                rows.append(_row_to_mapping(create_affiliate_link(db, link, user_id)))
+            except Exception as e:
+                db.rollback()
+                _record_bulk_error(result, row_number, str(e))
+
+    for row in rows:
+        link_cache.invalidate(row["short_code"])
+    result["created"] += len(rows)
+    if return_links:
+        result["links"].extend(dict(row) for row in rows)
+
+def _row_to_mapping(db_link):
+    return {column.name: getattr(db_link, column.name) for column in models.AffiliateLink.__table__.c}
+
+def _record_bulk_error(result, row_number: int, error: str):
+    result["failed"] += 1
+    if len(result["errors"]) < BULK_MAX_ERRORS:
+        result["errors"].append({"row": row_number, "error": error})
+    else:
+        result["errors_truncated"] = True
+
+def create_affiliate_links_bulk(db: Session, rows, user_id: int, chunk_size: int = BULK_LINK_CHUNK,
+                                return_links: bool = True):
+    # rows: iterable of raw dicts (JSON objects or csv.DictReader rows), consumed
+    # lazily so a large upload is never held in memory at once. Each chunk is
+    # its own transaction; invalid rows are reported and skipped.
+    result = {"created": 0, "failed": 0, "errors": [], "errors_truncated": False, "links": []}
+    numbered = enumerate(rows, start=1)
+    for raw_chunk in chunks(numbered, chunk_size):
+        chunk = []
+        for row_number, data in raw_chunk:
+            link, error = parse_link_row(data)
+            if error:
+                _record_bulk_error(result, row_number, error)
+            else:
+                chunk.append((row_number, link))
+        if chunk:
+            _insert_link_chunk(db, chunk, user_id, result, return_links)
+    stats_cache.invalidate(("dashboard", user_id))
+    return result
+
+# Cursors are opaque to clients: urlsafe base64 of [order_by, *sort key].
+# created_at is carried as the text SQLite stores, so comparisons are exact.
+def encode_links_cursor(db: Session, link, order_by: str = "id"):
+    if order_by == "created_at":
+        created_at = db.query(type_coerce(models.AffiliateLink.created_at, String)).filter(
+            models.AffiliateLink.id == link.id
+        ).scalar()
+        payload = [order_by, created_at, link.id]
+    else:
+        payload = [order_by, link.id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def decode_links_cursor(cursor: str, order_by: str = "id"):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("Malformed cursor")
+    if not isinstance(payload, list) or not payload or payload[0] != order_by:
+        raise ValueError("Cursor does not match the requested ordering")
+    if order_by == "created_at" and len(payload) == 3 and isinstance(payload[2], int):
+        return payload[1], payload[2]
+    if order_by == "id" and len(payload) == 2 and isinstance(payload[1], int):
+        return payload[1]
+    raise ValueError("Malformed cursor")
+
+def get_user_links(db: Session, user_id: int, skip: int = 0, limit: int = 100,
+                   cursor: str = None, order_by: str = "id", columns=None):
+    # columns: select these instead of whole AffiliateLink objects
+    query = db.query(*(columns or [models.AffiliateLink])).filter(models.AffiliateLink.user_id == user_id)
+
+    if order_by == "created_at":
+        created_at = type_coerce(models.AffiliateLink.created_at, String)
+        query = query.order_by(models.AffiliateLink.created_at, models.AffiliateLink.id)
+        if cursor:
+            after_created_at, after_id = decode_links_cursor(cursor, order_by)
+            query = query.filter(
+                tuple_(created_at, models.AffiliateLink.id) > tuple_(literal(after_created_at, String), after_id)
+            )
+    else:
+        query = query.order_by(models.AffiliateLink.id)
+        if cursor:
+            query = query.filter(models.AffiliateLink.id > decode_links_cursor(cursor, order_by))
+
+    # Offset paging stays for existing clients; with a cursor it's ignored
+    if not cursor and skip:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
+def get_user_links_page(db: Session, user_id: int, skip: int = 0, limit: int = 100,
+                        cursor: str = None, order_by: str = "id", columns=None):
+    links = get_user_links(db, user_id, skip=skip, limit=limit, cursor=cursor, order_by=order_by, columns=columns)
+    # A full page means there may be more
+    next_cursor = None
+    if links and len(links) == limit:
+        next_cursor = encode_links_cursor(db, links[-1], order_by)
+    return links, next_cursor
+
+# schemas.AffiliateLink fields, in order, for responses built without the ORM
+LINK_ROW_FIELDS = tuple(schemas.AffiliateLink.model_fields)
+LINK_ROW_COLUMNS = [getattr(models.AffiliateLink, field) for field in LINK_ROW_FIELDS]
+
+def get_user_link_rows_page(db: Session, user_id: int, skip: int = 0, limit: int = 100,
+                            cursor: str = None, order_by: str = "id"):
+    # Same page as get_user_links_page, as plain tuples in LINK_ROW_FIELDS order
+    return get_user_links_page(db, user_id, skip=skip, limit=limit, cursor=cursor, order_by=order_by,
+                               columns=LINK_ROW_COLUMNS)
 
 def get_link_by_short_code(db: Session, short_code: str):
     return db.query(models.AffiliateLink).filter(
         models.AffiliateLink.short_code == short_code
     ).first()
 
+def resolve_short_code(db: Session, short_code: str):
+    cached = link_cache.get(short_code)
+    if cached is not MISS:
+        return cached
+    return load_short_code(db, short_code)
+
+def load_short_code(db: Session, short_code: str):
+    # Cache-miss path of resolve_short_code
+    generation = link_cache.generation
+    row = db.query(
+        models.AffiliateLink.id,
+        models.AffiliateLink.destination_url,
+        models.AffiliateLink.status,
+        models.AffiliateLink.user_id
+    ).filter(models.AffiliateLink.short_code == short_code).first()
+
+    resolved = ResolvedLink(*row) if row else None
+    link_cache.set(short_code, resolved, generation=generation)
+    return resolved
+
 def get_link_by_id(db: Session, link_id: int):
     return db.query(models.AffiliateLink).filter(models.AffiliateLink.id == link_id).first()
 
+def get_link_titles(db: Session, link_ids, user_id: int = None):
+    # {link_id: (owner id, title, short_code)}; deleted links, and with a
+    # user_id other users' links, are left out
+    query = db.query(
+        models.AffiliateLink.id, models.AffiliateLink.user_id, models.AffiliateLink.title,
+        models.AffiliateLink.short_code
+    ).filter(models.AffiliateLink.id.in_(list(link_ids)))
+    if user_id is not None:
+        query = query.filter(models.AffiliateLink.user_id == user_id)
+    return {link_id: (owner, title, short_code) for link_id, owner, title, short_code in query}
+
 def update_link_clicks(db: Session, link_id: int):
-    link = db.query(models.AffiliateLink).filter(models.AffiliateLink.id == link_id).first()
-    if link:
-        link.clicks += 1
-        db.commit()
-        db.refresh(link)
-    return link
+    # Increment in SQL so concurrent writers can't lose updates
+    db.execute(
+        update(models.AffiliateLink)
+        .where(models.AffiliateLink.id == link_id)
+        .values(clicks=models.AffiliateLink.clicks + 1)
+    )
+    db.commit()
+    return get_link_by_id(db, link_id)
 
 def update_link_revenue(db: Session, link_id: int, amount: float):
-    link = db.query(models.AffiliateLink).filter(models.AffiliateLink.id == link_id).first()
-    if link:
-        link.revenue += amount
-        db.commit()
-        db.refresh(link)
-    return link
+    db.execute(
+        update(models.AffiliateLink)
+        .where(models.AffiliateLink.id == link_id)
+        .values(revenue=models.AffiliateLink.revenue + amount)
+    )
+    db.commit()
+    return get_link_by_id(db, link_id)
 
 def delete_link(db: Session, link_id: int, user_id: int):
+    # -> the deleted link's short code, or None if the user has no such link
     link = db.query(models.AffiliateLink).filter(
         models.AffiliateLink.id == link_id,
         models.AffiliateLink.user_id == user_id
     ).first()
     if link:
+        short_code = link.short_code
         db.delete(link)
         db.commit()
-        return True
-    return False
+        link_cache.invalidate(short_code)
+        stats_cache.invalidate(("dashboard", user_id))
+        stats_cache.invalidate(("link", user_id, link_id))
+        leaderboards.remove_link(link_id)
+        return short_code
+    return None
 
 # Click Events
 def create_click_event(db: Session, click: schemas.ClickEventCreate):
     db_click = models.ClickEvent(
         link_id=click.link_id,
         ip_address=click.ip_address,
-        user_agent=click.user_agent,
-        referrer=click.referrer
+        user_agent_id=interning.user_agents.intern(db, [click.user_agent]).get(click.user_agent),
+        referrer_id=interning.referrers.intern(db, [click.referrer]).get(click.referrer)
     )
     db.add(db_click)
     db.commit()
     db.refresh(db_click)
     return db_click
 
-# Dashboard Stats
-def get_dashboard_stats(db: Session, user_id: int):
-    links = db.query(models.AffiliateLink).filter(models.AffiliateLink.user_id == user_id).all()
-    
-    if not links:
-        return {
-            "total_links": 0,
-            "total_clicks": 0,
-            "total_revenue": 0.0,
-            "active_campaigns": 0,
-            "conversion_rate": 0.0
+def ingest_clicks(db: Session, clicks):
+    # clicks: iterable of (link_id, user_id, ip_address, user_agent, referrer, timestamp)
+    clicks = list(clicks)
+    if not clicks:
+        return
+    # intern() commits any new strings, so it goes before this transaction
+    user_agent_ids = interning.user_agents.intern(db, (click[3] for click in clicks))
+    referrer_ids = interning.referrers.intern(db, (click[4] for click in clicks))
+    links = models.AffiliateLink.__table__
+    deltas = Counter((click[0], click[1]) for click in clicks)
+    # Counting first takes SQLite's write lock, so no delete can commit
+    # between the existence check below and this transaction's commit
+    db.connection().execute(
+        update(links)
+        .where(links.c.id == bindparam("b_link_id"))
+        .values(clicks=links.c.clicks + bindparam("b_delta")),
+        [{"b_link_id": link_id, "b_delta": delta} for (link_id, _), delta in deltas.items()]
+    )
+    existing = set()
+    for chunk in chunks({link_id for link_id, _ in deltas}):
+        existing.update(row[0] for row in db.query(models.AffiliateLink.id).filter(models.AffiliateLink.id.in_(chunk)))
+    if len(existing) < len(deltas):
+        # Redirects served from a cache that hadn't seen the delete yet
+        clicks = [click for click in clicks if click[0] in existing]
+        deltas = {key: delta for key, delta in deltas.items() if key[0] in existing}
+        if not clicks:
+            db.commit()
+            return
+    db.execute(insert(models.ClickEvent), [
+        {
+            "link_id": link_id,
+            "ip_address": ip_address,
+            "user_agent_id": user_agent_ids.get(user_agent),
+            "referrer_id": referrer_ids.get(referrer),
+            "timestamp": timestamp
         }
-    
-    total_links = len(links)
-    total_clicks = sum(link.clicks for link in links)
-    total_revenue = sum(link.revenue for link in links)
-    active_campaigns = len([link for link in links if link.status == "active"])
-    
-    conversion_rate = 0.0
-    if total_clicks > 0:
-        # Simple conversion rate calculation
-        conversion_rate = round((total_revenue / total_clicks) * 100, 2)
-    
+        for link_id, user_id, ip_address, user_agent, referrer, timestamp in clicks
+    ])
+    update_visitor_sketches(db, ((click[0], click[1], click[2], click[5]) for click in clicks))
+    db.commit()
+    apply_stats_deltas({key: (delta, 0.0) for key, delta in deltas.items()})
+    hours = Counter((click[0], click[1], click[5].replace(minute=0, second=0, microsecond=0)) for click in clicks)
+    leaderboards.record((link_id, user_id, hour, count, 0.0) for (link_id, user_id, hour), count in hours.items())
+
+# Unique visitors: HyperLogLog sketches per link and per user per UTC day,
+# plus a running all-time sketch of each stored under this day, so the
+# dashboards' all-time count reads one row instead of merging every day
+ALL_TIME_SKETCH_DAY = date(1, 1, 1)
+
+def update_visitor_sketches(db: Session, clicks):
+    # clicks: iterable of (link_id, user_id, ip_address, timestamp). Merged
+    # into the stored sketches by hll_merge, in the caller's transaction.
+    hashed = {}
+    per_link = {}
+    per_user = {}
+    for link_id, user_id, ip_address, timestamp in clicks:
+        if ip_address is None or timestamp is None:
+            continue
+        registers = hashed.get(ip_address)
+        if registers is None:
+            registers = hashed[ip_address] = hll.hash_visitor(ip_address)
+        day = timestamp.date()
+        for sketches, key in ((per_link, (link_id, day)), (per_user, (user_id, day)),
+                              (per_link, (link_id, ALL_TIME_SKETCH_DAY)), (per_user, (user_id, ALL_TIME_SKETCH_DAY))):
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketch = sketches[key] = hll.HyperLogLog()
+            sketch.add_hashed(*registers)
+    _merge_sketches(db, models.LinkVisitorSketch, "link_id", per_link)
+    _merge_sketches(db, models.UserVisitorSketch, "user_id", per_user)
+
+def _merge_sketches(db: Session, model, owner: str, sketches):
+    if not sketches:
+        return
+    table = model.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c[owner], table.c.day],
+        set_={"sketch": func.hll_merge(table.c.sketch, stmt.excluded.sketch)}
+    )
+    db.connection().execute(stmt, [
+        {owner: owner_id, "day": day, "sketch": sketch.to_bytes()}
+        for (owner_id, day), sketch in sketches.items()
+    ])
+
+def get_unique_visitors(db: Session, user_id: int, link_id: int = None, start: date = None, end: date = None):
+    # Distinct visitors over [start, end) days, for one link (ownership is
+    # the caller's job) or across all of the user's links
+    if link_id is None:
+        model = models.UserVisitorSketch
+        query = db.query(model.sketch).filter(model.user_id == user_id)
+    else:
+        model = models.LinkVisitorSketch
+        query = db.query(model.sketch).filter(model.link_id == link_id)
+    if start is None and end is None:
+        query = query.filter(model.day == ALL_TIME_SKETCH_DAY)
+    else:
+        query = query.filter(model.day > ALL_TIME_SKETCH_DAY)
+    if start is not None:
+        query = query.filter(model.day >= start)
+    if end is not None:
+        query = query.filter(model.day < end)
+    merged = hll.HyperLogLog()
+    for (blob,) in query:
+        merged.merge(hll.HyperLogLog.from_bytes(blob))
+    return merged.estimate()
+
+# Revenue Events
+def track_revenue_events(db: Session, events, user_id: int):
+    events = list(events)
+    owned = set()
+    for chunk in chunks({event.link_id for event in events}):
+        owned.update(row[0] for row in db.query(models.AffiliateLink.id).filter(
+            models.AffiliateLink.user_id == user_id,
+            models.AffiliateLink.id.in_(chunk)
+        ))
+
+    rows = []
+    seen = set()
+    unknown_links = 0
+    duplicates = 0
+    now = datetime.utcnow()
+    for event in events:
+        if event.link_id not in owned:
+            unknown_links += 1
+            continue
+        if event.transaction_id is not None:
+            if event.transaction_id in seen:
+                duplicates += 1
+                continue
+            seen.add(event.transaction_id)
+        rows.append({
+            "link_id": event.link_id,
+            "amount": event.amount,
+            "currency": event.currency,
+            "transaction_id": event.transaction_id,
+            "timestamp": now
+        })
+
+    accepted = []
+    if rows:
+        # The unique transaction_id index drops replays of already-stored
+        # postbacks; RETURNING tells us which rows actually went in.
+        revenue_events = models.RevenueEvent.__table__
+        accepted = db.connection().execute(
+            sqlite_insert(revenue_events)
+            .on_conflict_do_nothing()
+            .returning(revenue_events.c.link_id, revenue_events.c.amount),
+            rows
+        ).all()
+        duplicates += len(rows) - len(accepted)
+
+        deltas = {}
+        for link_id, amount in accepted:
+            deltas[link_id] = deltas.get(link_id, 0.0) + amount
+        if deltas:
+            links = models.AffiliateLink.__table__
+            db.connection().execute(
+                update(links)
+                .where(links.c.id == bindparam("b_link_id"))
+                .values(revenue=links.c.revenue + bindparam("b_delta")),
+                [{"b_link_id": link_id, "b_delta": delta} for link_id, delta in deltas.items()]
+            )
+        db.commit()
+        apply_stats_deltas({(link_id, user_id): (0, delta) for link_id, delta in deltas.items()})
+        leaderboards.record((link_id, user_id, now, 0, delta) for link_id, delta in deltas.items())
+
+    return {
+        "received": len(events),
+        "accepted": len(accepted),
+        "duplicates": duplicates,
+        "unknown_links": unknown_links
+    }
+
+# Click rows with the user agent and referrer strings joined back in
+CLICK_ROW_COLUMNS = ("id", "link_id", "timestamp", "ip_address", "user_agent", "referrer")
+
+def query_click_rows(db: Session):
+    return db.query(
+        models.ClickEvent.id,
+        models.ClickEvent.link_id,
+        models.ClickEvent.timestamp,
+        models.ClickEvent.ip_address,
+        models.UserAgent.value,
+        models.Referrer.value
+    ).select_from(models.ClickEvent).outerjoin(
+        models.UserAgent, models.UserAgent.id == models.ClickEvent.user_agent_id
+    ).outerjoin(
+        models.Referrer, models.Referrer.id == models.ClickEvent.referrer_id
+    )
+
+# Raw event export, one id-ordered page at a time
+EXPORT_COLUMNS = {
+    "clicks": (models.ClickEvent, CLICK_ROW_COLUMNS),
+    "revenue": (models.RevenueEvent, ("id", "link_id", "timestamp", "amount", "currency", "transaction_id",
+                                      "attributed_click_id", "time_to_convert")),
+}
+
+def user_owns_link(db: Session, link_id: int, user_id: int):
+    return db.query(models.AffiliateLink.id).filter(
+        models.AffiliateLink.id == link_id,
+        models.AffiliateLink.user_id == user_id
+    ).first() is not None
+
+def get_export_page(db: Session, kind: str, user_id: int, after_id: int = 0, limit: int = 5000,
+                    link_id: int = None, start: datetime = None, end: datetime = None):
+    model, columns = EXPORT_COLUMNS[kind]
+    if model is models.ClickEvent:
+        query = query_click_rows(db)
+    else:
+        query = db.query(*(getattr(model, column) for column in columns))
+    query = query.filter(model.id > after_id)
+    if link_id is not None:
+        # Caller checks ownership; ix_*_link_id keeps rowid order within a link
+        query = query.filter(model.link_id == link_id)
+    else:
+        owned = db.query(models.AffiliateLink.id).filter(models.AffiliateLink.user_id == user_id)
+        # "+ 0" keeps SQLite walking the primary key, so a page stops after
+        # `limit` rows instead of sorting every event the account has
+        query = query.filter((model.link_id + 0).in_(owned.scalar_subquery()))
+    if start is not None:
+        query = query.filter(model.timestamp >= start)
+    if end is not None:
+        query = query.filter(model.timestamp < end)
+    return query.order_by(model.id).limit(limit).all()
+
+# Background job high-water marks
+def get_job_cursor(db: Session, name: str):
+    cursor = db.get(models.JobCursor, name)
+    return cursor.last_id if cursor else 0
+
+def set_job_cursor(db: Session, name: str, last_id: int):
+    db.execute(
+        sqlite_insert(models.JobCursor)
+        .values(name=name, last_id=last_id)
+        .on_conflict_do_update(index_elements=["name"], set_={"last_id": last_id})
+    )
+
+# Rollup-backed time series
+ROLLUP_MODELS = {"hour": models.LinkStatsHourly, "day": models.LinkStatsDaily}
+
+def _series_points(rows):
+    return [
+        {"bucket": bucket, "clicks": clicks or 0, "revenue": revenue or 0.0, "conversions": conversions or 0}
+        for bucket, clicks, revenue, conversions in rows
+    ]
+
+def get_link_timeseries(db: Session, link_id: int, user_id: int, start: datetime, end: datetime,
+                        granularity: str = "day"):
+    owned = db.query(models.AffiliateLink.id).filter(
+        models.AffiliateLink.id == link_id,
+        models.AffiliateLink.user_id == user_id
+    ).first()
+    if owned is None:
+        return None
+
+    rollup = ROLLUP_MODELS[granularity]
+    rows = db.query(
+        rollup.bucket, rollup.clicks, rollup.revenue, rollup.conversions
+    ).filter(
+        rollup.link_id == link_id,
+        rollup.bucket >= start,
+        rollup.bucket < end
+    ).order_by(rollup.bucket)
+    return _series_points(rows)
+
+def get_user_timeseries(db: Session, user_id: int, start: datetime, end: datetime, granularity: str = "day"):
+    rollup = ROLLUP_MODELS[granularity]
+    rows = db.query(
+        rollup.bucket,
+        func.sum(rollup.clicks),
+        func.sum(rollup.revenue),
+        func.sum(rollup.conversions)
+    ).filter(
+        rollup.user_id == user_id,
+        rollup.bucket >= start,
+        rollup.bucket < end
+    ).group_by(rollup.bucket).order_by(rollup.bucket)
+    return _series_points(rows)
+
+# Dashboard Stats
+def _conversion_rate(revenue, clicks):
+    # Simple conversion rate calculation
+    if clicks > 0:
+        return round((revenue / clicks) * 100, 2)
+    return 0.0
+
+def _attributed_conversion_rate(conversions, clicks):
+    # Percentage of clicks followed by an attributed conversion
+    if clicks > 0:
+        return round(conversions / clicks * 100, 2)
+    return 0.0
+
+def _bump_stats(clicks_field, revenue_field, clicks, revenue):
+    def bump(stats):
+        stats = dict(stats)
+        stats[clicks_field] += clicks
+        stats[revenue_field] += revenue
+        stats["conversion_rate"] = _conversion_rate(stats[revenue_field], stats[clicks_field])
+        stats["attributed_conversion_rate"] = _attributed_conversion_rate(
+            stats["attributed_conversions"], stats[clicks_field]
+        )
+        return stats
+    return bump
+
+# Upper bounds in seconds of the time-to-convert histogram buckets, plus one
+# open-ended bucket after the last
+CONVERSION_LATENCY_BOUNDS = (60, 300, 900, 3600, 6 * 3600, 86400, 3 * 86400, 7 * 86400, 30 * 86400)
+
+def _latency_percentile(counts, total, fraction):
+    # Upper bound of the bucket holding the percentile; None past the last bound
+    rank = fraction * total
+    seen = 0
+    for bound, count in zip(CONVERSION_LATENCY_BOUNDS, counts):
+        seen += count
+        if seen >= rank:
+            return float(bound)
+    return None
+
+def get_conversion_latency(db: Session, user_id: int, link_id: int = None):
+    latency = models.LinkConversionLatency
+    query = db.query(latency.bucket, func.sum(latency.conversions), func.sum(latency.seconds))
+    if link_id is not None:
+        query = query.filter(latency.link_id == link_id)
+    else:
+        query = query.filter(latency.user_id == user_id)
+    counts = [0] * (len(CONVERSION_LATENCY_BOUNDS) + 1)
+    seconds = 0.0
+    for bucket, conversions, bucket_seconds in query.group_by(latency.bucket):
+        counts[bucket] = conversions
+        seconds += bucket_seconds
+    total = sum(counts)
     return {
+        "conversions": total,
+        "mean_seconds": round(seconds / total, 1) if total else None,
+        "p50_seconds": _latency_percentile(counts, total, 0.5) if total else None,
+        "p90_seconds": _latency_percentile(counts, total, 0.9) if total else None,
+        "buckets": [
+            {"le_seconds": float(bound) if bound is not None else None, "conversions": count}
+            for bound, count in zip(CONVERSION_LATENCY_BOUNDS + (None,), counts)
+        ]
+    }
+
+def apply_stats_deltas(deltas):
+    # deltas: {(link_id, user_id): (clicks, revenue)} from a committed write
+    per_user = {}
+    for (link_id, user_id), (clicks, revenue) in deltas.items():
+        stats_cache.update(("link", user_id, link_id), _bump_stats("clicks", "revenue", clicks, revenue))
+        user_clicks, user_revenue = per_user.get(user_id, (0, 0.0))
+        per_user[user_id] = (user_clicks + clicks, user_revenue + revenue)
+    for user_id, (clicks, revenue) in per_user.items():
+        stats_cache.update(("dashboard", user_id), _bump_stats("total_clicks", "total_revenue", clicks, revenue))
+
+def get_dashboard_stats(db: Session, user_id: int):
+    key = ("dashboard", user_id)
+    cached = stats_cache.get(key)
+    if cached is not MISS:
+        return cached
+
+    generation = stats_cache.generation
+    total_links, total_clicks, total_revenue, active_campaigns = db.query(
+        func.count(models.AffiliateLink.id),
+        func.coalesce(func.sum(models.AffiliateLink.clicks), 0),
+        func.coalesce(func.sum(models.AffiliateLink.revenue), 0.0),
+        func.coalesce(func.sum(case((models.AffiliateLink.status == "active", 1), else_=0)), 0)
+    ).filter(models.AffiliateLink.user_id == user_id).one()
+
+    stats = {
         "total_links": total_links,
         "total_clicks": total_clicks,
         "total_revenue": total_revenue,
         "active_campaigns": active_campaigns,
-        "conversion_rate": conversion_rate
+        "conversion_rate": _conversion_rate(total_revenue, total_clicks),
+        "unique_visitors": get_unique_visitors(db, user_id),
+        "unique_visitors_error": hll.RELATIVE_ERROR
     }
+    latency = get_conversion_latency(db, user_id)
+    stats["attributed_conversions"] = latency["conversions"]
+    stats["attributed_conversion_rate"] = _attributed_conversion_rate(latency["conversions"], total_clicks)
+    stats["time_to_convert"] = latency
+    stats_cache.set(key, stats, generation=generation)
+    return stats
 
 def get_link_stats(db: Session, link_id: int, user_id: int):
-    link = db.query(models.AffiliateLink).filter(
+    key = ("link", user_id, link_id)
+    cached = stats_cache.get(key)
+    if cached is not MISS:
+        return cached
+
+    generation = stats_cache.generation
+    link = db.query(
+        models.AffiliateLink.id,
+        models.AffiliateLink.title,
+        models.AffiliateLink.clicks,
+        models.AffiliateLink.revenue
+    ).filter(
         models.AffiliateLink.id == link_id,
         models.AffiliateLink.user_id == user_id
     ).first()
@@ -142,14 +776,18 @@ def get_link_stats(db: Session, link_id: int, user_id: int):
     if not link:
         return None
     
-    conversion_rate = 0.0
-    if link.clicks > 0:
-        conversion_rate = round((link.revenue / link.clicks) * 100, 2)
-    
-    return {
+    stats = {
         "link_id": link.id,
         "title": link.title,
         "clicks": link.clicks,
         "revenue": link.revenue,
-        "conversion_rate": conversion_rate
-    }
\ No newline at end of file
+        "conversion_rate": _conversion_rate(link.revenue, link.clicks),
+        "unique_visitors": get_unique_visitors(db, user_id, link_id=link_id),
+        "unique_visitors_error": hll.RELATIVE_ERROR
+    }
+    latency = get_conversion_latency(db, user_id, link_id=link_id)
+    stats["attributed_conversions"] = latency["conversions"]
+    stats["attributed_conversion_rate"] = _attributed_conversion_rate(latency["conversions"], link.clicks)
+    stats["time_to_convert"] = latency
+    stats_cache.set(key, stats, generation=generation)
+    return stats
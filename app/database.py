@@ -1,23 +1,176 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import os
 
+from .hll import register_sqlite_functions
+
 # SQLite database URL
-SQLALCHEMY_DATABASE_URL = "sqlite:///./affiliate.db"
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./affiliate.db")
+
+# "default" keeps SQLite's stock settings (rollback journal, one engine).
+# "production" enables WAL and tuned pragmas on every connection, sizes the
+# pool, and gives read-only endpoints their own engine so they never queue
+# behind click writes.
+DB_PROFILE = os.environ.get("LINKFLOW_DB_PROFILE", "default")
+if DB_PROFILE not in ("default", "production"):
+    raise ValueError(f"Unknown LINKFLOW_DB_PROFILE: {DB_PROFILE}")
+
+# Set LINKFLOW_ASYNC_DB=1 to run async routes on an aiosqlite AsyncSession
+ASYNC_DB_ENABLED = os.environ.get("LINKFLOW_ASYNC_DB", "0") == "1"
+
+# Production pragmas; each can be overridden with LINKFLOW_SQLITE_<NAME>.
+# synchronous=NORMAL under WAL survives application crashes but may lose the
+# last commits on power loss; use FULL if that matters more than fsyncs.
+PRODUCTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -65536,  # negative means KiB, so 64 MiB per connection
+    "mmap_size": 268435456,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
+def _pragmas(read_only=False):
+    if DB_PROFILE != "production":
+        return {}
+    pragmas = {
+        name: os.environ.get(f"LINKFLOW_SQLITE_{name.upper()}", value)
+        for name, value in PRODUCTION_PRAGMAS.items()
+    }
+    if read_only:
+        # The journal mode is a property of the file, set by the write engine
+        pragmas.pop("journal_mode")
+        pragmas["query_only"] = "ON"
+    return pragmas
+
+def _install_pragmas(sync_engine, pragmas):
+    if not pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
-)
+def _register_functions(dbapi_connection, connection_record):
+    # Application SQL functions, e.g. hll_merge for unique-visitor sketches
+    register_sqlite_functions(dbapi_connection)
+
+def _pool_args():
+    if DB_PROFILE != "production":
+        return {}
+    return {
+        "pool_size": int(os.environ.get("LINKFLOW_DB_POOL_SIZE", 8)),
+        "max_overflow": int(os.environ.get("LINKFLOW_DB_MAX_OVERFLOW", 16)),
+        "pool_timeout": float(os.environ.get("LINKFLOW_DB_POOL_TIMEOUT", 30)),
+    }
+
+def _create_engine(read_only=False):
+    sync_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        **_pool_args()
+    )
+    _install_pragmas(sync_engine, _pragmas(read_only))
+    event.listen(sync_engine, "connect", _register_functions)
+    return sync_engine
+
+engine = _create_engine()
+read_engine = _create_engine(read_only=True) if DB_PROFILE == "production" else engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+if ASYNC_DB_ENABLED:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    def _create_async_engine(read_only=False):
+        pool_args = _pool_args()
+        if pool_args:
+            # aiosqlite defaults to NullPool, i.e. a new connection per session
+            pool_args["poolclass"] = AsyncAdaptedQueuePool
+        new_engine = create_async_engine(
+            SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1),
+            # More requests are in flight than on the threadpool, so writers can
+            # queue on SQLite's lock for longer than the default 5s
+            connect_args={"timeout": 30},
+            **pool_args
+        )
+        _install_pragmas(new_engine.sync_engine, _pragmas(read_only))
+        event.listen(new_engine.sync_engine, "connect", _register_functions)
+        return new_engine
+
+    async_engine = _create_async_engine()
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+    async_read_engine = async_engine
+    if DB_PROFILE == "production":
+        async_read_engine = _create_async_engine(read_only=True)
+    AsyncReadSessionLocal = async_sessionmaker(
+        async_read_engine, autoflush=False, expire_on_commit=False
+    )
+
+def sync_engines():
+    # Every distinct engine in use, async ones unwrapped (for event hooks)
+    engines = [engine, read_engine]
+    if async_engine is not None:
+        engines += [async_engine.sync_engine, async_read_engine.sync_engine]
+    return list({id(e): e for e in engines}.values())
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def _run_in_session(session_factory, fn, *args, **kwargs):
+    db = session_factory()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+async def _run(session_factory, async_session_factory, fn, args, kwargs):
+    if async_session_factory is not None:
+        async with async_session_factory() as session:
+            return await session.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(_run_in_session, session_factory, fn, *args, **kwargs)
+
+async def run_db(fn, *args, **kwargs):
+    # Runs fn(session, *args, **kwargs) without blocking the event loop, so
+    # crud functions serve both paths: on an AsyncSession when the async
+    # engine is enabled, otherwise with a regular Session on the threadpool.
+    return await _run(SessionLocal, AsyncSessionLocal, fn, args, kwargs)
+
+async def run_db_read(fn, *args, **kwargs):
+    # Same as run_db, on the read-only engine
+    return await _run(ReadSessionLocal, AsyncReadSessionLocal, fn, args, kwargs)
+
+# SQLite allows one writer at a time. Queueing writers here rather than on the
+# file lock avoids the busy handler's sleep-and-retry backoff under load.
+_write_lock = asyncio.Lock()
+
+async def run_db_write(fn, *args, **kwargs):
+    async with _write_lock:
+        return await run_db(fn, *args, **kwargs)
@@ -0,0 +1,24 @@
+import os
+
+from fastapi.responses import JSONResponse
+
+# Opt-in: hot read endpoints skip response_model validation and build their
+# JSON straight from selected columns with orjson. Their OpenAPI schema is
+# still generated from the declared response_model, and the body is the same.
+FAST_JSON = os.environ.get("LINKFLOW_FAST_JSON", "0") == "1"
+
+orjson = None
+if FAST_JSON:
+    try:
+        import orjson
+    except ImportError:  # optional: only needed with LINKFLOW_FAST_JSON=1
+        pass
+if FAST_JSON and orjson is None:
+    print("⚠️ LINKFLOW_FAST_JSON=1 needs orjson; falling back to the default responses")
+    FAST_JSON = False
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        # Naive datetimes come out as "YYYY-MM-DDTHH:MM:SS[.ffffff]", like Pydantic
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
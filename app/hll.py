@@ -0,0 +1,97 @@
+import math
+import struct
+from hashlib import blake2b
+
+# HyperLogLog sketches for unique-visitor counts.
+#
+# With PRECISION = 12 there are 4096 registers, so estimates have a relative
+# standard error of 1.04 / sqrt(4096) ~= 1.6%: about two thirds of estimates
+# are within 1.6% of the true count, and 95% within 3.3%. Counts up to about
+# 10k use linear counting and are usually much closer. Sketches merge
+# losslessly (register-wise max), so the error bound holds for any union of
+# days or links.
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+RELATIVE_ERROR = round(1.04 / math.sqrt(REGISTERS), 4)
+
+_HASH_BITS = 64
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+# Serialized form: a format byte, then either (register, value) pairs for the
+# non-zero registers (sparse, 3 bytes each) or all registers (dense, 1 byte
+# each). A link-day with a handful of visitors takes a few dozen bytes.
+_SPARSE = b"\x01"
+_DENSE = b"\x02"
+_PAIR = struct.Struct(">HB")
+_SPARSE_LIMIT = REGISTERS // _PAIR.size
+
+
+def hash_visitor(value: str):
+    # -> (register index, rank of the first set bit in the remaining bits)
+    h = int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "big")
+    index = h >> (_HASH_BITS - PRECISION)
+    rest = h & ((1 << (_HASH_BITS - PRECISION)) - 1)
+    return index, _HASH_BITS - PRECISION - rest.bit_length() + 1
+
+
+class HyperLogLog:
+    def __init__(self):
+        self.registers = {}  # index -> rank, non-zero registers only
+
+    def add(self, value: str):
+        self.add_hashed(*hash_visitor(value))
+
+    def add_hashed(self, index, rank):
+        if rank > self.registers.get(index, 0):
+            self.registers[index] = rank
+
+    def merge(self, other):
+        registers = self.registers
+        for index, rank in other.registers.items():
+            if rank > registers.get(index, 0):
+                registers[index] = rank
+        return self
+
+    def estimate(self):
+        zeros = REGISTERS - len(self.registers)
+        harmonic = zeros + sum(2.0 ** -rank for rank in self.registers.values())
+        raw = _ALPHA * REGISTERS * REGISTERS / harmonic
+        if raw <= 2.5 * REGISTERS and zeros:
+            return int(round(REGISTERS * math.log(REGISTERS / zeros)))
+        return int(round(raw))
+
+    def to_bytes(self):
+        if len(self.registers) <= _SPARSE_LIMIT:
+            return _SPARSE + b"".join(_PAIR.pack(index, rank) for index, rank in sorted(self.registers.items()))
+        dense = bytearray(REGISTERS)
+        for index, rank in self.registers.items():
+            dense[index] = rank
+        return _DENSE + bytes(dense)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        sketch = cls()
+        if not blob:
+            return sketch
+        kind, body = blob[:1], blob[1:]
+        if kind == _SPARSE:
+            sketch.registers = dict(_PAIR.iter_unpack(body))
+        elif kind == _DENSE:
+            sketch.registers = {index: rank for index, rank in enumerate(body) if rank}
+        else:
+            raise ValueError(f"Unknown HyperLogLog encoding: {kind!r}")
+        return sketch
+
+
+def merge_blobs(left, right):
+    # Registered as the SQLite function hll_merge(a, b), so an upsert can
+    # fold new visitors into a stored sketch without reading it back first
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return HyperLogLog.from_bytes(left).merge(HyperLogLog.from_bytes(right)).to_bytes()
+
+
+def register_sqlite_functions(dbapi_connection):
+    dbapi_connection.create_function("hll_merge", 2, merge_blobs, deterministic=True)
@@ -0,0 +1,154 @@
+import os
+import threading
+from collections import deque
+
+from . import crud
+from .database import SessionLocal
+
+# "async": redirects return as soon as the click is queued and a background
+#          thread flushes batches (a crash can lose up to one batch).
+# "sync":  every redirect flushes the queue before returning. Concurrent
+#          redirects still share a commit, but nothing is acknowledged unsaved.
+INGEST_DURABILITY = os.environ.get("LINKFLOW_INGEST_DURABILITY", "async")
+INGEST_BATCH_SIZE = int(os.environ.get("LINKFLOW_INGEST_BATCH_SIZE", 500))
+INGEST_FLUSH_INTERVAL = float(os.environ.get("LINKFLOW_INGEST_FLUSH_INTERVAL", 1.0))
+INGEST_MAX_QUEUE = int(os.environ.get("LINKFLOW_INGEST_MAX_QUEUE", 100000))
+
+
+class ClickIngestor:
+    """Write-behind queue for click events.
+
+    Records are plain tuples of (link_id, user_id, ip_address, user_agent,
+    referrer, timestamp). A flush writes every queued record and the summed
+    per-link click deltas in a single transaction. With a `sink` set, flushed
+    batches are passed to sink(batch) instead of being written here.
+    """
+
+    def __init__(self, session_factory, batch_size=500, flush_interval=1.0,
+                 durability="async", max_queue=100000, sink=None, lock=None):
+        if durability not in ("async", "sync"):
+            raise ValueError(f"Unknown ingest durability mode: {durability}")
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.max_queue = max_queue
+        self.sink = sink
+        self._queue = deque()
+        # Held while a batch is written; pass one in to serialize with other writes
+        self._flush_lock = lock or threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+
+    @property
+    def writes_through(self):
+        # True when enqueue() flushes (and so blocks) in the caller
+        return self.durability == "sync" or self._thread is None
+
+    def enqueue(self, record):
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return False
+        self._queue.append(record)
+        self.enqueued += 1
+        # Without a running flusher (sync mode, scripts, tests) write through
+        if self.writes_through:
+            self.flush()
+        elif len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def enqueue_many(self, records):
+        room = max(0, self.max_queue - len(self._queue))
+        accepted = records[:room]
+        self._queue.extend(accepted)
+        self.enqueued += len(accepted)
+        self.dropped += len(records) - len(accepted)
+        if self.writes_through:
+            self.flush()
+        elif len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        return len(accepted)
+
+    def _write(self, batch):
+        if self.sink is not None:
+            self.sink(batch)
+            return
+        db = self.session_factory()
+        try:
+            crud.ingest_clicks(db, batch)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def flush(self):
+        with self._flush_lock:
+            batch = []
+            while self._queue:
+                batch.append(self._queue.popleft())
+            if not batch:
+                return 0
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.failures += 1
+                # Put the batch back so the next flush retries it
+                self._queue.extendleft(reversed(batch))
+                print(f"❌ Click flush failed ({len(batch)} clicks requeued): {e}")
+                return 0
+
+            self.flushes += 1
+            self.flushed += len(batch)
+            return len(batch)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is not None or self.durability == "sync":
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="click-ingestor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        return {
+            "durability": self.durability,
+            "queued": len(self._queue),
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failures": self.failures,
+        }
+
+
+click_ingestor = ClickIngestor(
+    SessionLocal,
+    batch_size=INGEST_BATCH_SIZE,
+    flush_interval=INGEST_FLUSH_INTERVAL,
+    durability=INGEST_DURABILITY,
+    max_queue=INGEST_MAX_QUEUE,
+)
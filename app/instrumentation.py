@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# Requests slower than this are printed with their query breakdown; 0 disables
+SLOW_REQUEST_MS = float(os.environ.get("LINKFLOW_SLOW_REQUEST_MS", 500))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    __slots__ = ("queries", "commits", "db_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.commits = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+
+
+# Set by MetricsMiddleware for the duration of a request. Threadpool and
+# run_sync calls inherit the context, so SQL hooks see the same object.
+_current_request = ContextVar("linkflow_request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.latency = {}          # (method, route) -> Histogram
+        self.responses = Counter()  # (method, route, status) -> count
+        self.db_queries = Counter()  # route ("background" outside requests) -> count
+        self.db_commits = Counter()
+        self.db_seconds = Counter()
+        self.slow_requests = 0
+
+    def observe_request(self, method, route, status, seconds, stats):
+        with self._lock:
+            histogram = self.latency.get((method, route))
+            if histogram is None:
+                histogram = self.latency[(method, route)] = Histogram()
+            histogram.observe(seconds)
+            self.responses[(method, route, status)] += 1
+            self.db_queries[route] += stats.queries
+            self.db_commits[route] += stats.commits
+            self.db_seconds[route] += stats.db_seconds
+
+    def observe_background(self, queries=0, commits=0, seconds=0.0):
+        with self._lock:
+            self.db_queries["background"] += queries
+            self.db_commits["background"] += commits
+            self.db_seconds["background"] += seconds
+
+
+registry = MetricsRegistry()
+
+
+# SQLAlchemy hooks
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("linkflow_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["linkflow_query_start"].pop()
+    _record_query(statement, elapsed)
+
+
+def _handle_error(exception_context):
+    # Failed statements never reach after_cursor_execute
+    conn = exception_context.connection
+    starts = conn.info.get("linkflow_query_start") if conn is not None else None
+    if starts:
+        _record_query(exception_context.statement or "ERROR", time.perf_counter() - starts.pop())
+
+
+def _record_query(statement, elapsed):
+    stats = _current_request.get()
+    if stats is None:
+        registry.observe_background(queries=1, seconds=elapsed)
+        return
+    stats.queries += 1
+    stats.db_seconds += elapsed
+    verb = statement.lstrip().split(None, 1)
+    stats.statements[verb[0].upper() if verb else "?"] += 1
+
+
+def _commit(conn):
+    stats = _current_request.get()
+    if stats is None:
+        registry.observe_background(commits=1)
+    else:
+        stats.commits += 1
+
+
+def instrument_engine(sync_engine):
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    event.listen(sync_engine, "commit", _commit)
+
+
+# ASGI middleware
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        registry.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.in_flight -= 1
+            _current_request.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            registry.observe_request(scope["method"], route_path, status_holder[0], elapsed, stats)
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                registry.slow_requests += 1
+                breakdown = ", ".join(f"{count} {verb}" for verb, count in stats.statements.most_common())
+                print(
+                    f"🐢 Slow request {scope['method']} {scope['path']} ({route_path}) "
+                    f"{elapsed * 1000:.1f}ms: {stats.queries} queries ({breakdown or 'none'}), "
+                    f"{stats.commits} commits, {stats.db_seconds * 1000:.1f}ms in SQL"
+                )
+
+
+# Prometheus text exposition
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def render_metrics(metrics=None):
+    # metrics: {metric name: (kind, help text, {labels tuple or (): value})}.
+    # Counters are named with a _total suffix, as Prometheus expects.
+    lines = []
+
+    def header(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    with registry._lock:
+        header("linkflow_http_requests_in_flight", "gauge", "Requests currently being served.")
+        lines.append(f"linkflow_http_requests_in_flight {registry.in_flight}")
+
+        header("linkflow_http_request_duration_seconds", "histogram", "Request latency by route.")
+        for (method, route), histogram in sorted(registry.latency.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(
+                    f"linkflow_http_request_duration_seconds_bucket"
+                    f"{_labels(method=method, route=route, le=bound)} {cumulative}"
+                )
+            labels = _labels(method=method, route=route)
+            lines.append(f"linkflow_http_request_duration_seconds_sum{labels} {histogram.sum}")
+            lines.append(f"linkflow_http_request_duration_seconds_count{labels} {histogram.count}")
+
+        header("linkflow_http_responses_total", "counter", "Responses by route and status code.")
+        for (method, route, status), count in sorted(registry.responses.items()):
+            lines.append(f"linkflow_http_responses_total{_labels(method=method, route=route, status=status)} {count}")
+
+        header("linkflow_http_slow_requests_total", "counter", "Requests over LINKFLOW_SLOW_REQUEST_MS.")
+        lines.append(f"linkflow_http_slow_requests_total {registry.slow_requests}")
+
+        for name, counter, help_text in (
+            ("linkflow_db_queries_total", registry.db_queries, "SQL statements executed, by route."),
+            ("linkflow_db_commits_total", registry.db_commits, "Transactions committed, by route."),
+            ("linkflow_db_seconds_total", registry.db_seconds, "Time spent executing SQL, by route."),
+        ):
+            header(name, "counter", help_text)
+            for route, value in sorted(counter.items()):
+                lines.append(f"{name}{_labels(route=route)} {value}")
+
+    for name, (kind, help_text, samples) in (metrics or {}).items():
+        header(name, kind, help_text)
+        for labels, value in samples.items():
+            lines.append(f"{name}{_labels(**dict(labels)) if labels else ''} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,63 @@
+import os
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .cache import MISS, LRUCache
+from .chunking import chunks
+
+INTERN_CACHE_SIZE = int(os.environ.get("LINKFLOW_INTERN_CACHE_SIZE", 20000))
+
+
+class StringInterner:
+    """Maps repeated strings to ids in a value -> id lookup table.
+
+    Ids never change once assigned, so the cache has no TTL; only ids read
+    back after a commit are cached, so a rolled-back insert can't leak an id.
+    """
+
+    def __init__(self, model, maxsize=INTERN_CACHE_SIZE):
+        self.model = model
+        self.cache = LRUCache(maxsize=maxsize, ttl=float("inf"), negative_ttl=0)
+
+    def _lookup(self, db: Session, values):
+        found = {}
+        for chunk in chunks(values):
+            found.update(
+                (value, id_) for id_, value in
+                db.query(self.model.id, self.model.value).filter(self.model.value.in_(chunk))
+            )
+        return found
+
+    def intern(self, db: Session, values):
+        # Returns {value: id} for every non-None value. Commits if it had to
+        # add new strings, so call it before opening the caller's own writes.
+        ids = {}
+        missing = []
+        for value in set(values):
+            if value is None:
+                continue
+            id_ = self.cache.get(value)
+            if id_ is MISS:
+                missing.append(value)
+            else:
+                ids[value] = id_
+        if not missing:
+            return ids
+
+        found = self._lookup(db, missing)
+        new = [value for value in missing if value not in found]
+        if new:
+            # Another process may add the same string concurrently
+            db.execute(sqlite_insert(self.model).on_conflict_do_nothing(), [{"value": value} for value in new])
+            db.commit()
+            found.update(self._lookup(db, new))
+        for value, id_ in found.items():
+            self.cache.set(value, id_)
+        ids.update(found)
+        return ids
+
+
+user_agents = StringInterner(models.UserAgent)
+referrers = StringInterner(models.Referrer)
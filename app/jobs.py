@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class PeriodicJob:
+    """Runs func() on a daemon thread every `interval` seconds."""
+
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.runs = 0
+        self.failures = 0
+        self.last_duration = 0.0
+        self.last_result = None
+
+    def run_once(self):
+        with self._lock:
+            started = time.perf_counter()
+            try:
+                self.last_result = self.func()
+            except Exception as e:
+                self.failures += 1
+                print(f"❌ Job {self.name} failed: {e}")
+            finally:
+                self.runs += 1
+                self.last_duration = time.perf_counter() - started
+            return self.last_result
+
+    def _run(self, run_first):
+        if run_first:
+            self.run_once()
+        while not self._stopping.wait(self.interval):
+            self.run_once()
+
+    def start(self, run_first=False):
+        # run_first: run once on the job's thread right away, not after an interval
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, args=(run_first,), name=f"job-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_duration_seconds": round(self.last_duration, 6),
+            "last_result": self.last_result,
+        }
@@ -0,0 +1,188 @@
+import heapq
+import os
+import threading
+from datetime import datetime, timedelta
+
+# Largest n /links/top serves
+LEADERBOARD_MAX_N = int(os.environ.get("LINKFLOW_LEADERBOARD_MAX_N", 100))
+
+# Window name -> length in hours (None: all time). Windows slide by whole
+# hours: "24h" is the current hour plus the 23 before it.
+WINDOWS = {"24h": 24, "7d": 24 * 7, "all": None}
+LONGEST_WINDOW_HOURS = max(span for span in WINDOWS.values() if span)
+METRICS = ("clicks", "revenue")
+
+# Revenue totals are rounded to this many decimals, so that adding and then
+# subtracting an hour's amounts can't reorder equal totals or leave a residue
+_REVENUE_DIGITS = 6
+_EPSILON = 1e-9
+
+
+def _hour(ts):
+    return ts.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+class _Board:
+    """Scores of one ranking plus a max-heap over them.
+
+    Updates push a new heap entry and leave the old one behind; top() drops
+    stale entries as it meets them, and the heap is rebuilt once more than
+    half of it is stale. A read costs O(n log size), whatever the size.
+    """
+
+    def __init__(self):
+        self.scores = {}
+        self._heap = []  # (-score, link_id), possibly stale
+
+    def set(self, link_id, score):
+        if score > _EPSILON:
+            self.scores[link_id] = score
+            heapq.heappush(self._heap, (-score, link_id))
+        elif self.scores.pop(link_id, None) is None:
+            return
+        if len(self._heap) > 2 * len(self.scores) + 64:
+            self._heap = [(-score, link_id) for link_id, score in self.scores.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, n):
+        heap = self._heap
+        scores = self.scores
+        best = []
+        while heap and len(best) < n:
+            neg_score, link_id = heapq.heappop(heap)
+            # The same (score, link) can be in the heap twice; keep one
+            if scores.get(link_id) == -neg_score and (not best or best[-1] != (neg_score, link_id)):
+                best.append((neg_score, link_id))
+        for entry in best:
+            heapq.heappush(heap, entry)
+        return [link_id for _, link_id in best]
+
+
+class Leaderboards:
+    """Top links by clicks and by revenue, per user and overall, per window.
+
+    Per-link totals for every window are kept exactly: hourly buckets of the
+    last LONGEST_WINDOW_HOURS are subtracted from a window as they slide out
+    of it. Loaded by rollups.load_leaderboards() at startup and updated by
+    crud after each committed click or revenue write.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._boards = {}  # (user_id or None, metric, window) -> _Board
+        self._totals = {window: {} for window in WINDOWS}  # link_id -> [clicks, revenue]
+        self._hours = {}  # hour -> {link_id: [clicks, revenue]}
+        self._owners = {}  # link_id -> user_id
+        self._current_hour = None
+        # Per window: hours up to and including this one have left it
+        self._expired = {window: datetime.min for window in WINDOWS}
+        self.updates = 0
+
+    def _board(self, user_id, metric, window):
+        key = (user_id, metric, window)
+        board = self._boards.get(key)
+        if board is None:
+            board = self._boards[key] = _Board()
+        return board
+
+    def _bump(self, window, link_id, user_id, clicks, revenue):
+        totals = self._totals[window]
+        current = totals.get(link_id)
+        if current is None:
+            current = totals[link_id] = [0, 0.0]
+        current[0] += clicks
+        current[1] = round(current[1] + revenue, _REVENUE_DIGITS)
+        for metric, score, delta in (("clicks", current[0], clicks), ("revenue", current[1], revenue)):
+            if delta:
+                self._board(None, metric, window).set(link_id, score)
+                self._board(user_id, metric, window).set(link_id, score)
+        if current[0] <= 0 and abs(current[1]) <= _EPSILON:
+            del totals[link_id]
+
+    def _advance(self, now):
+        hour = _hour(now)
+        if hour == self._current_hour:
+            return
+        self._current_hour = hour
+        for window, span in WINDOWS.items():
+            if span is None:
+                continue
+            cutoff = hour - timedelta(hours=span)
+            for expired_hour in sorted(h for h in self._hours if self._expired[window] < h <= cutoff):
+                for link_id, (clicks, revenue) in self._hours[expired_hour].items():
+                    self._bump(window, link_id, self._owners[link_id], -clicks, -revenue)
+            self._expired[window] = max(self._expired[window], cutoff)
+        oldest = hour - timedelta(hours=LONGEST_WINDOW_HOURS)
+        for old_hour in [h for h in self._hours if h <= oldest]:
+            del self._hours[old_hour]
+
+    def _add(self, link_id, user_id, ts, clicks, revenue, all_time=True):
+        self._owners[link_id] = user_id
+        if all_time:
+            self._bump("all", link_id, user_id, clicks, revenue)
+        hour = _hour(ts)
+        if hour <= self._expired["7d"]:
+            return
+        bucket = self._hours.setdefault(hour, {}).setdefault(link_id, [0, 0.0])
+        bucket[0] += clicks
+        bucket[1] += revenue
+        for window, span in WINDOWS.items():
+            if span is not None and hour > self._expired[window]:
+                self._bump(window, link_id, user_id, clicks, revenue)
+
+    def load(self, links, hourly, now=None):
+        # links: (link_id, user_id, clicks, revenue) all-time counters;
+        # hourly: (link_id, user_id, hour, clicks, revenue) for recent hours
+        with self._lock:
+            self._reset()
+            self._advance(now or datetime.utcnow())
+            for link_id, user_id, clicks, revenue in links:
+                self._owners[link_id] = user_id
+                self._bump("all", link_id, user_id, clicks or 0, revenue or 0.0)
+            for link_id, user_id, hour, clicks, revenue in hourly:
+                self._add(link_id, user_id, hour, clicks or 0, revenue or 0.0, all_time=False)
+
+    def record(self, events, now=None):
+        # events: (link_id, user_id, timestamp, clicks, revenue), committed
+        with self._lock:
+            self._advance(now or datetime.utcnow())
+            for link_id, user_id, ts, clicks, revenue in events:
+                self._add(link_id, user_id, ts, clicks, revenue)
+                self.updates += 1
+
+    def remove_link(self, link_id):
+        with self._lock:
+            user_id = self._owners.pop(link_id, None)
+            if user_id is None:
+                return
+            for totals in self._totals.values():
+                totals.pop(link_id, None)
+            for (owner, _, _), board in self._boards.items():
+                if owner is None or owner == user_id:
+                    board.set(link_id, 0)
+            for bucket in self._hours.values():
+                bucket.pop(link_id, None)
+
+    def top(self, metric, window, n, user_id=None, now=None):
+        # -> [(link_id, clicks, revenue)], best first, ties by lowest link id
+        with self._lock:
+            self._advance(now or datetime.utcnow())
+            board = self._boards.get((user_id, metric, window))
+            if board is None:
+                return []
+            totals = self._totals[window]
+            return [(link_id, *totals[link_id]) for link_id in board.top(n)]
+
+    def stats(self):
+        return {
+            "links": len(self._owners),
+            "boards": len(self._boards),
+            "hours": len(self._hours),
+            "updates": self.updates,
+        }
+
+
+leaderboards = Leaderboards()
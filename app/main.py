@@ -1,18 +1,39 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, File, HTTPException, Query, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import RedirectResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import date, datetime, timedelta, timezone
+import codecs
+from itertools import islice
+import csv
 import os
 import json
+from functools import partial
 
-from . import crud, models, schemas
-from .database import SessionLocal, engine, get_db
-
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+from . import crud, hll, models, schemas
+from .attribution import ATTRIBUTION_INTERVAL, run_attribution
+from .assets import ASSET_CHECK_INTERVAL, AssetStore
+from .cache import MISS, link_cache, stats_cache
+from .clickfilter import click_filter
+from .export import export_filename, export_media_type, iter_export
+from .fastjson import FAST_JSON, FastJSONResponse
+from .fastpath import REDIRECT_FAST_PATH, REDIRECT_HEADERS, REDIRECT_STATUS, RedirectFastPath
+from .ingest import click_ingestor
+from .instrumentation import MetricsMiddleware, instrument_engine, render_metrics
+from .jobs import PeriodicJob
+from .leaderboard import LEADERBOARD_MAX_N, leaderboards
+from .migrations import missing_tables
+from .ratelimit import RateLimitMiddleware, rate_limiter
+from .pages import DASHBOARD_FALLBACK_HTML, INDEX_FALLBACK_HTML
+from .rollups import ROLLUP_INTERVAL, run_leaderboard_load, run_materializer
+from .retention import RETENTION_INTERVAL, archive_stats, iter_archived_clicks, run_retention
+from .database import engine, get_db, get_read_db, run_db_read, run_db_write, sync_engines
+from .writer import LINK_INVALIDATION_INTERVAL, writer_client
 
+# Importing this module does no I/O: tables, indexes and demo data are set
+# up beforehand by `python -m app.manage setup`, which run.py runs once
 app = FastAPI(
     title="LinkFlow Pro API",
     version="1.0.0",
@@ -20,6 +41,9 @@ app = FastAPI(
     redoc_url="/api/redoc"
 )
 
+# 429 for clients over their API rate; inside CORS so browsers can read it
+app.add_middleware(RateLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -27,180 +51,111 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Worker processes hand their click batches to the writer process
+if writer_client is not None:
+    click_ingestor.sink = writer_client.ingest_clicks
+
+# /r/{short_code} handled ahead of routing; redirect_link below is the fallback
+if REDIRECT_FAST_PATH:
+    app.add_middleware(RedirectFastPath)
+
+# Per-route latency and per-request SQL accounting, served at /metrics
+for instrumented_engine in sync_engines():
+    instrument_engine(instrumented_engine)
+app.add_middleware(MetricsMiddleware)
+
 # Get the absolute path to the frontend directory
 current_dir = os.path.dirname(os.path.abspath(__file__))
 backend_dir = os.path.dirname(current_dir)
 project_root = os.path.dirname(backend_dir)
 frontend_dir = os.path.join(project_root, "frontend")
 
-print(f"🔍 Frontend directory: {frontend_dir}")
-print(f"🔍 Project root: {project_root}")
-
-# Create frontend directory if it doesn't exist
-os.makedirs(frontend_dir, exist_ok=True)
-os.makedirs(os.path.join(frontend_dir, "css"), exist_ok=True)
-os.makedirs(os.path.join(frontend_dir, "js"), exist_ok=True)
-
-# Mount static files
-app.mount("/static", StaticFiles(directory=frontend_dir), name="static")
+# Frontend files and fallback pages, precompressed and served from memory.
+# The asset job loads them when the app starts; a missing directory just
+# means the fallbacks.
+frontend_assets = AssetStore(frontend_dir, fallbacks={
+    "index.html": INDEX_FALLBACK_HTML,
+    "dashboard.html": DASHBOARD_FALLBACK_HTML,
+})
 
 # In-memory user session (for demo purposes)
 current_user_id = 1  # Demo user ID
 
-# Create demo user and links on startup
+# Background jobs
+rollup_job = PeriodicJob("rollups", run_materializer, ROLLUP_INTERVAL)
+retention_job = PeriodicJob("retention", run_retention, RETENTION_INTERVAL)
+attribution_job = PeriodicJob("attribution", run_attribution, ATTRIBUTION_INTERVAL)
+asset_job = PeriodicJob("assets", frontend_assets.refresh, ASSET_CHECK_INTERVAL)
+# Under run.py's worker mode, links deleted through other workers
+invalidation_job = (
+    PeriodicJob("link_invalidations", partial(writer_client.sync_invalidations, link_cache, stats_cache),
+                LINK_INVALIDATION_INTERVAL)
+    if writer_client is not None else None
+)
+
 @app.on_event("startup")
-def startup_event():
-    db = SessionLocal()
-    try:
-        # Create demo user if not exists
-        demo_user = crud.get_user_by_email(db, email="demo@linkflow.pro")
-        if not demo_user:
-            user_data = schemas.UserCreate(
-                email="demo@linkflow.pro",
-                username="demo",
-                password="demo123"
-            )
-            crud.create_user(db=db, user=user_data)
-            print("✅ Demo user created")
-        
-        # Create some demo links if none exist
-        user_links = crud.get_user_links(db, user_id=current_user_id)
-        if not user_links:
-            demo_links = [
-                schemas.AffiliateLinkCreate(
-                    title="Amazon Summer Sale",
-                    destination_url="https://amazon.com",
-                    category="affiliate"
-                ),
-                schemas.AffiliateLinkCreate(
-                    title="Tech Gadgets Affiliate",
-                    destination_url="https://bestbuy.com",
-                    category="affiliate"
-                ),
-                schemas.AffiliateLinkCreate(
-                    title="Fitness Equipment Promo",
-                    destination_url="https://example.com/fitness",
-                    category="affiliate"
-                )
-            ]
-            for link_data in demo_links:
-                crud.create_affiliate_link(db=db, link=link_data, user_id=current_user_id)
-            print("✅ Demo links created")
-        
-        print("✅ Database initialized successfully")
-        
-        # Print available routes
-        print("🌐 Available routes:")
-        print("   http://localhost:8000/ - Landing page")
-        print("   http://localhost:8000/dashboard - Dashboard")
-        print("   http://localhost:8000/api/docs - API Documentation")
-        print("   http://localhost:8000/health - Health check")
-        
-    except Exception as e:
-        print(f"❌ Error during startup: {e}")
-    finally:
-        db.close()
+def check_schema():
+    # One query; creating what's missing is `python -m app.manage migrate`'s job
+    missing = missing_tables(engine)
+    if missing:
+        print(f"❌ Database is missing tables ({', '.join(missing)}); run: python -m app.manage setup")
+
+@app.on_event("startup")
+def start_background_workers():
+    click_ingestor.start()
+    # Compressing the assets takes a while; it happens on the job's thread
+    asset_job.start(run_first=True)
+    # Rollups, retention and attribution write, so under run.py's worker mode
+    # they run in the writer process instead, as do the leaderboards clicks feed
+    if writer_client is None:
+        run_leaderboard_load()
+        rollup_job.start()
+        retention_job.start()
+        attribution_job.start()
+    else:
+        invalidation_job.start(run_first=True)
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Flush whatever is still queued before the process exits
+    click_ingestor.stop()
+    asset_job.stop()
+    if writer_client is None:
+        rollup_job.stop()
+        rollup_job.run_once()
+        retention_job.stop()
+        attribution_job.stop()
+    else:
+        invalidation_job.stop()
+
+async def _loaded_assets():
+    # Requests that beat the asset job's first scan (or arrive without the
+    # job, e.g. LINKFLOW_ASSET_CHECK_INTERVAL=0) load them off the event loop
+    if not frontend_assets.scans:
+        await run_in_threadpool(frontend_assets.refresh)
+    return frontend_assets
 
 # Serve frontend files
 @app.get("/")
-async def read_root():
-    index_path = os.path.join(frontend_dir, "index.html")
-    if os.path.exists(index_path):
-        return FileResponse(index_path)
-    else:
-        # Return a simple HTML response if index.html doesn't exist
-        html_content = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>LinkFlow Pro</title>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 40px; background: #0f172a; color: white; }
-                .container { max-width: 800px; margin: 0 auto; text-align: center; }
-                .logo { font-size: 3em; font-weight: bold; background: linear-gradient(135deg, #4361ee, #7209b7); 
-                        -webkit-background-clip: text; -webkit-text-fill-color: transparent; }
-                .links { margin: 20px 0; }
-                .links a { display: inline-block; margin: 10px; padding: 12px 24px; background: #4361ee; 
-                          color: white; text-decoration: none; border-radius: 8px; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="logo">LinkFlow Pro</div>
-                <h1>Affiliate Link Management SaaS</h1>
-                <p>Your backend is running! Frontend files are missing.</p>
-                <div class="links">
-                    <a href="/dashboard">Go to Dashboard</a>
-                    <a href="/api/docs">API Documentation</a>
-                    <a href="/health">Health Check</a>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        return HTMLResponse(html_content)
+async def read_root(request: Request):
+    assets = await _loaded_assets()
+    return assets.response(assets.page("index.html"), request)
 
 @app.get("/dashboard")
-async def read_dashboard():
-    dashboard_path = os.path.join(frontend_dir, "dashboard.html")
-    if os.path.exists(dashboard_path):
-        return FileResponse(dashboard_path)
-    else:
-        # Return a simple dashboard if file doesn't exist
-        html_content = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Dashboard - LinkFlow Pro</title>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 0; background: #0f172a; color: white; }
-                .sidebar { width: 250px; height: 100vh; background: #1e293b; padding: 20px; float: left; }
-                .main { margin-left: 250px; padding: 20px; }
-                .logo { font-size: 1.5em; font-weight: bold; margin-bottom: 30px; }
-                .nav a { display: block; padding: 10px; color: #94a3b8; text-decoration: none; }
-                .nav a.active { color: white; background: #4361ee; border-radius: 5px; }
-                .metric { background: #1e293b; padding: 20px; border-radius: 8px; margin: 10px; display: inline-block; width: 200px; }
-            </style>
-        </head>
-        <body>
-            <div class="sidebar">
-                <div class="logo">LinkFlow Pro</div>
-                <div class="nav">
-                    <a href="#" class="active">Dashboard</a>
-                    <a href="#">My Links</a>
-                    <a href="#">Analytics</a>
-                </div>
-            </div>
-            <div class="main">
-                <h1>Dashboard</h1>
-                <p>Backend is working! Frontend dashboard file is missing.</p>
-                <div class="metric">
-                    <h3>Total Links</h3>
-                    <div id="totalLinks">Loading...</div>
-                </div>
-                <div class="metric">
-                    <h3>Total Clicks</h3>
-                    <div id="totalClicks">Loading...</div>
-                </div>
-            </div>
-            <script>
-                // Load stats from API
-                fetch('/dashboard/stats')
-                    .then(r => r.json())
-                    .then(stats => {
-                        document.getElementById('totalLinks').textContent = stats.total_links;
-                        document.getElementById('totalClicks').textContent = stats.total_clicks;
-                    });
-            </script>
-        </body>
-        </html>
-        """
-        return HTMLResponse(html_content)
-
-# Import HTMLResponse
-from fastapi.responses import HTMLResponse
+async def read_dashboard(request: Request):
+    assets = await _loaded_assets()
+    return assets.response(assets.page("dashboard.html"), request)
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"], name="static", include_in_schema=False)
+async def read_static(path: str, request: Request):
+    assets = await _loaded_assets()
+    response = assets.response(assets.get(path), request)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return response
 
 # API Routes (keep all your existing API endpoints)
 @app.post("/users/", response_model=schemas.User)
@@ -211,7 +166,7 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return crud.create_user(db=db, user=user)
 
 @app.get("/users/me", response_model=schemas.User)
-def read_users_me(db: Session = Depends(get_db)):
+def read_users_me(db: Session = Depends(get_read_db)):
     user = db.query(models.User).filter(models.User.id == current_user_id).first()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -224,13 +179,76 @@ def create_link(link: schemas.AffiliateLinkCreate, db: Session = Depends(get_db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating link: {str(e)}")
 
+@app.post("/links/bulk", response_model=schemas.BulkLinkResult)
+def create_links_bulk(bulk: schemas.BulkLinkCreate, db: Session = Depends(get_db)):
+    return crud.create_affiliate_links_bulk(db, bulk.links, user_id=current_user_id)
+
+@app.post("/links/import", response_model=schemas.BulkLinkResult)
+def import_links_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    # CSV with a header row: title, destination_url[, category]. The upload is
+    # spooled to disk by Starlette and read row by row from there.
+    # Invalid UTF-8 is kept as surrogates and reported on its row
+    rows = csv.DictReader(codecs.iterdecode(file.file, "utf-8-sig", errors="surrogateescape"))
+    try:
+        fieldnames = rows.fieldnames
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f"Malformed CSV header: {e}")
+    if fieldnames is None or not {"title", "destination_url"} <= set(fieldnames):
+        raise HTTPException(status_code=400, detail="CSV header must include title and destination_url")
+    return crud.create_affiliate_links_bulk(db, crud.iter_csv_rows(rows), user_id=current_user_id,
+                                            return_links=False)
+
 @app.get("/links/", response_model=List[schemas.AffiliateLink])
-def read_links(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    links = crud.get_user_links(db, user_id=current_user_id, skip=skip, limit=limit)
+async def read_links(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    order_by: str = Query("id", pattern="^(id|created_at)$")
+):
+    try:
+        links, next_cursor = await run_db_read(
+            crud.get_user_link_rows_page if FAST_JSON else crud.get_user_links_page,
+            user_id=current_user_id, skip=skip, limit=limit, cursor=cursor, order_by=order_by
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    # Clients pass this back as ?cursor= for the next page
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if FAST_JSON:
+        return FastJSONResponse([dict(zip(crud.LINK_ROW_FIELDS, link)) for link in links], headers=headers)
+    response.headers.update(headers)
     return links
 
+# Declared before /links/{link_id} so "top" isn't taken for a link id
+@app.get("/links/top", response_model=schemas.TopLinks)
+async def read_top_links(
+    by: str = Query("clicks", pattern="^(clicks|revenue)$"),
+    window: str = Query("7d", pattern="^(24h|7d|all)$"),
+    n: int = Query(10, ge=1, le=LEADERBOARD_MAX_N),
+    scope: str = Query("account", pattern="^(account|global)$")
+):
+    user_id = current_user_id if scope == "account" else None
+    if writer_client is not None:
+        ranked = await run_in_threadpool(writer_client.top_links, by, window, n, user_id)
+    else:
+        ranked = leaderboards.top(by, window, n, user_id)
+    ids = [link_id for link_id, _, _ in ranked]
+    titles = await run_db_read(crud.get_link_titles, ids, user_id) if ranked else {}
+    links = []
+    for link_id, clicks, revenue in ranked:
+        if link_id not in titles:
+            continue
+        owner, title, short_code = titles[link_id]
+        if owner != current_user_id:
+            # Other accounts' links are ranked, but not named
+            title = short_code = None
+        links.append({"link_id": link_id, "title": title, "short_code": short_code,
+                      "clicks": clicks, "revenue": revenue})
+    return {"by": by, "window": window, "scope": scope, "links": links}
+
 @app.get("/links/{link_id}", response_model=schemas.AffiliateLink)
-def read_link(link_id: int, db: Session = Depends(get_db)):
+def read_link(link_id: int, db: Session = Depends(get_read_db)):
     link = crud.get_link_by_id(db, link_id=link_id)
     if link is None or link.user_id != current_user_id:
         raise HTTPException(status_code=404, detail="Link not found")
@@ -238,60 +256,212 @@ def read_link(link_id: int, db: Session = Depends(get_db)):
 
 @app.delete("/links/{link_id}")
 def delete_link(link_id: int, db: Session = Depends(get_db)):
-    success = crud.delete_link(db, link_id=link_id, user_id=current_user_id)
-    if not success:
+    short_code = crud.delete_link(db, link_id=link_id, user_id=current_user_id)
+    if short_code is None:
         raise HTTPException(status_code=404, detail="Link not found")
+    if writer_client is not None:
+        # Off the writer's leaderboards and out of the other workers' caches
+        writer_client.remove_link(link_id, current_user_id, short_code)
     return {"message": "Link deleted successfully"}
 
 @app.get("/r/{short_code}")
-def redirect_link(short_code: str, request: Request, db: Session = Depends(get_db)):
-    link = crud.get_link_by_short_code(db, short_code=short_code)
+async def redirect_link(short_code: str, request: Request):
+    link = link_cache.get(short_code)
+    if link is MISS:
+        link = await run_db_read(crud.load_short_code, short_code)
     if link is None:
         raise HTTPException(status_code=404, detail="Link not found")
     
-    click_data = schemas.ClickEventCreate(
-        link_id=link.id,
-        ip_address=request.client.host,
-        user_agent=request.headers.get("user-agent"),
-        referrer=request.headers.get("referer")
-    )
-    crud.create_click_event(db, click=click_data)
-    crud.update_link_clicks(db, link_id=link.id)
+    # Bots, repeat hits and throttled clients still get redirected, they
+    # just aren't counted
+    ip_address = request.client.host
+    user_agent = request.headers.get("user-agent")
+    if (rate_limiter.allow_redirect(ip_address, short_code)
+            and click_filter.check(link.link_id, ip_address, user_agent) is None):
+        record = (
+            link.link_id,
+            link.user_id,
+            ip_address,
+            user_agent,
+            request.headers.get("referer"),
+            datetime.utcnow()
+        )
+        if click_ingestor.writes_through:
+            await run_in_threadpool(click_ingestor.enqueue, record)
+        else:
+            click_ingestor.enqueue(record)
     
-    return RedirectResponse(url=link.destination_url)
+    return RedirectResponse(url=link.destination_url, status_code=REDIRECT_STATUS, headers=REDIRECT_HEADERS)
 
 @app.get("/dashboard/stats", response_model=schemas.DashboardStats)
-def get_dashboard_stats(db: Session = Depends(get_db)):
-    stats = crud.get_dashboard_stats(db, user_id=current_user_id)
+async def get_dashboard_stats():
+    stats = await run_db_read(crud.get_dashboard_stats, user_id=current_user_id)
+    if FAST_JSON:
+        return FastJSONResponse(stats)
     return stats
 
 @app.get("/links/{link_id}/stats")
-def get_link_stats(link_id: int, db: Session = Depends(get_db)):
-    stats = crud.get_link_stats(db, link_id=link_id, user_id=current_user_id)
+async def get_link_stats(link_id: int):
+    stats = await run_db_read(crud.get_link_stats, link_id=link_id, user_id=current_user_id)
     if stats is None:
         raise HTTPException(status_code=404, detail="Link not found")
+    if FAST_JSON:
+        return FastJSONResponse(stats)
     return stats
 
+@app.get("/dashboard/stats/unique-visitors", response_model=schemas.UniqueVisitors)
+async def get_dashboard_unique_visitors(
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to")
+):
+    # Days in [from, to); either bound may be left open
+    visitors = await run_db_read(crud.get_unique_visitors, current_user_id, start=start, end=end)
+    return {"start": start, "end": end, "unique_visitors": visitors, "relative_error": hll.RELATIVE_ERROR}
+
+@app.get("/links/{link_id}/stats/unique-visitors", response_model=schemas.UniqueVisitors)
+async def get_link_unique_visitors(
+    link_id: int,
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to")
+):
+    if not await run_db_read(crud.user_owns_link, link_id, current_user_id):
+        raise HTTPException(status_code=404, detail="Link not found")
+    visitors = await run_db_read(crud.get_unique_visitors, current_user_id, link_id=link_id, start=start, end=end)
+    return {
+        "link_id": link_id,
+        "start": start,
+        "end": end,
+        "unique_visitors": visitors,
+        "relative_error": hll.RELATIVE_ERROR
+    }
+
+def _naive_utc(value: Optional[datetime]):
+    # Events are stored as naive UTC; "...Z" or "+02:00" query values are
+    # converted to match, naive ones are taken to be UTC already
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _series_range(start: Optional[datetime], end: Optional[datetime]):
+    start, end = _naive_utc(start), _naive_utc(end)
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    return start, end
+
+@app.get("/links/{link_id}/stats/timeseries", response_model=schemas.StatsSeries)
+async def get_link_timeseries(
+    link_id: int,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    granularity: str = Query("day", pattern="^(hour|day)$")
+):
+    start, end = _series_range(start, end)
+    points = await run_db_read(crud.get_link_timeseries, link_id, current_user_id, start, end, granularity)
+    if points is None:
+        raise HTTPException(status_code=404, detail="Link not found")
+    series = {"link_id": link_id, "granularity": granularity, "start": start, "end": end, "points": points}
+    if FAST_JSON:
+        return FastJSONResponse(series)
+    return series
+
+@app.get("/dashboard/stats/timeseries", response_model=schemas.StatsSeries)
+async def get_dashboard_timeseries(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    granularity: str = Query("day", pattern="^(hour|day)$")
+):
+    start, end = _series_range(start, end)
+    points = await run_db_read(crud.get_user_timeseries, current_user_id, start, end, granularity)
+    series = {"link_id": None, "granularity": granularity, "start": start, "end": end, "points": points}
+    if FAST_JSON:
+        return FastJSONResponse(series)
+    return series
+
+async def _track_revenue(events):
+    if writer_client is not None:
+        return await run_in_threadpool(writer_client.track_revenue, events, current_user_id)
+    return await run_db_write(crud.track_revenue_events, events, user_id=current_user_id)
+
 @app.post("/revenue/")
-def track_revenue(revenue: schemas.RevenueEventCreate, db: Session = Depends(get_db)):
-    link = crud.get_link_by_id(db, link_id=revenue.link_id)
-    if link is None or link.user_id != current_user_id:
+async def track_revenue(revenue: schemas.RevenueEventCreate):
+    result = await _track_revenue([revenue])
+    if result["unknown_links"]:
         raise HTTPException(status_code=404, detail="Link not found")
-    
-    crud.update_link_revenue(db, link_id=revenue.link_id, amount=revenue.amount)
-    
-    db_revenue = models.RevenueEvent(
-        link_id=revenue.link_id,
-        amount=revenue.amount,
-        currency=revenue.currency,
-        transaction_id=revenue.transaction_id
-    )
-    db.add(db_revenue)
-    db.commit()
-    db.refresh(db_revenue)
+    if result["duplicates"]:
+        return {"message": "Revenue already tracked for this transaction"}
     
     return {"message": "Revenue tracked successfully"}
 
+@app.post("/revenue/batch", response_model=schemas.RevenueBatchResult)
+async def track_revenue_batch(batch: schemas.RevenueBatch):
+    return await _track_revenue(batch.events)
+
+# Raw event export for the warehouse. Streams in constant memory; rows are in
+# id order, so a broken download resumes with ?after_id=<last id received>.
+async def _export(kind, fmt, compress, after_id, link_id, start, end):
+    start, end = _naive_utc(start), _naive_utc(end)
+    if start and end and start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    if link_id is not None and not await run_db_read(crud.user_owns_link, link_id, current_user_id):
+        raise HTTPException(status_code=404, detail="Link not found")
+    return StreamingResponse(
+        iter_export(kind, current_user_id, fmt, compress, after_id=after_id,
+                    link_id=link_id, start=start, end=end),
+        media_type=export_media_type(fmt, compress),
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(kind, fmt, compress)}"'}
+    )
+
+@app.get("/export/clicks")
+async def export_clicks(
+    link_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    after_id: int = Query(0, ge=0),
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    compress: bool = True
+):
+    return await _export("clicks", format, compress, after_id, link_id, start, end)
+
+@app.get("/export/revenue")
+async def export_revenue(
+    link_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    after_id: int = Query(0, ge=0),
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    compress: bool = True
+):
+    return await _export("revenue", format, compress, after_id, link_id, start, end)
+
+# Raw clicks moved out of click_events by the retention job
+@app.get("/links/{link_id}/clicks/archive", response_model=schemas.ClickHistory)
+async def read_archived_clicks(
+    link_id: int,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(1000, ge=1, le=10000)
+):
+    if not await run_db_read(crud.user_owns_link, link_id, current_user_id):
+        raise HTTPException(status_code=404, detail="Link not found")
+    clicks = await run_in_threadpool(lambda: list(islice(iter_archived_clicks(link_id, start, end), limit + 1)))
+    return {
+        "link_id": link_id,
+        "start": start,
+        "end": end,
+        "clicks": clicks[:limit],
+        "truncated": len(clicks) > limit
+    }
+
+@app.get("/ratelimit/stats")
+def ratelimit_stats():
+    return rate_limiter.stats()
+
+@app.get("/retention/stats")
+def retention_stats():
+    return {"job": retention_job.stats(), "archive": archive_stats()}
+
 @app.get("/health")
 def health_check():
     return {
@@ -302,6 +472,53 @@ def health_check():
         "frontend_exists": os.path.exists(frontend_dir)
     }
 
+@app.get("/cache/stats")
+def cache_stats():
+    return {"links": link_cache.stats(), "stats": stats_cache.stats(), "assets": frontend_assets.stats()}
+
+@app.get("/ingest/stats")
+def ingest_stats():
+    if writer_client is not None:
+        return {"clicks": click_ingestor.stats(), "filter": click_filter.stats(),
+                "invalidations": invalidation_job.stats(), "writer": writer_client.stats()}
+    return {"clicks": click_ingestor.stats(), "filter": click_filter.stats(), "rollups": rollup_job.stats(),
+            "attribution": attribution_job.stats(), "leaderboards": leaderboards.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    link_stats = link_cache.stats()
+    snapshot_stats = stats_cache.stats()
+    ingest = click_ingestor.stats()
+    filtered = click_filter.stats()
+    limiters = rate_limiter.stats()
+    extra = {
+        "linkflow_cache_entries": ("gauge", "Entries held per cache.", {
+            (("cache", "links"),): link_stats["size"],
+            (("cache", "stats"),): snapshot_stats["size"],
+        }),
+        "linkflow_cache_lookups_total": ("counter", "Cache lookups by outcome since start.", {
+            (("cache", name), ("outcome", outcome)): stats[outcome]
+            for name, stats in (("links", link_stats), ("stats", snapshot_stats))
+            for outcome in ("hits", "negative_hits", "misses", "evictions", "expirations")
+        }),
+        "linkflow_ingest_queue_depth": ("gauge", "Clicks waiting to be flushed.", {(): ingest["queued"]}),
+        "linkflow_ingest_clicks_total": ("counter", "Click ingestion counters since start.", {
+            (("state", state),): ingest[state] for state in ("enqueued", "flushed", "dropped", "failures")
+        }),
+        "linkflow_clicks_filtered_total": ("counter", "Redirects by click filter verdict since start.", {
+            (("verdict", "accepted"),): filtered["accepted"],
+            **{(("verdict", reason),): count for reason, count in filtered["rejected"].items()},
+        }),
+        "linkflow_rate_limited_total": ("counter", "Requests by rate limiter and outcome since start.", {
+            (("limiter", name), ("outcome", outcome)): limiters[name][outcome]
+            for name in rate_limiter.limiters for outcome in ("allowed", "rejected")
+        }),
+        "linkflow_rate_limit_keys": ("gauge", "Keys tracked per rate limiter.", {
+            (("limiter", name),): limiters[name]["keys"] for name in rate_limiter.limiters
+        }),
+    }
+    return PlainTextResponse(render_metrics(extra), media_type="text/plain; version=0.0.4")
+
 @app.get("/api")
 def api_root():
     return {
@@ -316,7 +533,7 @@ def api_root():
     }
 
 @app.get("/test-db")
-def test_database(db: Session = Depends(get_db)):
+def test_database(db: Session = Depends(get_read_db)):
     try:
         user_count = db.query(models.User).count()
         link_count = db.query(models.AffiliateLink).count()
@@ -0,0 +1,68 @@
+"""One-off setup steps, run once per deploy rather than on every boot.
+
+    python -m app.manage migrate   # tables, new columns and indexes, backfills
+    python -m app.manage seed      # demo user and links, if missing
+    python -m app.manage setup     # both
+
+run.py does `setup` before starting the server unless LINKFLOW_SETUP_ON_START=0.
+"""
+import argparse
+
+from . import crud, models, schemas
+from .database import SessionLocal, engine
+from .migrations import run_migrations
+
+DEMO_EMAIL = "demo@linkflow.pro"
+DEMO_LINKS = [
+    {"title": "Amazon Summer Sale", "destination_url": "https://amazon.com", "category": "affiliate"},
+    {"title": "Tech Gadgets Affiliate", "destination_url": "https://bestbuy.com", "category": "affiliate"},
+    {"title": "Fitness Equipment Promo", "destination_url": "https://example.com/fitness", "category": "affiliate"},
+]
+
+
+def migrate():
+    run_migrations(engine)
+    print("✅ Database migrated")
+
+
+def seed_demo_data():
+    # Two indexed lookups when the demo data is already there
+    db = SessionLocal()
+    try:
+        demo_user = crud.get_user_by_email(db, email=DEMO_EMAIL)
+        if not demo_user:
+            demo_user = crud.create_user(db=db, user=schemas.UserCreate(
+                email=DEMO_EMAIL,
+                username="demo",
+                password="demo123"
+            ))
+            print("✅ Demo user created")
+
+        has_links = db.query(models.AffiliateLink.id).filter(
+            models.AffiliateLink.user_id == demo_user.id
+        ).first() is not None
+        if not has_links:
+            # One transaction for all of them
+            crud.create_affiliate_links_bulk(db, DEMO_LINKS, user_id=demo_user.id, return_links=False)
+            print("✅ Demo links created")
+    finally:
+        db.close()
+
+
+def setup():
+    migrate()
+    seed_demo_data()
+
+
+COMMANDS = {"migrate": migrate, "seed": seed_demo_data, "setup": setup}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage", description="LinkFlow setup steps")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args(argv)
+    COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    main()
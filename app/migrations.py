@@ -0,0 +1,179 @@
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import crud, hll, interning, models
+from .chunking import chunks
+
+CLICK_STRINGS_BACKFILL_BATCH = 10000
+CLICK_STRINGS_CURSOR = "backfill_click_strings"
+VISITOR_SKETCH_BACKFILL_BATCH = 50000
+VISITOR_SKETCH_CURSOR = "backfill_visitor_sketches"
+VISITOR_TOTALS_CURSOR = "backfill_visitor_totals"
+
+
+def ensure_columns(engine):
+    # create_all never adds columns to an existing table either. Only
+    # nullable columns without defaults are expected here, which SQLite's
+    # ALTER TABLE ADD COLUMN handles without rewriting the table.
+    inspector = inspect(engine)
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as connection:
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+            print(f"✅ Added column {table.name}.{column.name}")
+
+
+def ensure_indexes(engine):
+    # create_all only builds indexes together with a new table, so an existing
+    # affiliate.db never picks up indexes added to app/models.py later on.
+    inspector = inspect(engine)
+    for table in models.Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=engine)
+                print(f"✅ Created index {index.name}")
+            except IntegrityError as e:
+                # e.g. a unique index over rows that already hold duplicates
+                print(f"⚠️ Could not create index {index.name}: {e.orig}")
+
+
+def enable_incremental_vacuum(engine):
+    # auto_vacuum can only be switched on before the first table is created
+    # (or by a full VACUUM), so only brand new databases get it here. With it
+    # the retention job hands freed pages back a batch at a time.
+    with engine.connect() as connection:
+        if not inspect(connection).get_table_names():
+            connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+
+
+def backfill_click_strings(engine, batch_size=CLICK_STRINGS_BACKFILL_BATCH):
+    # click_events used to store user_agent and referrer as text on every
+    # row. Move those strings into the lookup tables, a batch per
+    # transaction, and clear the old columns; a VACUUM afterwards returns the
+    # space. The cursor makes reruns (and every later startup) cheap.
+    columns = {column["name"] for column in inspect(engine).get_columns("click_events")}
+    if "user_agent" not in columns:
+        return
+    db = Session(bind=engine)
+    try:
+        after_id = crud.get_job_cursor(db, CLICK_STRINGS_CURSOR)
+        moved = 0
+        while True:
+            rows = db.execute(text(
+                "SELECT id, user_agent, referrer FROM click_events "
+                "WHERE id > :after_id AND (user_agent IS NOT NULL OR referrer IS NOT NULL) "
+                "ORDER BY id LIMIT :limit"
+            ), {"after_id": after_id, "limit": batch_size}).all()
+            db.rollback()
+            if rows:
+                user_agent_ids = interning.user_agents.intern(db, (row[1] for row in rows))
+                referrer_ids = interning.referrers.intern(db, (row[2] for row in rows))
+                db.execute(text(
+                    "UPDATE click_events SET user_agent_id = :user_agent_id, referrer_id = :referrer_id, "
+                    "user_agent = NULL, referrer = NULL WHERE id = :id"
+                ), [
+                    {"id": id_, "user_agent_id": user_agent_ids.get(user_agent), "referrer_id": referrer_ids.get(referrer)}
+                    for id_, user_agent, referrer in rows
+                ])
+                after_id = rows[-1][0]
+                moved += len(rows)
+            else:
+                # New rows never fill the old columns, so the scan can stop here for good
+                after_id = db.execute(text("SELECT coalesce(max(id), 0) FROM click_events")).scalar()
+            crud.set_job_cursor(db, CLICK_STRINGS_CURSOR, after_id)
+            db.commit()
+            if not rows:
+                break
+            print(f"🔄 Interned click strings up to id {after_id}")
+        if moved:
+            print(f"✅ Moved user agents and referrers of {moved} clicks to lookup tables")
+    finally:
+        db.close()
+
+
+def backfill_visitor_sketches(engine, batch_size=VISITOR_SKETCH_BACKFILL_BATCH):
+    # Clicks stored before the sketch tables existed. Ingestion covers every
+    # id after the end mark recorded on the first run; merging a click twice
+    # is harmless, so an interrupted backfill just picks up where it was.
+    db = Session(bind=engine)
+    try:
+        end = db.get(models.JobCursor, VISITOR_SKETCH_CURSOR + "_end")
+        if end is None:
+            end_id = db.query(func.coalesce(func.max(models.ClickEvent.id), 0)).scalar()
+            crud.set_job_cursor(db, VISITOR_SKETCH_CURSOR + "_end", end_id)
+            db.commit()
+        else:
+            end_id = end.last_id
+        after_id = crud.get_job_cursor(db, VISITOR_SKETCH_CURSOR)
+        while after_id < end_id:
+            high = min(end_id, after_id + batch_size)
+            rows = db.query(
+                models.ClickEvent.link_id,
+                models.AffiliateLink.user_id,
+                models.ClickEvent.ip_address,
+                models.ClickEvent.timestamp
+            ).join(
+                models.AffiliateLink, models.AffiliateLink.id == models.ClickEvent.link_id
+            ).filter(
+                models.ClickEvent.id > after_id,
+                models.ClickEvent.id <= high
+            ).all()
+            crud.update_visitor_sketches(db, rows)
+            crud.set_job_cursor(db, VISITOR_SKETCH_CURSOR, high)
+            db.commit()
+            after_id = high
+            print(f"🔄 Built unique-visitor sketches up to click id {after_id}")
+    finally:
+        db.close()
+
+
+def backfill_visitor_totals(engine):
+    # The all-time sketches (crud.ALL_TIME_SKETCH_DAY) of databases whose day
+    # sketches predate them: one pass merging each owner's days. Merging is
+    # idempotent, so totals that already hold some of those days are fine.
+    db = Session(bind=engine)
+    try:
+        if crud.get_job_cursor(db, VISITOR_TOTALS_CURSOR):
+            return
+        for model, owner in ((models.LinkVisitorSketch, "link_id"), (models.UserVisitorSketch, "user_id")):
+            owner_column = getattr(model, owner)
+            owner_ids = [row[0] for row in db.query(owner_column).distinct()]
+            for chunk in chunks(owner_ids):
+                totals = {}
+                for owner_id, blob in db.query(owner_column, model.sketch).filter(
+                    owner_column.in_(chunk), model.day > crud.ALL_TIME_SKETCH_DAY
+                ):
+                    total = totals.get((owner_id, crud.ALL_TIME_SKETCH_DAY))
+                    if total is None:
+                        total = totals[(owner_id, crud.ALL_TIME_SKETCH_DAY)] = hll.HyperLogLog()
+                    total.merge(hll.HyperLogLog.from_bytes(blob))
+                crud._merge_sketches(db, model, owner, totals)
+        crud.set_job_cursor(db, VISITOR_TOTALS_CURSOR, 1)
+        db.commit()
+    finally:
+        db.close()
+
+
+def missing_tables(engine):
+    existing = set(inspect(engine).get_table_names())
+    return [table.name for table in models.Base.metadata.sorted_tables if table.name not in existing]
+
+
+def run_migrations(engine):
+    enable_incremental_vacuum(engine)
+    models.Base.metadata.create_all(bind=engine)
+    ensure_columns(engine)
+    ensure_indexes(engine)
+    backfill_click_strings(engine)
+    backfill_visitor_sketches(engine)
+    backfill_visitor_totals(engine)
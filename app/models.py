@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, DateTime, Text, Index, LargeBinary
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -15,6 +15,11 @@ class User(Base):
 
 class AffiliateLink(Base):
     __tablename__ = "affiliate_links"
+    __table_args__ = (
+        # Keyset pagination of a user's links (see crud.get_user_links)
+        Index("ix_affiliate_links_user_id_id", "user_id", "id"),
+        Index("ix_affiliate_links_user_id_created_at", "user_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
@@ -31,20 +36,101 @@ class AffiliateLink(Base):
 
 class ClickEvent(Base):
     __tablename__ = "click_events"
+    # A link's events over a time range (attribution, per-link windows); the
+    # link_id index stays for walking a link's events in id order
+    __table_args__ = (Index("ix_click_events_link_id_timestamp", "link_id", "timestamp"),)
     
     id = Column(Integer, primary_key=True, index=True)
     link_id = Column(Integer, index=True)
     ip_address = Column(String)
-    user_agent = Column(Text)
-    referrer = Column(Text)
+    # Interned in user_agents / referrers (see app/interning.py)
+    user_agent_id = Column(Integer)
+    referrer_id = Column(Integer)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
+# Lookup tables for the repetitive strings of click_events
+class UserAgent(Base):
+    __tablename__ = "user_agents"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(Text, unique=True, nullable=False)
+
+class Referrer(Base):
+    __tablename__ = "referrers"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(Text, unique=True, nullable=False)
+
 class RevenueEvent(Base):
     __tablename__ = "revenue_events"
+    __table_args__ = (Index("ix_revenue_events_link_id_timestamp", "link_id", "timestamp"),)
     
     id = Column(Integer, primary_key=True, index=True)
     link_id = Column(Integer, index=True)
     amount = Column(Float)
     currency = Column(String, default="USD")
-    transaction_id = Column(String)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    # NULLs don't collide, so postbacks without a transaction id are still accepted
+    transaction_id = Column(String, unique=True, index=True)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    # Set by app/attribution.py: the last click on the link before this
+    # event, within the lookback window, and seconds from that click
+    attributed_click_id = Column(Integer)
+    time_to_convert = Column(Float)
+
+# Analytics rollups, maintained incrementally by app/rollups.py
+class LinkStatsHourly(Base):
+    __tablename__ = "link_stats_hourly"
+    __table_args__ = (Index("ix_link_stats_hourly_user_bucket", "user_id", "bucket"),)
+
+    link_id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    user_id = Column(Integer)
+    clicks = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)
+    conversions = Column(Integer, default=0)
+
+class LinkStatsDaily(Base):
+    __tablename__ = "link_stats_daily"
+    __table_args__ = (Index("ix_link_stats_daily_user_bucket", "user_id", "bucket"),)
+
+    link_id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    user_id = Column(Integer)
+    clicks = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)
+    conversions = Column(Integer, default=0)
+
+# Click-to-conversion latency histogram per link; bucket indexes
+# crud.CONVERSION_LATENCY_BOUNDS
+class LinkConversionLatency(Base):
+    __tablename__ = "link_conversion_latency"
+    __table_args__ = (Index("ix_link_conversion_latency_user_id", "user_id"),)
+
+    link_id = Column(Integer, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    conversions = Column(Integer, default=0)
+    seconds = Column(Float, default=0.0)
+
+# Unique-visitor HyperLogLog sketches (app/hll.py), one per UTC day, merged
+# into on every click flush
+class LinkVisitorSketch(Base):
+    __tablename__ = "link_visitor_sketches"
+
+    link_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    sketch = Column(LargeBinary)
+
+class UserVisitorSketch(Base):
+    __tablename__ = "user_visitor_sketches"
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    sketch = Column(LargeBinary)
+
+# High-water marks (last processed event id) for incremental background jobs
+class JobCursor(Base):
+    __tablename__ = "job_cursors"
+
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, default=0)
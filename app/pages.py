@@ -0,0 +1,80 @@
+# Served by "/" and "/dashboard" when the frontend files are missing
+
+INDEX_FALLBACK_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>LinkFlow Pro</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 40px; background: #0f172a; color: white; }
+        .container { max-width: 800px; margin: 0 auto; text-align: center; }
+        .logo { font-size: 3em; font-weight: bold; background: linear-gradient(135deg, #4361ee, #7209b7); 
+                -webkit-background-clip: text; -webkit-text-fill-color: transparent; }
+        .links { margin: 20px 0; }
+        .links a { display: inline-block; margin: 10px; padding: 12px 24px; background: #4361ee; 
+                  color: white; text-decoration: none; border-radius: 8px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="logo">LinkFlow Pro</div>
+        <h1>Affiliate Link Management SaaS</h1>
+        <p>Your backend is running! Frontend files are missing.</p>
+        <div class="links">
+            <a href="/dashboard">Go to Dashboard</a>
+            <a href="/api/docs">API Documentation</a>
+            <a href="/health">Health Check</a>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+DASHBOARD_FALLBACK_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Dashboard - LinkFlow Pro</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 0; background: #0f172a; color: white; }
+        .sidebar { width: 250px; height: 100vh; background: #1e293b; padding: 20px; float: left; }
+        .main { margin-left: 250px; padding: 20px; }
+        .logo { font-size: 1.5em; font-weight: bold; margin-bottom: 30px; }
+        .nav a { display: block; padding: 10px; color: #94a3b8; text-decoration: none; }
+        .nav a.active { color: white; background: #4361ee; border-radius: 5px; }
+        .metric { background: #1e293b; padding: 20px; border-radius: 8px; margin: 10px; display: inline-block; width: 200px; }
+    </style>
+</head>
+<body>
+    <div class="sidebar">
+        <div class="logo">LinkFlow Pro</div>
+        <div class="nav">
+            <a href="#" class="active">Dashboard</a>
+            <a href="#">My Links</a>
+            <a href="#">Analytics</a>
+        </div>
+    </div>
+    <div class="main">
+        <h1>Dashboard</h1>
+        <p>Backend is working! Frontend dashboard file is missing.</p>
+        <div class="metric">
+            <h3>Total Links</h3>
+            <div id="totalLinks">Loading...</div>
+        </div>
+        <div class="metric">
+            <h3>Total Clicks</h3>
+            <div id="totalClicks">Loading...</div>
+        </div>
+    </div>
+    <script>
+        // Load stats from API
+        fetch('/dashboard/stats')
+            .then(r => r.json())
+            .then(stats => {
+                document.getElementById('totalLinks').textContent = stats.total_links;
+                document.getElementById('totalClicks').textContent = stats.total_clicks;
+            });
+    </script>
+</body>
+</html>
+"""
@@ -0,0 +1,161 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def _limit(name, default):
+    # "rate,burst": tokens added per second and bucket size; rate 0 disables
+    rate, burst = os.environ.get(name, default).split(",")
+    return float(rate), float(burst)
+
+
+RATE_LIMIT_ENABLED = os.environ.get("LINKFLOW_RATE_LIMIT", "1") == "1"
+# One bucket per key in each of these, e.g. per client IP for "redirect_ip"
+RATE_LIMITS = {
+    "redirect_ip": _limit("LINKFLOW_RATE_REDIRECT_IP", "20,40"),
+    "redirect_code": _limit("LINKFLOW_RATE_REDIRECT_CODE", "500,1000"),
+    "write_ip": _limit("LINKFLOW_RATE_WRITE_IP", "20,40"),
+    "read_ip": _limit("LINKFLOW_RATE_READ_IP", "0,0"),
+}
+# Keys tracked per limiter; past this the least recently seen are dropped
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("LINKFLOW_RATE_LIMIT_MAX_KEYS", 100000))
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Never throttled: probes and monitoring. /r/ is handled by allow_redirect().
+EXEMPT_PATHS = {"/health", "/metrics"}
+
+
+class TokenBucketLimiter:
+    """Token buckets keyed by an arbitrary string, refilled lazily on access.
+
+    A bucket untouched for burst / rate seconds is full again, which is the
+    same as having no bucket, so such buckets are dropped as new keys come
+    in; max_keys caps the rest.
+    """
+
+    def __init__(self, rate, burst, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_keys = max_keys
+        self.idle_after = self.burst / rate if rate > 0 else 0.0
+        self._buckets = OrderedDict()  # key -> [tokens, updated, rejected], least recent first
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def acquire(self, key, now=None):
+        # -> 0.0 if a token was taken, else seconds until the next one
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._evict(now)
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                self.allowed += 1
+                return 0.0
+            bucket[2] += 1
+            self.rejected += 1
+            return (1.0 - bucket[0]) / self.rate
+
+    def _evict(self, now):
+        buckets = self._buckets
+        while buckets:
+            key, (_, updated, _) = next(iter(buckets.items()))
+            if len(buckets) < self.max_keys and now - updated < self.idle_after:
+                return
+            del buckets[key]
+            self.evicted += 1
+
+    def stats(self, top=10):
+        with self._lock:
+            offenders = sorted(
+                ((bucket[2], key) for key, bucket in self._buckets.items() if bucket[2]), reverse=True
+            )[:top]
+            keys = len(self._buckets)
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "keys": keys,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            # Rejections per key, for keys active within the last refill period
+            "top_rejected": [{"key": key, "rejected": count} for count, key in offenders],
+        }
+
+
+class RateLimiter:
+    """Load shedding for redirects and API calls.
+
+    Redirects are never refused: a throttled one still sends the visitor on
+    but isn't recorded as a click. API calls get a 429 with Retry-After
+    from RateLimitMiddleware.
+    """
+
+    def __init__(self, limits, max_keys=RATE_LIMIT_MAX_KEYS, enabled=True):
+        self.enabled = enabled
+        self.limiters = {name: TokenBucketLimiter(rate, burst, max_keys) for name, (rate, burst) in limits.items()}
+
+    def allow_redirect(self, ip_address, short_code):
+        if not self.enabled:
+            return True
+        # The per-link bucket is only charged for clients within their own limit
+        return (
+            self.limiters["redirect_ip"].acquire(ip_address or "unknown") == 0.0
+            and self.limiters["redirect_code"].acquire(short_code) == 0.0
+        )
+
+    def check_request(self, method, path, ip_address):
+        # -> seconds the client should wait, 0.0 if the request may proceed
+        if not self.enabled or path in EXEMPT_PATHS:
+            return 0.0
+        name = "write_ip" if method in WRITE_METHODS else "read_ip"
+        return self.limiters[name].acquire(ip_address or "unknown")
+
+    def stats(self):
+        return {"enabled": self.enabled, **{name: limiter.stats() for name, limiter in self.limiters.items()}}
+
+
+rate_limiter = RateLimiter(RATE_LIMITS, enabled=RATE_LIMIT_ENABLED)
+
+_TOO_MANY_REQUESTS = json.dumps({"detail": "Too Many Requests"}).encode()
+
+
+class RateLimitMiddleware:
+    """Answers throttled API calls with 429 before they reach a route."""
+
+    def __init__(self, app, limiter=rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/r/"):
+            await self.app(scope, receive, send)
+            return
+        client = scope.get("client")
+        retry_after = self.limiter.check_request(scope["method"], scope["path"], client[0] if client else None)
+        if retry_after <= 0:
+            await self.app(scope, receive, send)
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(_TOO_MANY_REQUESTS)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": _TOO_MANY_REQUESTS})
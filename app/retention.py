@@ -0,0 +1,236 @@
+import glob
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .chunking import chunks
+from .database import SessionLocal
+from .rollups import CLICKS_CURSOR
+
+# Raw clicks older than this many days move from click_events to the archive;
+# 0 disables retention. Rollups keep their aggregates regardless.
+RETENTION_DAYS = float(os.environ.get("LINKFLOW_RETENTION_DAYS", 90))
+RETENTION_INTERVAL = float(os.environ.get("LINKFLOW_RETENTION_INTERVAL", 3600))
+RETENTION_BATCH_SIZE = int(os.environ.get("LINKFLOW_RETENTION_BATCH_SIZE", 10000))
+# Free pages handed back to the filesystem per run (auto_vacuum=INCREMENTAL only)
+RETENTION_VACUUM_PAGES = int(os.environ.get("LINKFLOW_RETENTION_VACUUM_PAGES", 2000))
+ARCHIVE_DIR = os.environ.get("LINKFLOW_ARCHIVE_DIR", "./archive")
+
+ARCHIVE_FORMAT = 1
+CLICK_COLUMNS = crud.CLICK_ROW_COLUMNS
+
+# Archive layout:
+#   <ARCHIVE_DIR>/clicks/<YYYY-MM>/<min id>-<max id>.col.gz
+# Each segment is written once and never modified. Its gzip stream holds a
+# JSON header line (row count, id and timestamp range, link ids present)
+# followed by one JSON array per column, in CLICK_COLUMNS order. Readers skip
+# a segment after decompressing only its header.
+#
+# Segments are durable before their rows are deleted. The paths of the batch
+# in progress are kept in a pending file, so a crash between the two steps is
+# finished on the next run rather than archiving the rows twice.
+
+
+def _clicks_dir(archive_dir):
+    return os.path.join(archive_dir, "clicks")
+
+
+def _pending_path(archive_dir):
+    return os.path.join(_clicks_dir(archive_dir), "pending.json")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + ".partial"
+    with open(partial, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+
+
+def _encode_segment(rows):
+    columns = [list(column) for column in zip(*rows)]
+    ids, link_ids, timestamps = columns[0], columns[1], columns[2]
+    header = {
+        "format": ARCHIVE_FORMAT,
+        "columns": CLICK_COLUMNS,
+        "rows": len(rows),
+        "min_id": min(ids),
+        "max_id": max(ids),
+        "min_ts": min(timestamps),
+        "max_ts": max(timestamps),
+        "link_ids": sorted(set(link_ids)),
+    }
+    lines = [json.dumps(header)] + [json.dumps(column) for column in columns]
+    return gzip.compress(("\n".join(lines) + "\n").encode(), compresslevel=6)
+
+
+def _read_header(f):
+    return json.loads(f.readline())
+
+
+def _segment_ids(path):
+    with gzip.open(path, "rt") as f:
+        _read_header(f)
+        return json.loads(f.readline())
+
+
+def _delete_ids(db: Session, ids):
+    for chunk in chunks(ids):
+        db.execute(delete(models.ClickEvent).where(models.ClickEvent.id.in_(chunk)))
+    db.commit()
+
+
+def _finish_pending(db: Session, archive_dir):
+    pending = _pending_path(archive_dir)
+    if not os.path.exists(pending):
+        return 0
+    with open(pending) as f:
+        segments = json.load(f)
+    deleted = 0
+    for path in segments:
+        if os.path.exists(path):
+            ids = _segment_ids(path)
+            _delete_ids(db, ids)
+            deleted += len(ids)
+        elif os.path.exists(path + ".partial"):
+            os.remove(path + ".partial")
+    os.remove(pending)
+    if deleted:
+        print(f"⚠️ Finished an interrupted archive run ({deleted} clicks)")
+    return deleted
+
+
+def _archive_batch(db: Session, archive_dir, rows):
+    months = {}
+    for row in rows:
+        months.setdefault(row[2][:7], []).append(row)
+    segments = {
+        os.path.join(_clicks_dir(archive_dir), month, f"{batch[0][0]:012d}-{batch[-1][0]:012d}.col.gz"): batch
+        for month, batch in months.items()
+    }
+    _write_atomic(_pending_path(archive_dir), json.dumps(list(segments)).encode())
+    for path, batch in segments.items():
+        _write_atomic(path, _encode_segment(batch))
+    _delete_ids(db, [row[0] for row in rows])
+    os.remove(_pending_path(archive_dir))
+
+
+def _pragma(db: Session, statement):
+    result = db.connection().exec_driver_sql(f"PRAGMA {statement}")
+    rows = result.fetchall() if result.returns_rows else []
+    db.commit()
+    return rows[0][0] if rows else None
+
+
+def _compact(db: Session, vacuum_pages):
+    # auto_vacuum=2 is INCREMENTAL; new databases get it from run_migrations
+    if vacuum_pages > 0 and _pragma(db, "auto_vacuum") == 2:
+        # sqlite3's execute() steps a statement once, and each step of this
+        # pragma frees a single page; executescript() runs it to completion
+        db.connection().connection.driver_connection.executescript(
+            f"PRAGMA incremental_vacuum({int(vacuum_pages)})"
+        )
+        db.commit()
+    if _pragma(db, "journal_mode") == "wal":
+        # PASSIVE never waits on readers; whatever it can't copy now goes next run
+        _pragma(db, "wal_checkpoint(PASSIVE)")
+
+
+def archive_clicks(db: Session, older_than: datetime, archive_dir: str = ARCHIVE_DIR,
+                   batch_size: int = RETENTION_BATCH_SIZE, vacuum_pages: int = RETENTION_VACUUM_PAGES):
+    archived = _finish_pending(db, archive_dir)
+    # Only clicks the rollups have already counted may leave the hot table
+    high_water = crud.get_job_cursor(db, CLICKS_CURSOR)
+    # click_events has no AUTOINCREMENT, so SQLite numbers new rows from the
+    # largest id left. The newest row stays, or new clicks would reuse ids
+    # the rollup cursor, export cursors and attributions have already seen.
+    newest_id = db.query(func.max(models.ClickEvent.id)).scalar() or 0
+    after_id = 0
+    segments = 0
+    while True:
+        # Segments hold the strings themselves, not ids into the lookup tables
+        rows = crud.query_click_rows(db).filter(
+            models.ClickEvent.id > after_id,
+            models.ClickEvent.id <= high_water,
+            models.ClickEvent.id < newest_id,
+            models.ClickEvent.timestamp < older_than
+        ).order_by(models.ClickEvent.id).limit(batch_size).all()
+        db.rollback()
+        if not rows:
+            break
+        rows = [(row[0], row[1], row[2].isoformat(), row[3], row[4], row[5]) for row in rows]
+        _archive_batch(db, archive_dir, rows)
+        archived += len(rows)
+        segments += len({row[2][:7] for row in rows})
+        after_id = rows[-1][0]
+    if archived:
+        _compact(db, vacuum_pages)
+    return {"archived": archived, "segments": segments, "high_water_id": high_water}
+
+
+def run_retention():
+    if RETENTION_DAYS <= 0:
+        return None
+    db = SessionLocal()
+    try:
+        result = archive_clicks(db, datetime.utcnow() - timedelta(days=RETENTION_DAYS))
+        if result["archived"]:
+            print(f"✅ Archived {result['archived']} clicks older than {RETENTION_DAYS:g} days")
+        return result
+    finally:
+        db.close()
+
+
+# Reader
+def _month_dirs(archive_dir, start, end):
+    for path in sorted(glob.glob(os.path.join(_clicks_dir(archive_dir), "????-??"))):
+        month = os.path.basename(path)
+        if start is not None and month < start.strftime("%Y-%m"):
+            continue
+        if end is not None and month > end.strftime("%Y-%m"):
+            continue
+        yield path
+
+
+def iter_archived_clicks(link_id: int, start: datetime = None, end: datetime = None,
+                         archive_dir: str = ARCHIVE_DIR):
+    # Yields archived clicks of one link as dicts, oldest segment first
+    start_ts = start.isoformat() if start is not None else None
+    end_ts = end.isoformat() if end is not None else None
+    for month_dir in _month_dirs(archive_dir, start, end):
+        for path in sorted(glob.glob(os.path.join(month_dir, "*.col.gz"))):
+            with gzip.open(path, "rt") as f:
+                header = _read_header(f)
+                if link_id not in header["link_ids"]:
+                    continue
+                if start_ts is not None and header["max_ts"] < start_ts:
+                    continue
+                if end_ts is not None and header["min_ts"] >= end_ts:
+                    continue
+                columns = [json.loads(f.readline()) for _ in header["columns"]]
+            for row in zip(*columns):
+                if row[1] != link_id:
+                    continue
+                if start_ts is not None and row[2] < start_ts:
+                    continue
+                if end_ts is not None and row[2] >= end_ts:
+                    continue
+                yield dict(zip(header["columns"], row))
+
+
+def archive_stats(archive_dir: str = ARCHIVE_DIR):
+    paths = glob.glob(os.path.join(_clicks_dir(archive_dir), "????-??", "*.col.gz"))
+    return {
+        "archive_dir": os.path.abspath(archive_dir),
+        "retention_days": RETENTION_DAYS,
+        "segments": len(paths),
+        "bytes": sum(os.path.getsize(path) for path in paths),
+        "months": sorted({os.path.basename(os.path.dirname(path)) for path in paths}),
+    }
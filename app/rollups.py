@@ -0,0 +1,165 @@
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .database import SessionLocal
+from .leaderboard import LONGEST_WINDOW_HOURS, leaderboards
+
+ROLLUP_INTERVAL = float(os.environ.get("LINKFLOW_ROLLUP_INTERVAL", 5))
+ROLLUP_BATCH_SIZE = int(os.environ.get("LINKFLOW_ROLLUP_BATCH_SIZE", 50000))
+
+# Event id high-water marks in job_cursors
+CLICKS_CURSOR = "rollup_clicks"
+REVENUE_CURSOR = "rollup_revenue"
+
+HOUR_FORMAT = "%Y-%m-%d %H:00:00"
+
+
+def _click_buckets(db: Session, low: int, high: int):
+    hour = func.strftime(HOUR_FORMAT, models.ClickEvent.timestamp)
+    rows = db.query(
+        models.ClickEvent.link_id,
+        models.AffiliateLink.user_id,
+        hour,
+        func.count(models.ClickEvent.id)
+    ).join(
+        models.AffiliateLink, models.AffiliateLink.id == models.ClickEvent.link_id
+    ).filter(
+        models.ClickEvent.id > low,
+        models.ClickEvent.id <= high
+    ).group_by(models.ClickEvent.link_id, hour)
+    for link_id, user_id, bucket, clicks in rows:
+        yield link_id, user_id, bucket, clicks, 0.0, 0
+
+
+def _revenue_buckets(db: Session, low: int, high: int):
+    hour = func.strftime(HOUR_FORMAT, models.RevenueEvent.timestamp)
+    rows = db.query(
+        models.RevenueEvent.link_id,
+        models.AffiliateLink.user_id,
+        hour,
+        func.sum(models.RevenueEvent.amount),
+        func.count(models.RevenueEvent.id)
+    ).join(
+        models.AffiliateLink, models.AffiliateLink.id == models.RevenueEvent.link_id
+    ).filter(
+        models.RevenueEvent.id > low,
+        models.RevenueEvent.id <= high
+    ).group_by(models.RevenueEvent.link_id, hour)
+    for link_id, user_id, bucket, revenue, conversions in rows:
+        yield link_id, user_id, bucket, 0, revenue or 0.0, conversions
+
+
+def _upsert(db: Session, model, totals):
+    if not totals:
+        return
+    table = model.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.link_id, table.c.bucket],
+        set_={
+            "clicks": table.c.clicks + stmt.excluded.clicks,
+            "revenue": table.c.revenue + stmt.excluded.revenue,
+            "conversions": table.c.conversions + stmt.excluded.conversions,
+        }
+    )
+    db.connection().execute(stmt, [
+        {
+            "link_id": link_id,
+            "bucket": bucket,
+            "user_id": user_id,
+            "clicks": clicks,
+            "revenue": revenue,
+            "conversions": conversions,
+        }
+        for (link_id, bucket), (user_id, clicks, revenue, conversions) in totals.items()
+    ])
+
+
+def _apply(db: Session, buckets):
+    hourly = {}
+    daily = {}
+    for link_id, user_id, bucket, clicks, revenue, conversions in buckets:
+        hour = datetime.strptime(bucket, "%Y-%m-%d %H:%M:%S")
+        day = hour.replace(hour=0)
+        for totals, key in ((hourly, (link_id, hour)), (daily, (link_id, day))):
+            current = totals.get(key)
+            if current is None:
+                totals[key] = [user_id, clicks, revenue, conversions]
+            else:
+                current[1] += clicks
+                current[2] += revenue
+                current[3] += conversions
+    _upsert(db, models.LinkStatsHourly, hourly)
+    _upsert(db, models.LinkStatsDaily, daily)
+
+
+def _materialize(db: Session, cursor_name, event_model, collect, batch_size):
+    processed = 0
+    max_id = db.query(func.max(event_model.id)).scalar() or 0
+    low = crud.get_job_cursor(db, cursor_name)
+    while low < max_id:
+        high = min(max_id, low + batch_size)
+        _apply(db, collect(db, low, high))
+        crud.set_job_cursor(db, cursor_name, high)
+        # Buckets and high-water mark move together, so a crash never double counts
+        db.commit()
+        processed += high - low
+        low = high
+    return processed
+
+
+def materialize_rollups(db: Session, batch_size: int = ROLLUP_BATCH_SIZE):
+    return {
+        "click_ids": _materialize(db, CLICKS_CURSOR, models.ClickEvent, _click_buckets, batch_size),
+        "revenue_ids": _materialize(db, REVENUE_CURSOR, models.RevenueEvent, _revenue_buckets, batch_size),
+    }
+
+
+def run_materializer():
+    db = SessionLocal()
+    try:
+        return materialize_rollups(db)
+    finally:
+        db.close()
+
+
+def _recent_hours(db: Session, since: datetime):
+    hourly = models.LinkStatsHourly
+    yield from db.query(
+        hourly.link_id, hourly.user_id, hourly.bucket, hourly.clicks, hourly.revenue
+    ).filter(hourly.bucket >= since)
+    # Events the materializer hasn't reached yet
+    for cursor_name, event_model, collect in ((CLICKS_CURSOR, models.ClickEvent, _click_buckets),
+                                              (REVENUE_CURSOR, models.RevenueEvent, _revenue_buckets)):
+        max_id = db.query(func.max(event_model.id)).scalar() or 0
+        for link_id, user_id, bucket, clicks, revenue, _ in collect(db, crud.get_job_cursor(db, cursor_name), max_id):
+            hour = datetime.strptime(bucket, "%Y-%m-%d %H:%M:%S")
+            if hour >= since:
+                yield link_id, user_id, hour, clicks, revenue
+
+
+def load_leaderboards(db: Session, now: datetime = None):
+    # Rebuilds the in-memory top-N boards: all-time scores from the link
+    # counters, windowed ones from the hourly rollups plus unrolled events
+    now = now or datetime.utcnow()
+    since = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=LONGEST_WINDOW_HOURS - 1)
+    links = db.query(
+        models.AffiliateLink.id, models.AffiliateLink.user_id,
+        models.AffiliateLink.clicks, models.AffiliateLink.revenue
+    )
+    leaderboards.load(links, _recent_hours(db, since), now)
+    db.rollback()
+    return leaderboards.stats()
+
+
+def run_leaderboard_load():
+    db = SessionLocal()
+    try:
+        return load_leaderboards(db)
+    finally:
+        db.close()
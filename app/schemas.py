@@ -1,6 +1,6 @@
-from pydantic import BaseModel, ConfigDict
-from datetime import datetime
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field
+from datetime import date, datetime
+from typing import Any, Optional, List
 
 # User Schemas
 class UserBase(BaseModel):
@@ -40,6 +40,21 @@ class AffiliateLink(AffiliateLinkBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class BulkLinkCreate(BaseModel):
+    # Rows are checked one by one; a bad row is reported, not a 422
+    links: List[Any] = Field(..., max_length=10000)
+
+class BulkLinkError(BaseModel):
+    row: int
+    error: str
+
+class BulkLinkResult(BaseModel):
+    created: int
+    failed: int
+    errors: List[BulkLinkError]
+    errors_truncated: bool = False
+    links: List[AffiliateLink] = []
+
 # Click Event Schemas
 class ClickEventBase(BaseModel):
     link_id: int
@@ -70,13 +85,56 @@ class RevenueEvent(RevenueEventBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class RevenueBatch(BaseModel):
+    events: List[RevenueEventCreate] = Field(..., max_length=50000)
+
+class RevenueBatchResult(BaseModel):
+    received: int
+    accepted: int
+    duplicates: int
+    unknown_links: int
+
 # Dashboard Stats
+class LatencyBucket(BaseModel):
+    # None for the last, open-ended bucket
+    le_seconds: Optional[float] = None
+    conversions: int
+
+class ConversionLatency(BaseModel):
+    conversions: int
+    mean_seconds: Optional[float] = None
+    # Upper bounds of the histogram buckets holding the median / 90th percentile
+    p50_seconds: Optional[float] = None
+    p90_seconds: Optional[float] = None
+    buckets: List[LatencyBucket]
+
 class DashboardStats(BaseModel):
     total_links: int
     total_clicks: int
     total_revenue: float
     active_campaigns: int
     conversion_rate: float
+    # HyperLogLog estimate; relative standard error given by unique_visitors_error
+    unique_visitors: int = 0
+    unique_visitors_error: float = 0.0
+    # Revenue events tied to their last prior click by app/attribution.py
+    attributed_conversions: int = 0
+    attributed_conversion_rate: float = 0.0
+    time_to_convert: Optional[ConversionLatency] = None
+
+# Rollup time series
+class StatsBucket(BaseModel):
+    bucket: datetime
+    clicks: int
+    revenue: float
+    conversions: int
+
+class StatsSeries(BaseModel):
+    link_id: Optional[int] = None
+    granularity: str
+    start: datetime
+    end: datetime
+    points: List[StatsBucket]
 
 # Authentication
 class Token(BaseModel):
@@ -97,4 +155,45 @@ class LinkStats(BaseModel):
     title: str
     clicks: int
     revenue: float
-    conversion_rate: float
\ No newline at end of file
+    conversion_rate: float
+    unique_visitors: int = 0
+    unique_visitors_error: float = 0.0
+    attributed_conversions: int = 0
+    attributed_conversion_rate: float = 0.0
+    time_to_convert: Optional[ConversionLatency] = None
+
+class TopLink(BaseModel):
+    link_id: int
+    # None for other accounts' links on the global board
+    title: Optional[str] = None
+    short_code: Optional[str] = None
+    clicks: int
+    revenue: float
+
+class TopLinks(BaseModel):
+    by: str
+    window: str
+    scope: str
+    links: List[TopLink]
+
+class UniqueVisitors(BaseModel):
+    link_id: Optional[int] = None
+    start: Optional[date] = None
+    end: Optional[date] = None
+    unique_visitors: int
+    relative_error: float
+
+class ArchivedClick(BaseModel):
+    id: int
+    link_id: int
+    timestamp: datetime
+    ip_address: Optional[str] = None
+    user_agent: Optional[str] = None
+    referrer: Optional[str] = None
+
+class ClickHistory(BaseModel):
+    link_id: int
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    clicks: List[ArchivedClick]
+    truncated: bool
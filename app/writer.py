@@ -0,0 +1,245 @@
+import os
+import signal
+import sys
+import threading
+from collections import deque
+
+from . import crud, schemas
+from .attribution import ATTRIBUTION_INTERVAL, run_attribution
+from .database import SessionLocal
+from .ingest import INGEST_BATCH_SIZE, INGEST_DURABILITY, INGEST_FLUSH_INTERVAL, INGEST_MAX_QUEUE, ClickIngestor
+from .jobs import PeriodicJob
+from .leaderboard import leaderboards
+from .retention import RETENTION_INTERVAL, run_retention
+from .rollups import ROLLUP_INTERVAL, run_leaderboard_load, run_materializer
+
+# Set by run.py when it starts several request workers. Workers then send
+# click batches and revenue events over this Unix socket to a single writer
+# process instead of writing to SQLite themselves.
+WRITER_SOCKET = os.environ.get("LINKFLOW_WRITER_SOCKET")
+WRITER_AUTHKEY = bytes.fromhex(os.environ.get("LINKFLOW_WRITER_AUTHKEY", ""))
+
+# How often a worker asks the writer for links deleted through other
+# workers, which it then drops from its own caches
+LINK_INVALIDATION_INTERVAL = float(os.environ.get("LINKFLOW_LINK_INVALIDATION_INTERVAL", 1.0))
+# Deletes the writer remembers; a worker further behind clears its link cache
+LINK_INVALIDATION_LOG_SIZE = int(os.environ.get("LINKFLOW_LINK_INVALIDATION_LOG_SIZE", 10000))
+
+
+class WriterError(RuntimeError):
+    pass
+
+
+class WriterClient:
+    """A worker's connection to the writer process.
+
+    Calls are synchronous (run them in the threadpool) and share one
+    connection, reopened on the next call if it breaks.
+    """
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self._conn = None
+        self._lock = threading.Lock()
+        self._invalidation_seq = None
+
+    def call(self, kind, payload=None):
+        with self._lock:
+            if self._conn is None:
+                from multiprocessing.connection import Client
+
+                self._conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            try:
+                self._conn.send((kind, payload))
+                status, result = self._conn.recv()
+            except (OSError, EOFError):
+                self._conn.close()
+                self._conn = None
+                raise
+        if status != "ok":
+            raise WriterError(result)
+        return result
+
+    def ingest_clicks(self, batch):
+        # A batch whose reply is lost is sent again, so clicks are delivered
+        # at least once
+        return self.call("clicks", batch)
+
+    def track_revenue(self, events, user_id):
+        return self.call("revenue", ([event.model_dump() for event in events], user_id))
+
+    def top_links(self, metric, window, n, user_id=None):
+        # The leaderboards live where the writes happen
+        return self.call("top", (metric, window, n, user_id))
+
+    def remove_link(self, link_id, user_id, short_code):
+        return self.call("remove_link", (link_id, user_id, short_code))
+
+    def sync_invalidations(self, link_cache, stats_cache):
+        # Drops links deleted through any worker from this one's caches
+        self._invalidation_seq, removed = self.call("invalidations", self._invalidation_seq)
+        if removed is None:
+            link_cache.clear()
+            stats_cache.clear()
+            return "cleared"
+        for link_id, user_id, short_code in removed:
+            link_cache.invalidate(short_code)
+            stats_cache.invalidate(("dashboard", user_id))
+            stats_cache.invalidate(("link", user_id, link_id))
+        return len(removed)
+
+    def stats(self):
+        return self.call("stats")
+
+
+writer_client = WriterClient(WRITER_SOCKET, WRITER_AUTHKEY) if WRITER_SOCKET else None
+
+
+class RemovedLinks:
+    """The writer's log of deleted links, numbered in order, for workers
+    to catch up on with since(their last seq)."""
+
+    def __init__(self, maxlen=LINK_INVALIDATION_LOG_SIZE):
+        self._removed = deque(maxlen=maxlen)
+        self.seq = 0
+
+    def add(self, link_id, user_id, short_code):
+        self.seq += 1
+        self._removed.append((link_id, user_id, short_code))
+
+    def since(self, seq):
+        # -> (seq, removals after the given seq), or (seq, None) when some of
+        # them were dropped or the writer restarted since
+        if seq is None:
+            return self.seq, []
+        missed = self.seq - seq
+        if missed < 0 or missed > len(self._removed):
+            return self.seq, None
+        return self.seq, list(self._removed)[len(self._removed) - missed:]
+
+
+class Writer:
+    """The writer process: owns every click and revenue write.
+
+    Clicks from all workers go into one ClickIngestor and are committed in
+    its batches; revenue events are written as they arrive. Both hold the
+    same lock, so the process never competes with itself for SQLite's.
+    """
+
+    def __init__(self):
+        self.write_lock = threading.Lock()
+        self.ingestor = ClickIngestor(
+            SessionLocal,
+            batch_size=INGEST_BATCH_SIZE,
+            flush_interval=INGEST_FLUSH_INTERVAL,
+            durability=INGEST_DURABILITY,
+            max_queue=INGEST_MAX_QUEUE,
+            lock=self.write_lock,
+        )
+        self.rollup_job = PeriodicJob("rollups", run_materializer, ROLLUP_INTERVAL)
+        self.retention_job = PeriodicJob("retention", run_retention, RETENTION_INTERVAL)
+        self.attribution_job = PeriodicJob("attribution", run_attribution, ATTRIBUTION_INTERVAL)
+        self.removed_links = RemovedLinks()
+        self.connections = 0
+        self.revenue_calls = 0
+
+    def track_revenue(self, events, user_id):
+        events = [schemas.RevenueEventCreate(**event) for event in events]
+        with self.write_lock:
+            db = SessionLocal()
+            try:
+                self.revenue_calls += 1
+                return crud.track_revenue_events(db, events, user_id=user_id)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+    def remove_link(self, link_id, user_id, short_code):
+        # Under the write lock, so a click batch that counted the link before
+        # its delete has updated the leaderboards by the time it's removed
+        with self.write_lock:
+            leaderboards.remove_link(link_id)
+            self.removed_links.add(link_id, user_id, short_code)
+
+    def handle(self, kind, payload):
+        if kind == "clicks":
+            return self.ingestor.enqueue_many(payload)
+        if kind == "revenue":
+            return self.track_revenue(*payload)
+        if kind == "top":
+            return leaderboards.top(*payload)
+        if kind == "remove_link":
+            return self.remove_link(*payload)
+        if kind == "invalidations":
+            return self.removed_links.since(payload)
+        if kind == "stats":
+            return {
+                "pid": os.getpid(),
+                "connections": self.connections,
+                "removed_links": self.removed_links.seq,
+                "revenue_calls": self.revenue_calls,
+                "clicks": self.ingestor.stats(),
+                "rollups": self.rollup_job.stats(),
+                "retention": self.retention_job.stats(),
+                "attribution": self.attribution_job.stats(),
+                "leaderboards": leaderboards.stats(),
+            }
+        raise ValueError(f"Unknown writer request: {kind}")
+
+    def _serve_connection(self, conn):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    kind, payload = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    reply = ("ok", self.handle(kind, payload))
+                except Exception as e:
+                    print(f"❌ Writer failed on {kind}: {e}")
+                    reply = ("error", str(e))
+                conn.send(reply)
+        except OSError:
+            pass
+        finally:
+            self.connections -= 1
+            conn.close()
+
+    def serve(self, address, authkey):
+        from multiprocessing.connection import Listener
+
+        run_leaderboard_load()
+        listener = Listener(address, family="AF_UNIX", authkey=authkey)
+        self.ingestor.start()
+        self.rollup_job.start()
+        self.retention_job.start()
+        self.attribution_job.start()
+        print(f"✅ Writer process {os.getpid()} listening on {address}")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # A failed handshake must not take the writer down
+                    print(f"⚠️ Writer rejected a connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            # Workers have stopped by now; write out what they sent last
+            self.ingestor.stop()
+            self.rollup_job.stop()
+            self.rollup_job.run_once()
+            self.retention_job.stop()
+            self.attribution_job.stop()
+
+
+def run_writer(address=WRITER_SOCKET, authkey=WRITER_AUTHKEY):
+    # Entry point of the writer process; SIGTERM/SIGINT flush and exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, lambda signum, frame: sys.exit(0))
+    Writer().serve(address, authkey)
@@ -0,0 +1,90 @@
+"""Throughput and latency of the sync (threadpool) vs aiosqlite database paths.
+
+    python benchmarks/async_db.py --requests 5000 --concurrency 200
+
+Each mode runs in its own subprocess on a fresh temporary database, since
+LINKFLOW_ASYNC_DB is read at import time. The workload mixes the ported
+routes: link listing, dashboard stats, link stats and revenue postbacks.
+The stats snapshot cache is disabled so every stats request reaches SQLite.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+from common import asgi_client, drive, print_table, use_temp_database
+
+MODES = {"sync": "0", "async": "1"}
+
+
+async def run_workload(total, concurrency, links):
+    from app.main import app
+    from app import crud
+    from app.database import SessionLocal
+    from app.manage import migrate
+
+    migrate()
+    db = SessionLocal()
+    try:
+        crud.create_affiliate_links_bulk(
+            db, ({"title": f"Bench {i}", "destination_url": f"https://example.com/{i}"} for i in range(links)),
+            user_id=1, return_links=False
+        )
+    finally:
+        db.close()
+
+    def make_request(i):
+        kind = i % 4
+        link_id = i % links + 1
+        if kind == 0:
+            return "GET", "/links/?limit=50", {}
+        if kind == 1:
+            return "GET", "/dashboard/stats", {}
+        if kind == 2:
+            return "GET", f"/links/{link_id}/stats", {}
+        return "POST", "/revenue/", {"json": {"link_id": link_id, "amount": 1.0, "transaction_id": f"bench-{i}"}}
+
+    await app.router.startup()
+    try:
+        async with asgi_client(app) as client:
+            await drive(client, make_request, min(total, 200), concurrency)  # warm-up
+            return await drive(client, make_request, total, concurrency)
+    finally:
+        await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        result = asyncio.run(run_workload(args.requests, args.concurrency, args.links))
+        print(json.dumps(result))
+        return
+
+    results = []
+    for mode, flag in MODES.items():
+        env = dict(os.environ, LINKFLOW_ASYNC_DB=flag, LINKFLOW_STATS_CACHE_TTL="0")
+        use_temp_database(env)
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--requests", str(args.requests),
+             "--concurrency", str(args.concurrency), "--links", str(args.links)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(dict(mode=mode, **json.loads(output.strip().splitlines()[-1])))
+
+    print_table(results, ["mode", "requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"concurrency": args.concurrency, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Shared helpers for the scripts in benchmarks/.
+
+The benchmarks drive the ASGI app in-process with httpx, so httpx must be
+installed alongside the app's requirements.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Benchmark traffic comes from one or a few addresses and would otherwise be
+# throttled as a scraper (app/ratelimit.py); inherited by spawned servers
+os.environ.setdefault("LINKFLOW_RATE_LIMIT", "0")
+
+
+def use_temp_database(env=None):
+    # Must run before app.* is imported: app.database reads DATABASE_URL once
+    env = os.environ if env is None else env
+    path = os.path.join(tempfile.mkdtemp(prefix="linkflow-bench-"), "bench.db")
+    env["DATABASE_URL"] = f"sqlite:///{path}"
+    return path
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+async def drive(client, make_request, total, concurrency):
+    # make_request(i) -> (method, url, request kwargs); runs `total` requests
+    # over `concurrency` concurrent workers and returns summarize() output.
+    latencies = []
+    errors = 0
+    indices = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in indices:
+            method, url, kwargs = make_request(i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                failed = response.status_code >= 400
+            except Exception:
+                # e.g. connection resets from an overloaded server
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            if failed:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+# httpx's default User-Agent is on the click filter's bot list
+BROWSER_HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"}
+
+
+def asgi_client(app):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app, client=("203.0.113.10", 50000))
+    return httpx.AsyncClient(transport=transport, base_url="http://bench", headers=BROWSER_HEADERS)
+
+
+def print_table(rows, columns):
+    widths = [max(len(str(column)), *(len(str(row.get(column, ""))) for row in rows)) for column in columns]
+    print("  ".join(str(column).ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).ljust(width) for column, width in zip(columns, widths)))
@@ -0,0 +1,280 @@
+"""Load test for the LinkFlow API hot paths.
+
+    python benchmarks/loadtest.py --users 100 --links 20000 --clicks 500000 \\
+        --target both --out results.json [--baseline previous.json]
+
+Seeds a temporary database (or --database) with N users, M links and K click
+events, then runs each workload against the app in-process over ASGI and/or
+against a local uvicorn started through run.py (--workers N for its
+multi-process mode):
+
+    redirect   GET /r/{code} across all seeded links
+    dashboard  dashboard/link stats, timeseries and /links/ polling
+    revenue    POST /revenue/batch with fresh transaction ids
+
+Throughput and p50/p95/p99 latency are printed and written to --out as JSON.
+With --baseline, any workload whose throughput drops or p99 grows by more
+than --max-regression (fraction, default 0.2) is reported and the script
+exits with status 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from common import BROWSER_HEADERS, REPO_ROOT, asgi_client, drive, print_table, use_temp_database
+
+WORKLOADS = ("redirect", "dashboard", "revenue")
+REVENUE_BATCH = 500
+
+
+def seed(users, links, clicks, seed_value=42):
+    from sqlalchemy import insert, text
+
+    from app import crud, interning, models
+    from app.database import SessionLocal, engine
+    from app.migrations import run_migrations
+    from app.rollups import materialize_rollups
+
+    run_migrations(engine)
+    rng = random.Random(seed_value)
+    db = SessionLocal()
+    try:
+        if db.query(models.AffiliateLink).count():
+            return [row[0] for row in db.query(models.AffiliateLink.short_code)]
+
+        db.execute(insert(models.User), [
+            {"email": f"user{i}@bench.local", "username": f"user{i}", "hashed_password": "x"}
+            for i in range(1, users + 1)
+        ])
+        codes = []
+        for start in range(0, links, 10000):
+            rows = []
+            for i in range(start, min(links, start + 10000)):
+                code = f"b{i:07d}"
+                codes.append(code)
+                rows.append({
+                    "title": f"Bench link {i}",
+                    "destination_url": f"https://example.com/p/{i}",
+                    "short_code": code,
+                    "short_url": f"http://localhost:8000/r/{code}",
+                    # Link ids are 1..M; owners round-robin so user 1 gets M/N links
+                    "user_id": i % users + 1,
+                    "category": "affiliate",
+                    "status": "active",
+                    "clicks": 0,
+                    "revenue": 0.0,
+                })
+            db.execute(insert(models.AffiliateLink), rows)
+
+        now = datetime.utcnow()
+        agent_ids = list(interning.user_agents.intern(db, [f"Mozilla/5.0 (bench {i})" for i in range(50)]).values())
+        referrer_id = interning.referrers.intern(db, ["https://news.example.com/"])["https://news.example.com/"]
+        for start in range(0, clicks, 50000):
+            rows = [
+                {
+                    "link_id": rng.randint(1, links),
+                    "ip_address": f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                    "user_agent_id": rng.choice(agent_ids),
+                    "referrer_id": referrer_id,
+                    "timestamp": now - timedelta(seconds=rng.randint(0, 90 * 86400)),
+                }
+                for _ in range(start, min(clicks, start + 50000))
+            ]
+            db.execute(insert(models.ClickEvent), rows)
+            crud.update_visitor_sketches(db, (
+                (row["link_id"], (row["link_id"] - 1) % users + 1, row["ip_address"], row["timestamp"])
+                for row in rows
+            ))
+        db.execute(text(
+            "UPDATE affiliate_links SET clicks = "
+            "(SELECT count(*) FROM click_events WHERE click_events.link_id = affiliate_links.id)"
+        ))
+        db.commit()
+        materialize_rollups(db)
+        return codes
+    finally:
+        db.close()
+
+
+def make_workload(name, codes, users, run_id):
+    rng = random.Random(run_id)
+
+    def own_link_id():
+        # The API acts as user 1, who owns link ids 1, N+1, 2N+1, ...
+        return 1 + rng.randrange(max(1, len(codes) // users)) * users
+
+    if name == "redirect":
+        return lambda i: ("GET", f"/r/{rng.choice(codes)}", {})
+
+    if name == "dashboard":
+        def dashboard(i):
+            kind = i % 4
+            if kind == 0:
+                return "GET", "/dashboard/stats", {}
+            if kind == 1:
+                return "GET", "/links/?limit=100", {}
+            if kind == 2:
+                return "GET", "/dashboard/stats/timeseries?granularity=day", {}
+            return "GET", f"/links/{own_link_id()}/stats", {}
+        return dashboard
+
+    def revenue(i):
+        events = [
+            {"link_id": own_link_id(), "amount": 1.25, "transaction_id": f"{run_id}-{i}-{n}"}
+            for n in range(REVENUE_BATCH)
+        ]
+        return "POST", "/revenue/batch", {"json": {"events": events}}
+    return revenue
+
+
+def request_count(name, args):
+    return args.revenue_batches if name == "revenue" else args.requests
+
+
+async def run_inprocess(workloads, args, codes):
+    from app.main import app
+
+    results = []
+    await app.router.startup()
+    try:
+        async with asgi_client(app) as client:
+            for name in workloads:
+                total = request_count(name, args)
+                make_request = make_workload(name, codes, args.users, f"inprocess-{name}-{time.time()}")
+                await drive(client, make_request, min(total, 100), args.concurrency)  # warm-up
+                results.append(dict(target="inprocess", workload=name,
+                                    **await drive(client, make_request, total, args.concurrency)))
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+async def run_uvicorn(workloads, args, codes):
+    import httpx
+
+    env = dict(os.environ, PORT=str(args.port), LINKFLOW_WORKERS=str(args.workers))
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_ROOT, "run.py")],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = []
+    try:
+        async with httpx.AsyncClient(base_url=base_url, headers=BROWSER_HEADERS,
+                                     limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("uvicorn did not come up")
+                await asyncio.sleep(0.1)
+
+            for name in workloads:
+                total = request_count(name, args)
+                make_request = make_workload(name, codes, args.users, f"uvicorn-{name}-{time.time()}")
+                await drive(client, make_request, min(total, 100), args.concurrency)  # warm-up
+                results.append(dict(target="uvicorn", workload=name,
+                                    **await drive(client, make_request, total, args.concurrency)))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return results
+
+
+def compare(results, baseline_path, max_regression):
+    with open(baseline_path) as f:
+        baseline = {(row["target"], row["workload"]): row for row in json.load(f)["results"]}
+    regressions = []
+    for row in results:
+        before = baseline.get((row["target"], row["workload"]))
+        if before is None:
+            continue
+        if before["throughput_rps"] and row["throughput_rps"] < before["throughput_rps"] * (1 - max_regression):
+            regressions.append(f"{row['target']}/{row['workload']}: throughput "
+                               f"{before['throughput_rps']} -> {row['throughput_rps']} rps")
+        if before["p99_ms"] and row["p99_ms"] > before["p99_ms"] * (1 + max_regression):
+            regressions.append(f"{row['target']}/{row['workload']}: p99 "
+                               f"{before['p99_ms']} -> {row['p99_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--links", type=int, default=10000)
+    parser.add_argument("--clicks", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--revenue-batches", type=int, default=50,
+                        help=f"requests for the revenue workload ({REVENUE_BATCH} events each)")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--workload", choices=WORKLOADS + ("all",), default="all")
+    parser.add_argument("--target", choices=("inprocess", "uvicorn", "both"), default="inprocess")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (LINKFLOW_WORKERS)")
+    parser.add_argument("--database", help="SQLite file to seed/reuse (default: a fresh temp file)")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="previous --out file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.database:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.database)}"
+    elif "DATABASE_URL" not in os.environ:
+        use_temp_database()
+
+    started = time.perf_counter()
+    codes = seed(args.users, args.links, args.clicks)
+    seed_seconds = time.perf_counter() - started
+    print(f"Seeded {args.users} users, {len(codes)} links, {args.clicks} clicks in {seed_seconds:.1f}s")
+
+    workloads = WORKLOADS if args.workload == "all" else (args.workload,)
+    results = []
+    if args.target in ("inprocess", "both"):
+        results += asyncio.run(run_inprocess(workloads, args, codes))
+    if args.target in ("uvicorn", "both"):
+        results += asyncio.run(run_uvicorn(workloads, args, codes))
+
+    print_table(results, ["target", "workload", "requests", "errors", "throughput_rps",
+                          "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "users": args.users,
+            "links": len(codes),
+            "clicks": args.clicks,
+            "requests": args.requests,
+            "revenue_batches": args.revenue_batches,
+            "concurrency": args.concurrency,
+            "seed_seconds": round(seed_seconds, 3),
+            "env": {key: value for key, value in os.environ.items() if key.startswith("LINKFLOW_")},
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Micro-benchmark of the redirect path: RedirectFastPath vs the FastAPI route.
+
+    python benchmarks/redirect.py --requests 20000 --concurrency 50
+
+Each mode runs in its own subprocess (LINKFLOW_REDIRECT_FAST_PATH is read at
+import time) on a fresh temporary database. Requests are ASGI calls made
+directly on the app, without an HTTP client or server, so the numbers are the
+application's own per-redirect cost. Links are warm in the cache, clicks go
+to the background ingestor, and every request comes from a distinct client
+address so none is dropped as a repeat.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import BROWSER_HEADERS, print_table, summarize, use_temp_database
+
+MODES = {"route": "0", "fastpath": "1"}
+
+
+async def run_workload(total, concurrency, links):
+    from app.main import app
+    from app import crud
+    from app.database import SessionLocal
+    from app.manage import migrate
+
+    migrate()
+    db = SessionLocal()
+    try:
+        result = crud.create_affiliate_links_bulk(
+            db, ({"title": f"Bench {i}", "destination_url": f"https://example.com/p/{i}?ref=bench"}
+                 for i in range(links)),
+            user_id=1
+        )
+        codes = [link["short_code"] for link in result["links"]]
+    finally:
+        db.close()
+
+    headers = [(name.lower().encode(), value.encode()) for name, value in BROWSER_HEADERS.items()]
+    headers.append((b"referer", b"https://news.example.com/"))
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def call(i):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        code = codes[i % len(codes)]
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "server": ("bench", 80),
+            "client": (f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", 50000),
+            "root_path": "", "path": f"/r/{code}", "raw_path": f"/r/{code}".encode(),
+            "query_string": b"", "headers": headers,
+        }
+        started = time.perf_counter()
+        await app(scope, receive, send)
+        elapsed = time.perf_counter() - started
+        return elapsed, sent[0]["status"]
+
+    await app.router.startup()
+    try:
+        for i in range(len(codes)):  # warm the link cache
+            await call(i)
+        latencies = []
+        errors = 0
+        indices = iter(range(len(codes), len(codes) + total))
+
+        async def worker():
+            nonlocal errors
+            for i in indices:
+                elapsed, status = await call(i)
+                latencies.append(elapsed)
+                if status != 302:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize(latencies, time.perf_counter() - started, errors)
+    finally:
+        await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.mode:
+        result = asyncio.run(run_workload(args.requests, args.concurrency, args.links))
+        print(json.dumps(result))
+        return
+
+    results = []
+    for mode, flag in MODES.items():
+        env = dict(os.environ, LINKFLOW_REDIRECT_FAST_PATH=flag, LINKFLOW_SLOW_REQUEST_MS="0")
+        use_temp_database(env)
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--requests", str(args.requests),
+             "--concurrency", str(args.concurrency), "--links", str(args.links)],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+        results.append(dict(mode=mode, **json.loads(output.strip().splitlines()[-1])))
+
+    print_table(results, ["mode", "requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Per-page cost of GET /links/ with and without LINKFLOW_FAST_JSON.
+
+    python benchmarks/serialization.py --pages 200 --sizes 100,500,1000
+
+For each page size, times the two halves of building a response:
+
+    query      loading the page (ORM objects vs plain column tuples)
+    serialize  response_model validation + JSONResponse (default) vs
+               dict(zip(...)) + orjson (fast)
+
+Both paths run in-process against the same temporary database, and their
+bodies are checked to be byte-identical.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from common import print_table, use_temp_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="pages timed per size and path")
+    parser.add_argument("--sizes", default="100,500,1000")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    use_temp_database()
+    # Only the fast path's orjson import depends on it; both paths are timed
+    os.environ["LINKFLOW_FAST_JSON"] = "1"
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+
+    from app import crud
+    from app.database import SessionLocal, engine
+    from app.fastjson import FastJSONResponse
+    from app.main import app
+    from app.migrations import run_migrations
+
+    run_migrations(engine)
+    db = SessionLocal()
+    crud.create_affiliate_links_bulk(
+        db, ({"title": f"Bench link {i}", "destination_url": f"https://example.com/p/{i}"} for i in range(max(sizes))),
+        user_id=1, return_links=False
+    )
+    route = next(
+        route for route in app.routes
+        if getattr(route, "path", None) == "/links/" and "GET" in route.methods
+    )
+
+    def default_page(limit):
+        links, _ = crud.get_user_links_page(db, 1, limit=limit)
+        db.rollback()
+        return links
+
+    def default_body(links):
+        content = asyncio.run(serialize_response(field=route.response_field, response_content=links, is_coroutine=True))
+        return JSONResponse(content).body
+
+    def fast_page(limit):
+        links, _ = crud.get_user_link_rows_page(db, 1, limit=limit)
+        db.rollback()
+        return links
+
+    def fast_body(links):
+        return FastJSONResponse([dict(zip(crud.LINK_ROW_FIELDS, link)) for link in links]).body
+
+    def timed(func, arg):
+        started = time.perf_counter()
+        for _ in range(args.pages):
+            result = func(arg)
+        return (time.perf_counter() - started) / args.pages * 1000, result
+
+    results = []
+    for size in sizes:
+        bodies = {}
+        for path, page, body in (("default", default_page, default_body), ("fast", fast_page, fast_body)):
+            query_ms, links = timed(page, size)
+            serialize_ms, bodies[path] = timed(body, links)
+            results.append({
+                "page_size": size,
+                "path": path,
+                "query_ms": round(query_ms, 3),
+                "serialize_ms": round(serialize_ms, 3),
+                "total_ms": round(query_ms + serialize_ms, 3),
+            })
+        if bodies["default"] != bodies["fast"]:
+            raise SystemExit(f"Bodies differ for page size {size}")
+
+    print_table(results, ["page_size", "path", "query_ms", "serialize_ms", "total_ms"])
+
+
+if __name__ == "__main__":
+    main()
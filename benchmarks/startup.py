@@ -0,0 +1,120 @@
+"""Cold-start time: from spawning the server process to its first response.
+
+    python benchmarks/startup.py --runs 5 [--workers 1] [--links 10000]
+
+Each run starts `python run.py` on a fresh port and polls GET /health until
+it answers 200. Timed per mode, on a temporary database set up beforehand:
+
+    import     `python -c "import app.main"` to exit, for reference
+    setup      run.py with LINKFLOW_SETUP_ON_START=1 (migrations and seed
+               checks on an already set-up database, as on a redeploy)
+    no-setup   run.py with LINKFLOW_SETUP_ON_START=0 (setup done by a
+               release step)
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from common import REPO_ROOT, print_table, summarize, use_temp_database
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_health(port, server, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("server exited before answering")
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+        try:
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            connection.close()
+        time.sleep(0.005)
+    raise RuntimeError("server did not answer in time")
+
+
+def time_server(env, timeout):
+    port = free_port()
+    env = dict(env, PORT=str(port))
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_ROOT, "run.py")],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_health(port, server, timeout)
+        return time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def time_import(env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app.main"], cwd=REPO_ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def prepare(env, links):
+    # Migrate, seed and add some links, in a child so this process stays clean
+    script = (
+        "from app import crud\n"
+        "from app.database import SessionLocal\n"
+        "from app.manage import setup\n"
+        "setup()\n"
+        "db = SessionLocal()\n"
+        f"crud.create_affiliate_links_bulk(db, ({{'title': f'Bench {{i}}', "
+        f"'destination_url': f'https://example.com/{{i}}'}} for i in range({links})), "
+        "user_id=1, return_links=False)\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (LINKFLOW_WORKERS)")
+    parser.add_argument("--links", type=int, default=10000, help="links in the database before timing")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    env = dict(os.environ, LINKFLOW_WORKERS=str(args.workers), PYTHONPATH=REPO_ROOT)
+    use_temp_database(env)
+    prepare(env, args.links)
+
+    modes = {
+        "import": lambda: time_import(env),
+        "setup": lambda: time_server(dict(env, LINKFLOW_SETUP_ON_START="1"), args.timeout),
+        "no-setup": lambda: time_server(dict(env, LINKFLOW_SETUP_ON_START="0"), args.timeout),
+    }
+    results = []
+    for mode, run in modes.items():
+        seconds = [run() for _ in range(args.runs)]
+        summary = summarize(seconds, sum(seconds))
+        results.append({"mode": mode, "runs": args.runs, "min_ms": round(min(seconds) * 1000, 1),
+                        "p50_ms": summary["p50_ms"], "max_ms": summary["max_ms"]})
+
+    print_table(results, ["mode", "runs", "min_ms", "p50_ms", "max_ms"])
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"workers": args.workers, "links": args.links, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,87 @@
 import uvicorn
 import os
+import atexit
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+# Request worker processes. With more than one, run.py also starts a writer
+# process that does every click and revenue write, so redirect and postback
+# traffic never has the workers competing for SQLite's write lock.
+WORKERS = int(os.environ.get("LINKFLOW_WORKERS", 1))
+# Migrations and demo data (`python -m app.manage setup`) run here once,
+# before any worker starts. Set to 0 where a release step already runs them.
+SETUP_ON_START = os.environ.get("LINKFLOW_SETUP_ON_START", "1") == "1"
+# Proxies whose X-Forwarded-For names the client, comma-separated ("*" for
+# any). Rate limits, click dedup and unique visitors key on the client IP,
+# so behind a load balancer (Render's included) list it here, or every
+# visitor shares the proxy's address.
+FORWARDED_ALLOW_IPS = os.environ.get(
+    "LINKFLOW_FORWARDED_ALLOW_IPS", os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+)
+
+
+def start_writer():
+    from app.writer import run_writer
+
+    socket_path = os.environ.get("LINKFLOW_WRITER_SOCKET")
+    if not socket_path:
+        socket_dir = tempfile.mkdtemp(prefix="linkflow-")
+        socket_path = os.path.join(socket_dir, "writer.sock")
+        atexit.register(shutil.rmtree, socket_dir, ignore_errors=True)
+    authkey = os.urandom(32)
+    writer = multiprocessing.get_context("spawn").Process(
+        target=run_writer, args=(socket_path, authkey), name="linkflow-writer"
+    )
+    writer.start()
+    deadline = time.monotonic() + 30
+    while not os.path.exists(socket_path):
+        if not writer.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError("Writer process did not start")
+        time.sleep(0.05)
+
+    # Inherited by the worker processes uvicorn spawns
+    os.environ["LINKFLOW_WRITER_SOCKET"] = socket_path
+    os.environ["LINKFLOW_WRITER_AUTHKEY"] = authkey.hex()
+    return writer
+
 
 if __name__ == "__main__":
     # Get port from environment variable (Render sets this automatically)
     port = int(os.environ.get("PORT", 8000))
 
-    # Run Uvicorn server
-    uvicorn.run(
-        "app.main:app",  # Your FastAPI app path
-        host="0.0.0.0",
-        port=port,
-        log_level="info",
-        access_log=True,
-        reload=False  # Disable reload for production
-    )
+    if SETUP_ON_START:
+        from app.manage import setup
+        setup()
+
+    writer = None
+    if WORKERS > 1:
+        from app.database import DB_PROFILE
+        if DB_PROFILE != "production":
+            print("⚠️ Several workers share SQLite best with LINKFLOW_DB_PROFILE=production (WAL)")
+        writer = start_writer()
+
+    print("🌐 Available routes:")
+    print(f"   http://localhost:{port}/ - Landing page")
+    print(f"   http://localhost:{port}/dashboard - Dashboard")
+    print(f"   http://localhost:{port}/api/docs - API Documentation")
+    print(f"   http://localhost:{port}/health - Health check")
+
+    try:
+        # Run Uvicorn server
+        uvicorn.run(
+            "app.main:app",  # Your FastAPI app path
+            host="0.0.0.0",
+            port=port,
+            log_level="info",
+            access_log=True,
+            reload=False,  # Disable reload for production
+            workers=WORKERS,
+            proxy_headers=True,
+            forwarded_allow_ips=FORWARDED_ALLOW_IPS
+        )
+    finally:
+        if writer is not None:
+            writer.terminate()
+            writer.join()
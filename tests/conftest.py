@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import crud, schemas  # noqa: E402
+from app.hll import register_sqlite_functions  # noqa: E402
+from app.migrations import run_migrations  # noqa: E402
+
+
+def migrated_engine(path):
+    # A file database migrated the way `python -m app.manage migrate` does it
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", lambda dbapi_connection, record: register_sqlite_functions(dbapi_connection))
+    run_migrations(engine)
+    return engine
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = migrated_engine(tmp_path / "test.db")
+    session = Session(bind=engine)
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def make_links(db, count, email="owner@test.example"):
+    # -> (user id, [link ids])
+    user = crud.create_user(db, schemas.UserCreate(email=email, username=email.split("@")[0], password="secret"))
+    result = crud.create_affiliate_links_bulk(db, (
+        {"title": f"Link {n}", "destination_url": f"https://example.com/{n}"} for n in range(count)
+    ), user_id=user.id)
+    return user.id, sorted(link["id"] for link in result["links"])
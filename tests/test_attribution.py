@@ -0,0 +1,99 @@
+"""Last-click attribution against a brute-force search of the same clicks.
+
+    python -m pytest tests/test_attribution.py
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from app import crud, models
+from app.attribution import attribute_revenue
+from conftest import make_links
+
+START = datetime(2024, 3, 1)
+WINDOW_DAYS = 2
+
+
+def brute_force(clicks, event_link, event_ts, window):
+    # clicks: [(id, link_id, timestamp)]; the latest at or before the event,
+    # highest id among clicks with the same timestamp
+    candidates = [click for click in clicks
+                  if click[1] == event_link and click[2] <= event_ts and event_ts - click[2] <= window]
+    if not candidates:
+        return None, None
+    click = max(candidates, key=lambda click: (click[2], click[0]))
+    return click[0], (event_ts - click[2]).total_seconds()
+
+
+def seed(db, rng, links, user_id, clicks, events):
+    crud.ingest_clicks(db, sorted(
+        # Whole minutes, so several clicks on a link share a timestamp
+        (rng.choice(links), user_id, f"198.51.100.{n % 200}", "agent", None,
+         START + timedelta(minutes=rng.randrange(10 * 24 * 60)))
+        for n in range(clicks)
+    ))
+    if events:
+        db.execute(insert(models.RevenueEvent), [
+            {"link_id": rng.choice(links), "amount": 1.0, "transaction_id": f"t{n}",
+             "timestamp": START + timedelta(seconds=rng.randrange(12 * 24 * 3600))}
+            for n in range(events)
+        ])
+    db.commit()
+    stored_clicks = [tuple(row) for row in db.query(
+        models.ClickEvent.id, models.ClickEvent.link_id, models.ClickEvent.timestamp)]
+    return stored_clicks
+
+
+def attributions(db):
+    return {
+        row.id: row for row in db.query(
+            models.RevenueEvent.id, models.RevenueEvent.link_id, models.RevenueEvent.timestamp,
+            models.RevenueEvent.attributed_click_id, models.RevenueEvent.time_to_convert
+        )
+    }
+
+
+def test_matches_brute_force(db):
+    rng = random.Random(3)
+    user_id, links = make_links(db, 12)
+    clicks = seed(db, rng, links, user_id, clicks=4000, events=600)
+
+    # Small batches so the cursor and chunked click reads are exercised
+    result = attribute_revenue(db, now=START + timedelta(days=30), window_days=WINDOW_DAYS, delay=0, batch_size=37)
+    assert result["revenue_events"] == 600
+
+    window = timedelta(days=WINDOW_DAYS)
+    attributed = 0
+    for event in attributions(db).values():
+        click_id, seconds = brute_force(clicks, event.link_id, event.timestamp, window)
+        assert (event.attributed_click_id, event.time_to_convert) == (click_id, seconds), event
+        attributed += click_id is not None
+    assert result["attributed"] == attributed
+    assert 0 < attributed < 600
+    assert crud.get_conversion_latency(db, user_id)["conversions"] == attributed
+
+
+def test_waits_for_unsettled_revenue(db):
+    rng = random.Random(4)
+    user_id, links = make_links(db, 4)
+    clicks = seed(db, rng, links, user_id, clicks=500, events=0)
+    last_click = max(click[2] for click in clicks)
+    db.execute(insert(models.RevenueEvent), [
+        {"link_id": links[0], "amount": 1.0, "timestamp": last_click - timedelta(minutes=5)},
+        {"link_id": links[1], "amount": 1.0, "timestamp": last_click},
+        {"link_id": links[2], "amount": 1.0, "timestamp": last_click - timedelta(minutes=10)},
+    ])
+    db.commit()
+
+    # The second event is within the delay, so it and everything after it waits
+    window = timedelta(days=WINDOW_DAYS)
+    attribute_revenue(db, now=last_click + timedelta(seconds=30), window_days=WINDOW_DAYS, delay=60)
+    rows = sorted(attributions(db).values(), key=lambda row: row.id)
+    assert rows[0].attributed_click_id is not None
+    assert rows[0].attributed_click_id == brute_force(clicks, links[0], rows[0].timestamp, window)[0]
+    assert [row.attributed_click_id for row in rows[1:]] == [None, None]
+
+    attribute_revenue(db, now=last_click + timedelta(minutes=5), window_days=WINDOW_DAYS, delay=60)
+    for row in attributions(db).values():
+        assert row.attributed_click_id == brute_force(clicks, row.link_id, row.timestamp, window)[0]
@@ -0,0 +1,61 @@
+"""Click dedup and bot filtering.
+
+    python -m pytest tests/test_clickfilter.py
+"""
+from app.clickfilter import BloomFilter, ClickFilter, SlidingWindowDeduplicator
+
+BROWSER = "Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0"
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(capacity=20000, error_rate=0.01)
+    for n in range(20000):
+        bloom.add(bloom.positions(f"in-{n}".encode()))
+    assert all(bloom.contains(bloom.positions(f"in-{n}".encode())) for n in range(20000))
+    false_positives = sum(bloom.contains(bloom.positions(f"out-{n}".encode())) for n in range(20000))
+    # 1% expected; allow for chance
+    assert false_positives <= 20000 * 0.02
+
+
+def test_repeats_within_window_are_duplicates():
+    dedup = SlidingWindowDeduplicator(window=60, capacity=1000, buckets=6)
+    assert dedup.seen(b"a", now=1000.0) is False
+    for offset in (1, 10, 49):
+        assert dedup.seen(b"a", now=1000.0 + offset) is True
+    assert dedup.seen(b"b", now=1000.0 + 49) is False
+
+
+def test_keys_are_forgotten_after_window():
+    dedup = SlidingWindowDeduplicator(window=60, capacity=1000, buckets=6)
+    dedup.seen(b"a", now=1000.0)
+    # Remembered for at least (buckets - 1) / buckets of the window, at most all of it
+    assert dedup.seen(b"a", now=1000.0 + 61) is False
+
+
+def test_false_positive_rate_under_capacity():
+    dedup = SlidingWindowDeduplicator(window=60, capacity=60000, error_rate=0.001, buckets=6)
+    # 10k distinct keys per 10s slice, all new: anything flagged is a false positive
+    flagged = sum(dedup.seen(f"key-{n}".encode(), now=n / 1000) for n in range(60000))
+    assert flagged <= 60000 * 0.001 * 3
+    assert dedup.saturated == 0
+
+
+def test_click_filter_verdicts():
+    click_filter = ClickFilter(window=60, capacity=1000)
+    assert click_filter.check(1, "203.0.113.1", BROWSER, now=0) is None
+    assert click_filter.check(1, "203.0.113.1", BROWSER, now=5) == "duplicate"
+    # Same visitor, other link; other visitor, same link
+    assert click_filter.check(2, "203.0.113.1", BROWSER, now=5) is None
+    assert click_filter.check(1, "203.0.113.2", BROWSER, now=5) is None
+    assert click_filter.check(1, "203.0.113.3", "Mozilla/5.0 (compatible; Googlebot/2.1)", now=5) == "bot"
+    assert click_filter.check(1, "203.0.113.3", "curl/8.4.0", now=5) == "bot"
+    assert click_filter.check(1, "203.0.113.3", None, now=5) == "bot"
+    assert click_filter.check(1, "203.0.113.1", BROWSER, now=120) is None
+    assert click_filter.stats()["accepted"] == 4
+    assert click_filter.stats()["rejected"] == {"duplicate": 1, "bot": 3}
+
+
+def test_click_filter_disabled():
+    click_filter = ClickFilter(window=0, filter_bots=False)
+    assert click_filter.check(1, "203.0.113.1", "curl/8.4.0", now=0) is None
+    assert click_filter.check(1, "203.0.113.1", "curl/8.4.0", now=1) is None
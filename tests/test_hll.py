@@ -0,0 +1,62 @@
+"""HyperLogLog estimates stay within the error bound app/hll.py documents.
+
+    python -m pytest tests/test_hll.py
+"""
+import sqlite3
+
+import pytest
+
+from app import hll
+
+
+def sketch_of(values):
+    sketch = hll.HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+@pytest.mark.parametrize("count", [0, 1, 10, 100, 1000, 5000, 20000, 100000])
+def test_estimate_within_three_standard_errors(count):
+    estimate = sketch_of(f"198.51.{n >> 8}.{n & 255}-{n}" for n in range(count)).estimate()
+    assert abs(estimate - count) <= max(1, 3 * hll.RELATIVE_ERROR * count)
+
+
+def test_small_counts_are_nearly_exact():
+    # Linear counting range
+    for count in (1, 2, 5, 50, 500):
+        assert abs(sketch_of(str(n) for n in range(count)).estimate() - count) <= max(1, count * 0.01)
+
+
+def test_repeats_do_not_count():
+    values = [f"visitor-{n}" for n in range(3000)]
+    assert sketch_of(values * 5).registers == sketch_of(values).registers
+
+
+def test_merge_is_the_union():
+    days = [[f"v{n}" for n in range(start, start + 8000)] for start in (0, 5000, 10000)]
+    merged = hll.HyperLogLog()
+    for day in days:
+        merged.merge(sketch_of(day))
+    assert merged.registers == sketch_of(value for day in days for value in day).registers
+    assert abs(merged.estimate() - 18000) <= 3 * hll.RELATIVE_ERROR * 18000
+
+
+@pytest.mark.parametrize("count", [0, 3, 1000, 50000])
+def test_serialization_round_trips(count):
+    # Sparse below about REGISTERS / 3 filled registers, dense above
+    sketch = sketch_of(str(n) for n in range(count))
+    blob = sketch.to_bytes()
+    assert blob[:1] == (b"\x02" if len(sketch.registers) > hll.REGISTERS // 3 else b"\x01")
+    assert hll.HyperLogLog.from_bytes(blob).registers == sketch.registers
+
+
+def test_sqlite_merge_function():
+    connection = sqlite3.connect(":memory:")
+    hll.register_sqlite_functions(connection)
+    left = sketch_of(str(n) for n in range(0, 4000))
+    right = sketch_of(str(n) for n in range(2000, 9000))
+    blob, = connection.execute("SELECT hll_merge(?, ?)", (left.to_bytes(), right.to_bytes())).fetchone()
+    assert hll.HyperLogLog.from_bytes(blob).registers == sketch_of(str(n) for n in range(9000)).registers
+    assert connection.execute("SELECT hll_merge(NULL, ?)", (right.to_bytes(),)).fetchone()[0] == right.to_bytes()
+    connection.close()
@@ -0,0 +1,125 @@
+"""Click ingestion: batched writes through ClickIngestor and crud.ingest_clicks.
+
+    python -m pytest tests/test_ingest.py
+"""
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+from app.ingest import ClickIngestor
+from conftest import make_links
+
+NOW = datetime(2024, 5, 1, 12, 0)
+
+
+def click(link_id, user_id, n=0, user_agent="Mozilla/5.0", referrer=None):
+    return (link_id, user_id, f"203.0.113.{n % 250}", user_agent, referrer, NOW)
+
+
+def counters(db, link_ids):
+    db.expire_all()
+    return {link_id: clicks for link_id, clicks in db.query(models.AffiliateLink.id, models.AffiliateLink.clicks)
+            .filter(models.AffiliateLink.id.in_(link_ids))}
+
+
+def stored(db, link_ids):
+    db.expire_all()
+    return dict(db.query(models.ClickEvent.link_id, func.count()).filter(models.ClickEvent.link_id.in_(link_ids))
+                .group_by(models.ClickEvent.link_id))
+
+
+def test_failed_flush_leaves_nothing_behind(db, monkeypatch):
+    user_id, links = make_links(db, 2)
+    ingestor = ClickIngestor(sessionmaker(bind=db.get_bind()))
+    batch = [click(links[n % 2], user_id, n, user_agent=f"New agent {n}", referrer=f"https://new{n}.example/")
+             for n in range(6)]
+
+    # Fails after the new strings have been interned and committed
+    def fail(db, clicks):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(crud, "update_visitor_sketches", fail)
+    ingestor.enqueue_many(batch)
+    assert ingestor.failures == 1
+    assert ingestor.stats()["queued"] == 6
+    assert counters(db, links) == {links[0]: 0, links[1]: 0}
+    assert stored(db, links) == {}
+
+    # The retry writes the batch once
+    monkeypatch.undo()
+    assert ingestor.flush() == 6
+    assert counters(db, links) == {links[0]: 3, links[1]: 3}
+    assert stored(db, links) == {links[0]: 3, links[1]: 3}
+
+
+def test_clicks_on_deleted_links_are_dropped(db):
+    user_id, links = make_links(db, 2)
+    crud.delete_link(db, links[1], user_id)
+    crud.ingest_clicks(db, [click(links[0], user_id, 1), click(links[1], user_id, 2), click(links[1], user_id, 3)])
+    assert stored(db, links) == {links[0]: 1}
+    assert counters(db, links) == {links[0]: 1}
+
+
+def test_counters_are_incremented_in_sql(db):
+    user_id, links = make_links(db, 2)
+    # A stale copy of the link in this session must not overwrite a concurrent count
+    link = db.get(models.AffiliateLink, links[0])
+    assert link.clicks == 0
+    with sessionmaker(bind=db.get_bind())() as other:
+        crud.ingest_clicks(other, [click(links[0], user_id, n) for n in range(10)])
+    crud.ingest_clicks(db, [click(links[0], user_id, 1), click(links[0], user_id, 2), click(links[1], user_id, 3)])
+    assert counters(db, links) == {links[0]: 12, links[1]: 1}
+    assert stored(db, links) == {links[0]: 12, links[1]: 1}
+
+
+def test_background_flush_writes_one_batch(db):
+    user_id, links = make_links(db, 2)
+    ingestor = ClickIngestor(sessionmaker(bind=db.get_bind()), batch_size=100, flush_interval=60)
+    ingestor.start()
+    assert not ingestor.writes_through
+    assert ingestor.enqueue_many([click(links[n % 2], user_id, n) for n in range(5)]) == 5
+    assert ingestor.enqueue(click(links[0], user_id, 5))
+    assert stored(db, links) == {}
+    ingestor.stop()
+    assert (ingestor.flushes, ingestor.flushed, ingestor.stats()["queued"]) == (1, 6, 0)
+    assert stored(db, links) == {links[0]: 4, links[1]: 2}
+
+
+def test_full_queue_drops_new_clicks():
+    ingestor = ClickIngestor(None, flush_interval=60, max_queue=3, sink=lambda batch: None)
+    ingestor.start()
+    assert ingestor.enqueue_many([click(1, 1, n) for n in range(5)]) == 3
+    assert ingestor.enqueue(click(1, 1, 5)) is False
+    assert (ingestor.enqueued, ingestor.dropped) == (3, 3)
+    ingestor.stop()
+    assert ingestor.flushed == 3
+
+
+def test_requeued_batch_keeps_its_order():
+    batches = []
+
+    def sink(batch):
+        if not batches:
+            batches.append(None)
+            raise RuntimeError("writer unavailable")
+        batches.append(batch)
+
+    ingestor = ClickIngestor(None, sink=sink)
+    ingestor.enqueue_many([click(1, 1, n) for n in range(3)])
+    assert (ingestor.failures, ingestor.stats()["queued"]) == (1, 3)
+    ingestor.enqueue(click(1, 1, 3))
+    assert batches[1] == [click(1, 1, n) for n in range(4)]
+    assert ingestor.stats()["queued"] == 0
+
+
+def test_sync_mode_writes_through():
+    batches = []
+    ingestor = ClickIngestor(None, durability="sync", sink=batches.append)
+    ingestor.start()
+    assert ingestor.writes_through
+    ingestor.enqueue(click(1, 1, 0))
+    ingestor.enqueue_many([click(1, 1, 1), click(1, 1, 2)])
+    assert batches == [[click(1, 1, 0)], [click(1, 1, 1), click(1, 1, 2)]]
+    ingestor.stop()
@@ -0,0 +1,137 @@
+"""Leaderboards against a brute-force recount of the same events.
+
+    python -m pytest tests/test_leaderboard.py
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import crud
+from app.leaderboard import METRICS, WINDOWS, Leaderboards
+from conftest import make_links
+
+START = datetime(2024, 3, 1, 0, 0)
+LINKS = {link_id: 1 + link_id % 3 for link_id in range(1, 41)}  # link_id -> user_id
+
+
+def _hour(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def brute_force_top(events, metric, window, n, user_id, now):
+    span = WINDOWS[window]
+    totals = {}
+    for link_id, owner, ts, clicks, revenue in events:
+        if user_id is not None and owner != user_id:
+            continue
+        if span is not None and _hour(ts) <= _hour(now) - timedelta(hours=span):
+            continue
+        current = totals.setdefault(link_id, [0, 0.0])
+        current[0] += clicks
+        current[1] += revenue
+    ranked = sorted(
+        (link_id for link_id, current in totals.items() if current[METRICS.index(metric)] > 0),
+        key=lambda link_id: (-totals[link_id][METRICS.index(metric)], link_id)
+    )
+    return [(link_id, totals[link_id][0], round(totals[link_id][1], 6)) for link_id in ranked[:n]]
+
+
+def random_events(rng, count, days):
+    events = []
+    for _ in range(count):
+        link_id = rng.choice(list(LINKS))
+        ts = START + timedelta(minutes=rng.randrange(days * 24 * 60))
+        # Quarters keep float sums exact, so ties are real ties
+        if rng.random() < 0.8:
+            events.append((link_id, LINKS[link_id], ts, rng.randint(1, 3), 0.0))
+        else:
+            events.append((link_id, LINKS[link_id], ts, 0, rng.randint(1, 40) / 4))
+    return sorted(events, key=lambda event: event[2])
+
+
+def assert_matches(boards, events, now):
+    for user_id in (None, *sorted(set(LINKS.values()))):
+        for metric in METRICS:
+            for window in WINDOWS:
+                for n in (1, 5, len(LINKS)):
+                    expected = brute_force_top(events, metric, window, n, user_id, now)
+                    assert boards.top(metric, window, n, user_id=user_id, now=now) == expected, \
+                        (user_id, metric, window, n, now)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_incremental_updates_match_recount(seed):
+    rng = random.Random(seed)
+    events = random_events(rng, 3000, days=10)
+    boards = Leaderboards()
+    boards.load([], [], now=START)
+    seen = []
+    for start in range(0, len(events), 250):
+        batch = events[start:start + 250]
+        now = batch[-1][2] + timedelta(minutes=rng.randrange(90))
+        boards.record(batch, now=now)
+        seen.extend(batch)
+        assert_matches(boards, seen, now)
+
+
+def test_windows_slide_without_new_events():
+    rng = random.Random(7)
+    events = random_events(rng, 1000, days=3)
+    boards = Leaderboards()
+    boards.load([], [], now=START)
+    boards.record(events, now=events[-1][2])
+    for hours in (1, 12, 24, 25, 48, 24 * 7, 24 * 8):
+        now = events[-1][2] + timedelta(hours=hours)
+        assert_matches(boards, events, now)
+
+
+def test_remove_link_drops_it_everywhere():
+    rng = random.Random(11)
+    events = random_events(rng, 1500, days=9)
+    now = events[-1][2]
+    boards = Leaderboards()
+    boards.load([], [], now=START)
+    boards.record(events, now=now)
+
+    removed = {boards.top("clicks", "all", 1, now=now)[0][0], boards.top("revenue", "24h", 1, now=now)[0][0]}
+    for link_id in removed:
+        boards.remove_link(link_id)
+    assert_matches(boards, [event for event in events if event[0] not in removed], now)
+
+
+def test_load_matches_recorded_history():
+    # Startup rebuild: all-time counters per link plus hourly buckets of the
+    # last week, as rollups.load_leaderboards() reads them
+    rng = random.Random(5)
+    events = random_events(rng, 2000, days=12)
+    now = events[-1][2] + timedelta(minutes=30)
+
+    counters = {}
+    hourly = {}
+    for link_id, user_id, ts, clicks, revenue in events:
+        current = counters.setdefault((link_id, user_id), [0, 0.0])
+        current[0] += clicks
+        current[1] += revenue
+        if _hour(ts) > _hour(now) - timedelta(hours=max(span for span in WINDOWS.values() if span)):
+            bucket = hourly.setdefault((link_id, user_id, _hour(ts)), [0, 0.0])
+            bucket[0] += clicks
+            bucket[1] += revenue
+
+    boards = Leaderboards()
+    boards.load(
+        [(link_id, user_id, clicks, revenue) for (link_id, user_id), (clicks, revenue) in counters.items()],
+        [(link_id, user_id, hour, clicks, revenue) for (link_id, user_id, hour), (clicks, revenue) in hourly.items()],
+        now=now,
+    )
+    assert_matches(boards, events, now)
+
+
+def test_titles_are_filtered_by_owner(db):
+    mine, my_links = make_links(db, 2)
+    theirs, their_links = make_links(db, 1, email="rival@test.example")
+    titles = crud.get_link_titles(db, my_links + their_links)
+    assert {link_id: owner for link_id, (owner, _, _) in titles.items()} == {
+        my_links[0]: mine, my_links[1]: mine, their_links[0]: theirs
+    }
+    assert set(crud.get_link_titles(db, my_links + their_links, mine)) == set(my_links)
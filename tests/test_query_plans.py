@@ -0,0 +1,257 @@
+"""EXPLAIN QUERY PLAN for every query app/crud.py runs, on a seeded database.
+
+Each crud function is called with representative arguments while the SQL it
+sends is captured; every captured statement is then explained and must not
+fall back to scanning a whole table. A new crud function that talks to the
+database has to be added to CRUD_CALLS, or test_every_crud_query_is_covered
+fails.
+
+    python -m pytest tests/test_query_plans.py
+"""
+import inspect
+import itertools
+import re
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event, inspect as inspect_schema
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas
+from app.attribution import attribute_revenue
+from app.cache import link_cache, stats_cache
+from app.migrations import run_migrations
+from app.rollups import materialize_rollups
+from conftest import migrated_engine
+
+USERS = 3
+LINKS_PER_USER = 40
+CLICKS = 3000
+REVENUE_EVENTS = 200
+
+# Plan lines starting with "SCAN" read a whole table (or a whole index of
+# one), except these: the rows of an INSERT ... VALUES list
+ALLOWED_SCAN = re.compile(r"SCAN (\d+ )?CONSTANT ROWS?$")
+
+_unique = itertools.count(1)
+
+
+@pytest.fixture(scope="module")
+def seeded(tmp_path_factory):
+    # No ANALYZE, like a production affiliate.db: plans come from the schema
+    engine = migrated_engine(tmp_path_factory.mktemp("plans") / "plans.db")
+
+    now = datetime.utcnow()
+    db = Session(bind=engine)
+    users = []
+    links = {}
+    for i in range(1, USERS + 1):
+        user = crud.create_user(db, schemas.UserCreate(email=f"user{i}@plans.test", username=f"user{i}",
+                                                       password="secret"))
+        users.append(user.id)
+        result = crud.create_affiliate_links_bulk(db, (
+            {"title": f"Link {i}-{n}", "destination_url": f"https://example.com/{i}/{n}"}
+            for n in range(LINKS_PER_USER)
+        ), user_id=user.id)
+        links[user.id] = [(link["id"], link["short_code"]) for link in result["links"]]
+
+    owned = [(link_id, user_id) for user_id, user_links in links.items() for link_id, _ in user_links]
+    crud.ingest_clicks(db, [
+        (link_id, user_id, f"198.51.100.{n % 250}", f"agent-{n % 7}", f"https://ref{n % 5}.example/",
+         now - timedelta(minutes=n))
+        for n, (link_id, user_id) in ((n, owned[n % len(owned)]) for n in range(CLICKS))
+    ])
+    for user_id in users:
+        crud.track_revenue_events(db, [
+            schemas.RevenueEventCreate(link_id=links[user_id][n % LINKS_PER_USER][0], amount=1.5,
+                                       transaction_id=f"seed-{user_id}-{n}")
+            for n in range(REVENUE_EVENTS // USERS)
+        ], user_id=user_id)
+    materialize_rollups(db)
+    attribute_revenue(db, now=now + timedelta(hours=1))
+    db.close()
+
+    yield engine, {"now": now, "users": users, "links": links}
+    engine.dispose()
+
+
+def _first_link(ids, user_index=0):
+    user_id = ids["users"][user_index]
+    link_id, short_code = ids["links"][user_id][0]
+    return user_id, link_id, short_code
+
+
+def _links_page_cursor(db, ids, order_by):
+    user_id = ids["users"][0]
+    links, cursor = crud.get_user_links_page(db, user_id, limit=10, order_by=order_by)
+    return crud.get_user_links_page(db, user_id, limit=10, cursor=cursor, order_by=order_by)
+
+
+def _new_user(db):
+    n = next(_unique)
+    return crud.create_user(db, schemas.UserCreate(email=f"new{n}@plans.test", username=f"new{n}", password="x"))
+
+
+# crud function -> call(db, ids) exercising its queries
+CRUD_CALLS = {
+    "get_user_by_email": lambda db, ids: crud.get_user_by_email(db, "user1@plans.test"),
+    "get_user_by_username": lambda db, ids: crud.get_user_by_username(db, "user1"),
+    "create_user": lambda db, ids: _new_user(db),
+    "allocate_short_codes": lambda db, ids: crud.allocate_short_codes(db, 20),
+    "create_affiliate_link": lambda db, ids: crud.create_affiliate_link(
+        db, schemas.AffiliateLinkCreate(title="New", destination_url="https://example.com/new"), ids["users"][2]
+    ),
+    "create_affiliate_links_bulk": lambda db, ids: crud.create_affiliate_links_bulk(
+        db, [{"title": "Bulk", "destination_url": "https://example.com/bulk"}], ids["users"][2]
+    ),
+    "encode_links_cursor": lambda db, ids: crud.encode_links_cursor(
+        db, crud.get_link_by_id(db, _first_link(ids)[1]), "created_at"
+    ),
+    "get_user_links": lambda db, ids: crud.get_user_links(db, ids["users"][0], skip=5, limit=10),
+    "get_user_links_page": lambda db, ids: (_links_page_cursor(db, ids, "id"),
+                                            _links_page_cursor(db, ids, "created_at")),
+    "get_user_link_rows_page": lambda db, ids: crud.get_user_link_rows_page(db, ids["users"][0], limit=10),
+    "get_link_by_short_code": lambda db, ids: crud.get_link_by_short_code(db, _first_link(ids)[2]),
+    "resolve_short_code": lambda db, ids: (link_cache.clear(), crud.resolve_short_code(db, _first_link(ids)[2])),
+    "load_short_code": lambda db, ids: crud.load_short_code(db, _first_link(ids)[2]),
+    "get_link_by_id": lambda db, ids: crud.get_link_by_id(db, _first_link(ids)[1]),
+    "get_link_titles": lambda db, ids: (
+        crud.get_link_titles(db, [link_id for link_id, _ in ids["links"][ids["users"][0]]]),
+        crud.get_link_titles(db, [link_id for link_id, _ in ids["links"][ids["users"][0]]], ids["users"][0]),
+    ),
+    "update_link_clicks": lambda db, ids: crud.update_link_clicks(db, _first_link(ids)[1]),
+    "update_link_revenue": lambda db, ids: crud.update_link_revenue(db, _first_link(ids)[1], 2.0),
+    "delete_link": lambda db, ids: crud.delete_link(db, ids["links"][ids["users"][2]][-1][0], ids["users"][2]),
+    "create_click_event": lambda db, ids: crud.create_click_event(
+        db, schemas.ClickEventCreate(link_id=_first_link(ids)[1], ip_address="203.0.113.1")
+    ),
+    "ingest_clicks": lambda db, ids: crud.ingest_clicks(db, [
+        (_first_link(ids)[1], ids["users"][0], "203.0.113.2", "agent-new", None, datetime.utcnow())
+    ]),
+    "update_visitor_sketches": lambda db, ids: (crud.update_visitor_sketches(db, [
+        (_first_link(ids)[1], ids["users"][0], "203.0.113.3", datetime.utcnow())
+    ]), db.commit()),
+    "get_unique_visitors": lambda db, ids: (
+        crud.get_unique_visitors(db, ids["users"][0]),
+        crud.get_unique_visitors(db, ids["users"][0], start=date.today() - timedelta(days=7), end=date.today()),
+        crud.get_unique_visitors(db, ids["users"][0], link_id=_first_link(ids)[1], start=date.today()),
+    ),
+    "track_revenue_events": lambda db, ids: crud.track_revenue_events(db, [
+        schemas.RevenueEventCreate(link_id=_first_link(ids)[1], amount=3.0, transaction_id=f"new-{next(_unique)}"),
+        schemas.RevenueEventCreate(link_id=_first_link(ids)[1], amount=3.0, transaction_id="seed-1-0"),
+    ], ids["users"][0]),
+    # Always narrowed by its callers, like the retention job does here
+    "query_click_rows": lambda db, ids: crud.query_click_rows(db).filter(
+        models.ClickEvent.id > 100, models.ClickEvent.timestamp < ids["now"]
+    ).order_by(models.ClickEvent.id).limit(50).all(),
+    "user_owns_link": lambda db, ids: crud.user_owns_link(db, _first_link(ids)[1], ids["users"][0]),
+    "get_export_page": lambda db, ids: [
+        crud.get_export_page(db, kind, ids["users"][0], after_id=10, limit=100, link_id=link_id,
+                             start=ids["now"] - timedelta(days=1), end=ids["now"])
+        for kind in crud.EXPORT_COLUMNS for link_id in (None, _first_link(ids)[1])
+    ],
+    "get_job_cursor": lambda db, ids: crud.get_job_cursor(db, "rollup_clicks"),
+    "set_job_cursor": lambda db, ids: (crud.set_job_cursor(db, "plans_test", 1), db.commit()),
+    "get_link_timeseries": lambda db, ids: [
+        crud.get_link_timeseries(db, _first_link(ids)[1], ids["users"][0], ids["now"] - timedelta(days=2),
+                                 ids["now"], granularity)
+        for granularity in crud.ROLLUP_MODELS
+    ],
+    "get_user_timeseries": lambda db, ids: [
+        crud.get_user_timeseries(db, ids["users"][0], ids["now"] - timedelta(days=2), ids["now"], granularity)
+        for granularity in crud.ROLLUP_MODELS
+    ],
+    "get_conversion_latency": lambda db, ids: (crud.get_conversion_latency(db, ids["users"][0]),
+                                               crud.get_conversion_latency(db, ids["users"][0], _first_link(ids)[1])),
+    "get_dashboard_stats": lambda db, ids: (stats_cache.clear(), crud.get_dashboard_stats(db, ids["users"][0])),
+    "get_link_stats": lambda db, ids: (stats_cache.clear(),
+                                       crud.get_link_stats(db, _first_link(ids)[1], ids["users"][0])),
+}
+
+
+def _capture(engine, call):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+            # Plans don't depend on which row of an executemany is bound
+            if executemany and parameters and isinstance(parameters[0], (tuple, list, dict)):
+                parameters = parameters[0]
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    db = Session(bind=engine)
+    try:
+        call(db)
+    finally:
+        db.close()
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def _plan(engine, statement, parameters):
+    connection = engine.raw_connection()
+    try:
+        return [row[-1] for row in connection.cursor().execute("EXPLAIN QUERY PLAN " + statement, parameters)]
+    finally:
+        connection.close()
+
+
+def _full_scans(engine, statement, parameters):
+    return [line for line in _plan(engine, statement, parameters)
+            if line.startswith("SCAN ") and not ALLOWED_SCAN.match(line)]
+
+
+@pytest.mark.parametrize("name", sorted(CRUD_CALLS))
+def test_crud_queries_use_indexes(seeded, name):
+    engine, ids = seeded
+    statements = _capture(engine, lambda db: CRUD_CALLS[name](db, ids))
+    assert statements, f"crud.{name} ran no SQL"
+    for statement, parameters in statements:
+        scans = _full_scans(engine, statement, parameters)
+        assert not scans, f"crud.{name} scans a whole table: {scans}\n{statement}"
+
+
+def test_every_crud_query_is_covered():
+    # Public crud functions taking a session, i.e. the ones that query
+    functions = {
+        name for name, func in inspect.getmembers(crud, inspect.isfunction)
+        if func.__module__ == crud.__name__ and not name.startswith("_")
+        and next(iter(inspect.signature(func).parameters), None) == "db"
+    }
+    assert functions - CRUD_CALLS.keys() == set()
+
+
+def test_attribution_reads_clicks_by_link_and_time(seeded):
+    # The last-click lookup is the per-link time-range query the composite
+    # index exists for; it should need neither the table nor a sort
+    engine, ids = seeded
+    statements = _capture(engine, lambda db: attribute_revenue(db, now=ids["now"] + timedelta(days=1)))
+    click_reads = [
+        (statement, parameters) for statement, parameters in statements
+        if "FROM click_events" in statement and "click_events.timestamp >=" in statement
+    ]
+    assert click_reads
+    for statement, parameters in click_reads:
+        plan = _plan(engine, statement, parameters)
+        assert any("ix_click_events_link_id_timestamp" in line for line in plan), plan
+        assert not any("TEMP B-TREE" in line for line in plan), plan
+
+
+def test_migration_adds_event_indexes_in_place(tmp_path):
+    # An affiliate.db created before the composite indexes gets them from
+    # its next migrate run
+    engine = migrated_engine(tmp_path / "old.db")
+    names = ("ix_click_events_link_id_timestamp", "ix_revenue_events_link_id_timestamp")
+    with engine.begin() as connection:
+        for name in names:
+            connection.exec_driver_sql(f"DROP INDEX {name}")
+    run_migrations(engine)
+
+    inspector = inspect_schema(engine)
+    indexes = {index["name"]: index["column_names"] for table in ("click_events", "revenue_events")
+               for index in inspector.get_indexes(table)}
+    assert indexes["ix_click_events_link_id_timestamp"] == ["link_id", "timestamp"]
+    assert indexes["ix_revenue_events_link_id_timestamp"] == ["link_id", "timestamp"]
+    assert "ix_revenue_events_transaction_id" in indexes
+    engine.dispose()
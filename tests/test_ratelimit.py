@@ -0,0 +1,69 @@
+"""Token buckets and the limits built on them.
+
+    python -m pytest tests/test_ratelimit.py
+"""
+import pytest
+
+from app.ratelimit import RateLimiter, TokenBucketLimiter
+
+
+def test_burst_then_refill():
+    limiter = TokenBucketLimiter(rate=2, burst=5)
+    assert [limiter.acquire("a", now=100.0) for _ in range(5)] == [0.0] * 5
+    assert limiter.acquire("a", now=100.0) == pytest.approx(0.5)
+    # One token back every 1 / rate seconds
+    assert limiter.acquire("a", now=100.25) == pytest.approx(0.25)
+    assert limiter.acquire("a", now=100.5) == 0.0
+    assert limiter.acquire("a", now=100.5) > 0
+    # Never more than the burst, however long it sat idle
+    assert [limiter.acquire("a", now=1000.0) for _ in range(6)].count(0.0) == 5
+    assert (limiter.allowed, limiter.rejected) == (11, 4)
+
+
+def test_keys_have_separate_buckets():
+    limiter = TokenBucketLimiter(rate=1, burst=1)
+    assert limiter.acquire("a", now=0.0) == 0.0
+    assert limiter.acquire("a", now=0.0) > 0
+    assert limiter.acquire("b", now=0.0) == 0.0
+
+
+def test_sustained_rate():
+    limiter = TokenBucketLimiter(rate=10, burst=10)
+    # 100 requests a second for 10 seconds: the burst plus rate * seconds get through
+    allowed = sum(limiter.acquire("a", now=t / 100) == 0.0 for t in range(1000))
+    assert 10 + 100 - 1 <= allowed <= 10 + 100 + 1
+
+
+def test_idle_and_excess_buckets_are_dropped():
+    limiter = TokenBucketLimiter(rate=1, burst=10, max_keys=3)
+    for n, key in enumerate("abc"):
+        limiter.acquire(key, now=float(n))
+    # "a" is full again after burst / rate seconds, so it goes when "d" arrives
+    limiter.acquire("d", now=10.5)
+    assert limiter.stats()["keys"] == 3
+    assert limiter.evicted == 1
+    # Past max_keys the least recently seen goes even if it's not idle
+    limiter.acquire("e", now=10.6)
+    assert limiter.stats()["keys"] == 3
+
+
+def test_zero_rate_disables():
+    limiter = TokenBucketLimiter(rate=0, burst=0)
+    assert all(limiter.acquire("a", now=0.0) == 0.0 for _ in range(1000))
+
+
+def test_redirects_charge_link_bucket_only_within_ip_limit():
+    limiter = RateLimiter({"redirect_ip": (1, 2), "redirect_code": (1, 3), "write_ip": (0, 0), "read_ip": (0, 0)})
+    assert [limiter.allow_redirect("203.0.113.1", "abc") for _ in range(4)] == [True, True, False, False]
+    # The rejected hits above left the link's bucket alone
+    assert limiter.allow_redirect("203.0.113.2", "abc") is True
+    assert limiter.allow_redirect("203.0.113.3", "abc") is False
+
+
+def test_api_limits_by_method():
+    limiter = RateLimiter({"redirect_ip": (0, 0), "redirect_code": (0, 0), "write_ip": (1, 1), "read_ip": (0, 0)})
+    assert limiter.check_request("POST", "/links/", "203.0.113.1") == 0.0
+    assert limiter.check_request("DELETE", "/links/1", "203.0.113.1") > 0
+    assert limiter.check_request("GET", "/links/", "203.0.113.1") == 0.0
+    assert limiter.check_request("POST", "/health", "203.0.113.1") == 0.0
+    assert RateLimiter({"write_ip": (1, 1)}, enabled=False).check_request("POST", "/links/", "x") == 0.0
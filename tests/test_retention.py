@@ -0,0 +1,106 @@
+"""Archived clicks read back exactly as they were stored.
+
+    python -m pytest tests/test_retention.py
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import crud, models, retention
+from app.rollups import materialize_rollups
+from conftest import make_links
+
+START = datetime(2024, 1, 1)
+CUTOFF = datetime(2024, 4, 1)
+
+
+def seed_clicks(db, count, seed=1, owner=None):
+    # owner: (user id, link ids) to add to; new links otherwise
+    rng = random.Random(seed)
+    user_id, links = owner or make_links(db, 6)
+    crud.ingest_clicks(db, sorted((
+        (rng.choice(links), user_id, f"198.51.100.{rng.randrange(256)}",
+         rng.choice(["Mozilla/5.0 A", "Mozilla/5.0 B", None]), rng.choice(["https://news.example/", None]),
+         START + timedelta(seconds=rng.randrange(150 * 86400)))
+        for _ in range(count)
+    ), key=lambda click: click[5]))
+    return user_id, links
+
+
+def stored_rows(db, before=None):
+    query = crud.query_click_rows(db).order_by(models.ClickEvent.id)
+    if before is not None:
+        query = query.filter(models.ClickEvent.timestamp < before)
+    return [dict(zip(crud.CLICK_ROW_COLUMNS, (row[0], row[1], row[2].isoformat(), *row[3:]))) for row in query]
+
+
+def test_round_trip(db, tmp_path):
+    _, links = seed_clicks(db, 3000)
+    materialize_rollups(db)
+    old = stored_rows(db, before=CUTOFF)
+    # Ingested oldest first, so ids follow timestamps
+    recent = stored_rows(db)[len(old):]
+
+    result = retention.archive_clicks(db, CUTOFF, archive_dir=str(tmp_path), batch_size=400, vacuum_pages=0)
+    assert result["archived"] == len(old)
+    assert stored_rows(db) == recent
+
+    for link_id in links:
+        expected = [row for row in old if row["link_id"] == link_id]
+        assert list(retention.iter_archived_clicks(link_id, archive_dir=str(tmp_path))) == expected
+        start, end = datetime(2024, 2, 10), datetime(2024, 3, 5)
+        assert list(retention.iter_archived_clicks(link_id, start, end, archive_dir=str(tmp_path))) == [
+            row for row in expected if start.isoformat() <= row["timestamp"] < end.isoformat()
+        ]
+    assert retention.archive_stats(str(tmp_path))["months"] == ["2024-01", "2024-02", "2024-03"]
+
+
+def test_only_rolled_up_clicks_leave(db, tmp_path):
+    owner = seed_clicks(db, 500)
+    materialize_rollups(db)
+    high_water = crud.get_job_cursor(db, retention.CLICKS_CURSOR)
+    seed_clicks(db, 200, seed=2, owner=owner)  # not rolled up yet
+
+    retention.archive_clicks(db, CUTOFF, archive_dir=str(tmp_path), vacuum_pages=0)
+    assert all(row["id"] > high_water or row["timestamp"] >= CUTOFF.isoformat() for row in stored_rows(db))
+    assert any(row["id"] > high_water and row["timestamp"] < CUTOFF.isoformat() for row in stored_rows(db))
+
+
+def test_interrupted_run_is_finished_once(db, tmp_path, monkeypatch):
+    _, links = seed_clicks(db, 1000)
+    materialize_rollups(db)
+    old = stored_rows(db, before=CUTOFF)
+
+    # Segments written, then the process dies before deleting their rows
+    def crash(db, ids):
+        raise RuntimeError("killed")
+
+    monkeypatch.setattr(retention, "_delete_ids", crash)
+    with pytest.raises(RuntimeError):
+        retention.archive_clicks(db, CUTOFF, archive_dir=str(tmp_path), vacuum_pages=0)
+    monkeypatch.undo()
+    db.rollback()
+
+    retention.archive_clicks(db, CUTOFF, archive_dir=str(tmp_path), vacuum_pages=0)
+    assert stored_rows(db, before=CUTOFF) == []
+    archived = sorted((row for link_id in links
+                       for row in retention.iter_archived_clicks(link_id, archive_dir=str(tmp_path))),
+                      key=lambda row: row["id"])
+    assert archived == old
+
+
+def test_ids_are_not_reused_after_archiving_everything(db, tmp_path):
+    # A link that went quiet: every click is old and rolled up
+    user_id, links = make_links(db, 1)
+    crud.ingest_clicks(db, [(links[0], user_id, f"198.51.100.{n}", "Mozilla/5.0 A", None, START + timedelta(days=n))
+                            for n in range(5)])
+    materialize_rollups(db)
+    before = [row["id"] for row in stored_rows(db)]
+
+    retention.archive_clicks(db, CUTOFF, archive_dir=str(tmp_path), vacuum_pages=0)
+    assert [row["id"] for row in stored_rows(db)] == before[-1:]
+
+    crud.ingest_clicks(db, [(links[0], user_id, "203.0.113.9", "Mozilla/5.0 A", None, datetime(2024, 6, 1))])
+    assert stored_rows(db)[-1]["id"] > max(before)
+    assert materialize_rollups(db)["click_ids"] == 1
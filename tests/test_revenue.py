@@ -0,0 +1,56 @@
+"""Revenue postbacks: crud.track_revenue_events.
+
+    python -m pytest tests/test_revenue.py
+"""
+from sqlalchemy import func
+
+from app import crud, models, schemas
+from conftest import make_links
+
+
+def event(link_id, amount, transaction_id=None):
+    return schemas.RevenueEventCreate(link_id=link_id, amount=amount, transaction_id=transaction_id)
+
+
+def revenue(db, link_ids):
+    db.expire_all()
+    return {link_id: total for link_id, total in db.query(models.AffiliateLink.id, models.AffiliateLink.revenue)
+            .filter(models.AffiliateLink.id.in_(link_ids))}
+
+
+def stored(db):
+    return db.query(func.count(models.RevenueEvent.id)).scalar()
+
+
+def test_replayed_transactions_are_counted_once(db):
+    user_id, links = make_links(db, 2)
+    result = crud.track_revenue_events(db, [
+        event(links[0], 10.0, "t-1"), event(links[0], 10.0, "t-1"), event(links[1], 2.5, "t-2"),
+        event(links[1], 1.0), event(links[1], 1.0),
+    ], user_id)
+    assert result == {"received": 5, "accepted": 4, "duplicates": 1, "unknown_links": 0}
+
+    # A retried postback batch: the stored ids are skipped, the new one goes in
+    result = crud.track_revenue_events(db, [event(links[0], 10.0, "t-1"), event(links[1], 2.5, "t-2"),
+                                            event(links[0], 4.0, "t-3")], user_id)
+    assert result == {"received": 3, "accepted": 1, "duplicates": 2, "unknown_links": 0}
+    assert stored(db) == 5
+    assert revenue(db, links) == {links[0]: 14.0, links[1]: 4.5}
+
+
+def test_other_accounts_links_are_rejected(db):
+    user_id, links = make_links(db, 1)
+    rival_id, rival_links = make_links(db, 1, email="rival@test.example")
+    result = crud.track_revenue_events(db, [event(links[0], 3.0), event(rival_links[0], 50.0),
+                                            event(rival_links[0] + 100, 1.0)], user_id)
+    assert result == {"received": 3, "accepted": 1, "duplicates": 0, "unknown_links": 2}
+    assert revenue(db, links + rival_links) == {links[0]: 3.0, rival_links[0]: 0.0}
+
+
+def test_revenue_is_incremented_in_sql(db):
+    user_id, links = make_links(db, 1)
+    # A stale copy of the link in this session must not overwrite a concurrent total
+    assert db.get(models.AffiliateLink, links[0]).revenue == 0.0
+    db.execute(models.AffiliateLink.__table__.update().values(revenue=100.0))
+    crud.track_revenue_events(db, [event(links[0], 5.0), event(links[0], 0.25)], user_id)
+    assert revenue(db, links) == {links[0]: 105.25}